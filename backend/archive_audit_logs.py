@@ -0,0 +1,146 @@
+"""
+Audit log archival job.
+Moves audit log months older than the retention window out of MySQL into
+gzip'd NDJSON files (one per month), keeping the live table small enough
+for fast incident-review searches.
+
+Run monthly via cron inside the backend container:
+  docker exec storemybottle_backend_prod python archive_audit_logs.py
+Options:
+  --months N   keep N full months in the database (default AUDIT_LOG_RETENTION_MONTHS)
+  --dry-run    report what would be archived without writing or deleting
+
+Archived rows are deleted from MySQL, so in production AUDIT_LOG_ARCHIVE_DIR
+must be on a mounted volume (the app_data volume in docker-compose.prod.yml);
+the job refuses to run when it isn't. Each file is read back and checked
+against the month's row count before any row is deleted.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import argparse
+import gzip
+import json
+from datetime import datetime, timezone
+
+from sqlalchemy import func, select
+
+from database import SessionLocal
+from models import AuditLog
+from config import settings
+
+DELETE_BATCH_SIZE = 1000
+FIELDS = ("id", "user_id", "user_name", "action", "entity_type", "entity_id",
+          "details", "ip_address", "user_agent", "created_at")
+
+
+def month_start(dt: datetime) -> datetime:
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(dt: datetime, months: int) -> datetime:
+    month_index = dt.year * 12 + (dt.month - 1) + months
+    return dt.replace(year=month_index // 12, month=month_index % 12 + 1)
+
+
+def archive_path(start: datetime) -> str:
+    """Target file for a month; a later run for the same month gets its own file."""
+    base = os.path.join(settings.AUDIT_LOG_ARCHIVE_DIR, f"audit_logs-{start:%Y-%m}")
+    path = f"{base}.ndjson.gz"
+    if os.path.exists(path):
+        path = f"{base}.{datetime.now(timezone.utc):%Y%m%dT%H%M%S}.ndjson.gz"
+    return path
+
+
+def on_mounted_volume(path: str) -> bool:
+    """Whether path lives on a mount other than the (ephemeral, in a container) root filesystem"""
+    path = os.path.realpath(path)
+    while not os.path.ismount(path):
+        path = os.path.dirname(path)
+    return path != os.path.sep
+
+
+def verify_archive(path: str, expected: int):
+    """Read the archive back; raise if it doesn't hold `expected` complete entries"""
+    entries = 0
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if "id" not in json.loads(line):
+                raise RuntimeError(f"{path}: entry {entries + 1} has no id")
+            entries += 1
+    if entries != expected:
+        raise RuntimeError(f"{path}: {entries} entries written, {expected} expected")
+
+
+def archive_month(db, start: datetime, end: datetime, dry_run: bool) -> int:
+    in_month = (AuditLog.created_at >= start) & (AuditLog.created_at < end)
+    count = db.query(func.count(AuditLog.id)).filter(in_month).scalar()
+    if not count or dry_run:
+        return count
+
+    path = archive_path(start)
+    tmp_path = f"{path}.tmp"
+
+    # Stream the month to disk first; rows are only deleted once the file is complete
+    stmt = select(*[getattr(AuditLog, f) for f in FIELDS]).where(in_month).order_by(AuditLog.created_at, AuditLog.id)
+    written = 0
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        result = db.execute(stmt.execution_options(yield_per=DELETE_BATCH_SIZE))
+        for partition in result.partitions():
+            for row in partition:
+                record = dict(zip(FIELDS, row))
+                if record["created_at"] is not None:
+                    record["created_at"] = record["created_at"].isoformat()
+                f.write(json.dumps(record) + "\n")
+                written += 1
+    # Nothing is deleted unless the file reads back with every row in it
+    verify_archive(tmp_path, count)
+    os.replace(tmp_path, path)
+
+    # Delete in bounded batches so we never hold long locks on the live table
+    while True:
+        ids = [r[0] for r in db.query(AuditLog.id).filter(in_month).limit(DELETE_BATCH_SIZE).all()]
+        if not ids:
+            break
+        db.query(AuditLog).filter(AuditLog.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+
+    print(f"  📦 {start:%Y-%m}: {written} entries -> {path}")
+    return written
+
+
+def run(months: int, dry_run: bool = False):
+    os.makedirs(settings.AUDIT_LOG_ARCHIVE_DIR, exist_ok=True)
+    if not dry_run and settings.ENVIRONMENT == "production" and not on_mounted_volume(settings.AUDIT_LOG_ARCHIVE_DIR):
+        print(f"❌ {os.path.abspath(settings.AUDIT_LOG_ARCHIVE_DIR)} is not on a mounted volume; "
+              f"archiving would lose entries on the next redeploy. Set AUDIT_LOG_ARCHIVE_DIR to a volume path.")
+        sys.exit(1)
+    db = SessionLocal()
+    try:
+        # Keep the current month plus `months` full months before it
+        cutoff = add_months(month_start(datetime.now(timezone.utc).replace(tzinfo=None)), -months)
+        oldest = db.query(func.min(AuditLog.created_at)).scalar()
+        if oldest is None or oldest >= cutoff:
+            print(f"✅ Nothing to archive (cutoff {cutoff:%Y-%m-%d})")
+            return
+
+        total = 0
+        start = month_start(oldest.replace(tzinfo=None))
+        while start < cutoff:
+            end = add_months(start, 1)
+            total += archive_month(db, start, end, dry_run)
+            start = end
+
+        verb = "Would archive" if dry_run else "Archived"
+        print(f"✅ {verb} {total} audit entries older than {cutoff:%Y-%m-%d}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive old audit log months to gzip'd NDJSON")
+    parser.add_argument("--months", type=int, default=settings.AUDIT_LOG_RETENTION_MONTHS)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    run(args.months, args.dry_run)
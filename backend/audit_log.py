@@ -0,0 +1,222 @@
+"""
+Batched audit-log writer.
+
+Admin requests enqueue entries into an in-process buffer; a background thread
+writes them with multi-row INSERTs whenever the buffer reaches
+AUDIT_LOG_BATCH_SIZE or AUDIT_LOG_FLUSH_INTERVAL_SECONDS elapses. If the
+database is unavailable, the batch is appended to a per-process NDJSON
+fallback file and replayed at startup and on the next successful flush
+(including files left by workers that have since exited, and replays they
+didn't finish). In production AUDIT_LOG_FALLBACK_PATH is on the app_data
+volume, so the files survive a redeploy. The app's shutdown hook calls stop()
+so buffered entries are not lost on deploys.
+"""
+import glob
+import json
+import os
+import threading
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import insert
+
+from config import settings
+from database import SessionLocal
+from models import AuditLog
+
+
+class AuditLogWriter:
+    """Buffers audit entries and flushes them in batches from a daemon thread"""
+
+    def __init__(self, batch_size: int, flush_interval: float, fallback_path: str):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fallback_path = fallback_path
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    def enqueue(self, entry: dict):
+        self._ensure_started()
+        with self._lock:
+            self._buffer.append(entry)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def _ensure_started(self):
+        # Started lazily so scripts importing this module don't spawn threads
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._stopping = False
+                    self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Write everything currently buffered. Safe to call from any thread."""
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    if not self._buffer:
+                        return
+                    batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+                if not self._write(batch):
+                    self._write_fallback(batch)
+                    return
+                self._replay_fallbacks()
+
+    def replay_pending(self):
+        """Replay fallback files left by earlier processes (startup hook)."""
+        with self._flush_lock:
+            self._replay_fallbacks()
+
+    def stop(self):
+        """Stop the background thread and flush what's left (shutdown hook)."""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def _write(self, rows) -> bool:
+        db = SessionLocal()
+        try:
+            db.execute(insert(AuditLog), rows)
+            db.commit()
+            return True
+        except Exception as e:
+            db.rollback()
+            print(f"⚠️  Audit log flush failed ({len(rows)} entries): {e}")
+            return False
+        finally:
+            db.close()
+
+    def _own_fallback_path(self) -> str:
+        # One file per process so workers never append to a file another is replaying
+        return f"{self.fallback_path}.{os.getpid()}"
+
+    def _write_fallback(self, rows):
+        path = self._own_fallback_path()
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            print(f"📝 {len(rows)} audit entries saved to {path}")
+        except Exception as e:
+            print(f"❌ Audit log fallback write failed, {len(rows)} entries lost: {e}")
+
+    def _replay_fallbacks(self):
+        """
+        Replay our own fallback file and any left behind by exited processes,
+        including <path>.<pid>.<n>.replay files from replays that crashed midway.
+        Runs under _flush_lock, so none of this process's files is mid-replay.
+        """
+        prefix = f"{self.fallback_path}."
+        for path in glob.glob(f"{prefix}*"):
+            parts = path[len(prefix):].split(".")
+            if not parts[0].isdigit() or (len(parts) > 1 and parts[-1] != "replay"):
+                continue
+            pid = int(parts[0])
+            if pid == os.getpid() or not _process_alive(pid):
+                self._replay_file(path)
+
+    def _replay_file(self, path: str):
+        # Move the file aside first so a failed replay can re-queue into a fresh file;
+        # the rename also claims it, so two workers never replay the same file
+        replay_path = f"{self._own_fallback_path()}.{uuid.uuid4().hex[:8]}.replay"
+        try:
+            os.replace(path, replay_path)
+            with open(replay_path, encoding="utf-8") as f:
+                rows = [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return  # Another worker got to it first
+        except Exception as e:
+            print(f"⚠️  Could not read audit log fallback file {path}: {e}")
+            return
+
+        for row in rows:
+            if row.get("created_at"):
+                row["created_at"] = datetime.fromisoformat(row["created_at"])
+
+        written = 0
+        for i in range(0, len(rows), self.batch_size):
+            # A crashed replay may have written part of the file already
+            batch = self._unwritten(rows[i:i + self.batch_size])
+            if batch is None or (batch and not self._write(batch)):
+                self._write_fallback(rows[i:])
+                break
+            written = min(i + self.batch_size, len(rows))
+        os.remove(replay_path)
+        print(f"✅ Replayed {written}/{len(rows)} audit entries from {path}")
+
+
+    def _unwritten(self, rows) -> Optional[list]:
+        """rows minus those whose id is already in the table (None if the check failed)"""
+        ids = [row["id"] for row in rows if row.get("id")]
+        db = SessionLocal()
+        try:
+            existing = {r[0] for r in db.query(AuditLog.id).filter(AuditLog.id.in_(ids))} if ids else set()
+        except Exception as e:
+            print(f"⚠️  Audit log replay check failed: {e}")
+            return None
+        finally:
+            db.close()
+        return [row for row in rows if row.get("id") not in existing]
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+audit_log_writer = AuditLogWriter(
+    batch_size=settings.AUDIT_LOG_BATCH_SIZE,
+    flush_interval=settings.AUDIT_LOG_FLUSH_INTERVAL_SECONDS,
+    fallback_path=settings.AUDIT_LOG_FALLBACK_PATH,
+)
+
+
+def enqueue_audit_log(
+    user_id: Optional[str],
+    user_name: Optional[str],
+    action: str,
+    entity_type: str,
+    entity_id: Optional[str] = None,
+    details: Optional[str] = None,
+    ip_address: Optional[str] = None,
+    user_agent: Optional[str] = None
+) -> dict:
+    """Queue an audit entry; it is timestamped now, not when the batch is written."""
+    entry = {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "user_name": user_name,
+        "action": action,
+        "entity_type": entity_type,
+        "entity_id": entity_id,
+        "details": details,
+        "ip_address": ip_address,
+        "user_agent": user_agent,
+        "created_at": datetime.now(timezone.utc),
+    }
+    audit_log_writer.enqueue(entry)
+    return entry
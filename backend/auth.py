@@ -5,9 +5,6 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 import bcrypt
 from sqlalchemy.orm import Session
-from google.oauth2 import id_token
-from google.auth.transport import requests as google_requests
-from twilio.rest import Client as TwilioClient
 
 from config import settings
 from database import get_db
@@ -112,14 +109,22 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 
 def create_refresh_token(data: dict):
     """Create a refresh token with longer expiration (7 days)"""
+    import secrets
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(days=7)
-    to_encode.update({"exp": expire, "type": "refresh"})
+    # jti keeps tokens unique even when issued for the same user in the same second
+    to_encode.update({"exp": expire, "type": "refresh", "jti": secrets.token_urlsafe(16)})
     encoded_jwt = jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
     return encoded_jwt
 
 
-def create_session(db: Session, user_id: str, access_token: str, refresh_token: str, 
+def hash_refresh_token(refresh_token: str) -> str:
+    """Sessions store only this digest, never the token itself"""
+    import hashlib
+    return hashlib.sha256(refresh_token.encode("utf-8")).hexdigest()
+
+
+def create_session(db: Session, user_id: str, refresh_token: str,
                    device_info: str = None, ip_address: str = None, user_agent: str = None):
     """Create a new user session"""
     from models import UserSession
@@ -130,8 +135,7 @@ def create_session(db: Session, user_id: str, access_token: str, refresh_token:
     # Create session
     session = UserSession(
         user_id=user_id,
-        refresh_token=refresh_token,
-        access_token=access_token,
+        refresh_token_hash=hash_refresh_token(refresh_token),
         device_info=device_info,
         ip_address=ip_address,
         user_agent=user_agent,
@@ -140,50 +144,67 @@ def create_session(db: Session, user_id: str, access_token: str, refresh_token:
     
     db.add(session)
     db.commit()
-    db.refresh(session)
     return session
 
 
-def get_session_by_refresh_token(db: Session, refresh_token: str):
-    """Get active session by refresh token"""
-    from models import UserSession
-    
-    session = db.query(UserSession).filter(
-        UserSession.refresh_token == refresh_token,
-        UserSession.is_active == True,
-        UserSession.expires_at > datetime.utcnow()
-    ).first()
-    
-    return session
+def decode_refresh_token(refresh_token: str) -> Optional[str]:
+    """User id from a well-formed, unexpired refresh token (None otherwise); says nothing about the session"""
+    try:
+        payload = jwt.decode(refresh_token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("type") != "refresh":
+        return None
+    return payload.get("sub") or None
+
+
+def rotate_refresh_token(db: Session, refresh_token: str, user: User) -> Optional[str]:
+    """
+    Swap a refresh token for a new one in a single conditional UPDATE.
 
+    The UPDATE only matches an active, unexpired session of `user` holding the
+    presented token, so a token can be rotated at most once even under
+    concurrent requests. The new token carries the user's current role, not
+    the one in the old token. The caller commits.
 
-def update_session_tokens(db: Session, session_id: str, new_access_token: str, new_refresh_token: str):
-    """Update session with new tokens"""
+    Returns:
+        str: the new refresh token, or None if the session is not valid
+    """
+    from sqlalchemy import update
     from models import UserSession
     
-    session = db.query(UserSession).filter(UserSession.id == session_id).first()
-    if session:
-        session.access_token = new_access_token
-        session.refresh_token = new_refresh_token
-        session.last_activity = datetime.utcnow()
-        session.expires_at = datetime.utcnow() + timedelta(days=7)
-        db.commit()
-        db.refresh(session)
-    return session
+    user_id = user.id
+    role_str = user.role.value if hasattr(user.role, 'value') else str(user.role)
+    new_refresh_token = create_refresh_token(data={"sub": user_id, "role": role_str})
+    now = datetime.utcnow()
+    rotated = db.execute(
+        update(UserSession)
+        .where(
+            UserSession.refresh_token_hash == hash_refresh_token(refresh_token),
+            UserSession.user_id == user_id,
+            UserSession.is_active == True,
+            UserSession.expires_at > now
+        )
+        .values(
+            refresh_token_hash=hash_refresh_token(new_refresh_token),
+            last_activity=now,
+            expires_at=now + timedelta(days=7)
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not rotated:
+        return None
+    return new_refresh_token
 
 
 def invalidate_session(db: Session, refresh_token: str):
     """Invalidate a session (logout)"""
     from models import UserSession
     
-    session = db.query(UserSession).filter(
-        UserSession.refresh_token == refresh_token
-    ).first()
-    
-    if session:
-        session.is_active = False
-        db.commit()
-    return session
+    db.query(UserSession).filter(
+        UserSession.refresh_token_hash == hash_refresh_token(refresh_token)
+    ).update({"is_active": False}, synchronize_session=False)
+    db.commit()
 
 
 def invalidate_all_user_sessions(db: Session, user_id: str):
@@ -197,14 +218,44 @@ def invalidate_all_user_sessions(db: Session, user_id: str):
     db.commit()
 
 
+# Venue names rarely change and are looked up on every login/refresh
+VENUE_NAME_TTL_SECONDS = 300
+_venue_names = {}
+
+
+def get_venue_name(db: Session, venue_id: Optional[str]) -> Optional[str]:
+    """Venue name for a staff user's venue, cached per worker"""
+    import time
+    from models import Venue
+    
+    if not venue_id:
+        return None
+    cached = _venue_names.get(venue_id)
+    if cached and time.monotonic() - cached[1] < VENUE_NAME_TTL_SECONDS:
+        return cached[0]
+    name = db.query(Venue.name).filter(Venue.id == venue_id).scalar()
+    _venue_names[venue_id] = (name, time.monotonic())
+    return name
+
+
+def invalidate_venue_name(venue_id: str):
+    _venue_names.pop(venue_id, None)
+
+
 def cleanup_expired_sessions(db: Session):
-    """Clean up expired sessions (run periodically)"""
+    """Delete expired and logged-out sessions (auth_maintenance.py runs this on a schedule)"""
+    import time
     from models import UserSession
-    
-    db.query(UserSession).filter(
-        UserSession.expires_at < datetime.utcnow()
-    ).update({"is_active": False})
-    db.commit()
+    from auth_maintenance import delete_in_batches
+    
+    cutoff = datetime.utcnow() - timedelta(hours=settings.AUTH_CLEANUP_GRACE_HOURS)
+    return delete_in_batches(
+        db, UserSession,
+        (UserSession.expires_at < cutoff)
+        | ((UserSession.is_active == False) & (UserSession.last_activity < cutoff)),
+        batch_size=settings.AUTH_CLEANUP_BATCH_SIZE,
+        deadline=time.monotonic() + settings.AUTH_CLEANUP_TIME_BUDGET_SECONDS
+    )
 
 async def get_current_user(
     token: Optional[str] = Depends(oauth2_scheme),
@@ -285,6 +336,9 @@ def get_password_hash(password: str) -> str:
 # ============ Google Auth ============
 
 def verify_google_token(token: str) -> Optional[dict]:
+    # Imported on first use: google-auth is slow to import and most workers never need it
+    from google.oauth2 import id_token
+    from google.auth.transport import requests as google_requests
     try:
         idinfo = id_token.verify_oauth2_token(
             token, 
@@ -351,6 +405,7 @@ def send_otp_sms(phone: str, code: str) -> bool:
         return False
         
     try:
+        from twilio.rest import Client as TwilioClient  # Imported on first use
         client = TwilioClient(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
         # client.messages.create(...)
         # Stub implementation for now
@@ -645,8 +700,6 @@ async def verify_qr_token_access(
     
     # Check expiration
     if redemption.qr_expires_at < datetime.utcnow():
-        redemption.status = RedemptionStatus.EXPIRED
-        db.commit()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="QR code has expired"
@@ -0,0 +1,98 @@
+"""
+Auth table maintenance.
+Deletes expired OTPs, expired/used password reset tokens, expired or
+logged-out sessions and expired idempotency keys so the tables behind login,
+OTP verification, token refresh and purchase retries stay small. Rows are removed in bounded batches (each its own short
+transaction) and the run stops once its time budget is spent; whatever is
+left is picked up next time.
+
+Run hourly via cron inside the backend container:
+  docker exec storemybottle_backend_prod python auth_maintenance.py
+Options:
+  --batch-size N     rows deleted per transaction (default AUTH_CLEANUP_BATCH_SIZE)
+  --time-budget S    stop starting new batches after S seconds (default AUTH_CLEANUP_TIME_BUDGET_SECONDS)
+
+Setting AUTH_CLEANUP_INTERVAL_MINUTES > 0 also runs it from a background thread
+in each API worker, for deployments without cron.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import argparse
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from database import SessionLocal
+from models import OTP, IdempotencyKey, PasswordResetToken, UserSession
+from config import settings
+from scheduler import PeriodicJob
+
+
+def _cleanup_targets(now: datetime):
+    """(table, model, condition) for every table we prune"""
+    # Rows stay around for a grace period after they stop being usable
+    cutoff = now - timedelta(hours=settings.AUTH_CLEANUP_GRACE_HOURS)
+    return [
+        ("otps", OTP, OTP.expires_at < cutoff),
+        ("password_reset_tokens", PasswordResetToken, PasswordResetToken.expires_at < cutoff),
+        ("user_sessions", UserSession,
+         (UserSession.expires_at < cutoff)
+         | ((UserSession.is_active == False) & (UserSession.last_activity < cutoff))),
+        ("idempotency_keys", IdempotencyKey, IdempotencyKey.expires_at < cutoff),
+    ]
+
+
+def delete_in_batches(db, model, condition, batch_size: int, deadline: float) -> int:
+    """Delete matching rows batch by batch until none are left or the deadline passes."""
+    deleted = 0
+    while time.monotonic() < deadline:
+        ids = [r[0] for r in db.query(model.id).filter(condition).limit(batch_size).all()]
+        if not ids:
+            break
+        deleted += db.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        if len(ids) < batch_size:
+            break
+    return deleted
+
+
+def run(batch_size: Optional[int] = None, time_budget: Optional[float] = None) -> Dict[str, int]:
+    """
+    Prune every auth table once.
+
+    Returns:
+        dict: rows deleted per table
+    """
+    batch_size = batch_size or settings.AUTH_CLEANUP_BATCH_SIZE
+    time_budget = time_budget or settings.AUTH_CLEANUP_TIME_BUDGET_SECONDS
+    deadline = time.monotonic() + time_budget
+    counts = {}
+    db = SessionLocal()
+    try:
+        for table, model, condition in _cleanup_targets(datetime.utcnow()):
+            counts[table] = delete_in_batches(db, model, condition, batch_size, deadline)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    summary = ", ".join(f"{table}={count}" for table, count in counts.items())
+    if time.monotonic() >= deadline:
+        print(f"⏱️  Auth cleanup stopped at its {time_budget:g}s budget: {summary}")
+    else:
+        print(f"✅ Auth cleanup done: {summary}")
+    return counts
+
+
+auth_cleanup_scheduler = PeriodicJob("auth-cleanup", settings.AUTH_CLEANUP_INTERVAL_MINUTES, run)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete expired OTPs, reset tokens, sessions and idempotency keys")
+    parser.add_argument("--batch-size", type=int, default=settings.AUTH_CLEANUP_BATCH_SIZE)
+    parser.add_argument("--time-budget", type=float, default=settings.AUTH_CLEANUP_TIME_BUDGET_SECONDS)
+    args = parser.parse_args()
+    run(args.batch_size, args.time_budget)
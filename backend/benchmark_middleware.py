@@ -0,0 +1,94 @@
+"""
+Microbenchmark for the security headers middleware.
+
+Compares the previous BaseHTTPMiddleware implementation with the pure ASGI
+SecurityHeadersMiddleware by driving a trivial app directly through ASGI
+(no sockets), so the numbers are the per-request middleware overhead.
+
+Usage: python benchmark_middleware.py [requests]
+"""
+import asyncio
+import sys
+import time
+
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from middleware import CSP_DIRECTIVES, PERMISSIONS_POLICY, SecurityHeadersMiddleware
+
+
+class LegacySecurityHeadersMiddleware(BaseHTTPMiddleware):
+    """The previous implementation, kept here only for comparison."""
+
+    async def dispatch(self, request, call_next):
+        if request.url.path in ["/docs", "/redoc", "/openapi.json"]:
+            return await call_next(request)
+        response = await call_next(request)
+        response.headers["Strict-Transport-Security"] = "max-age=3600"
+        response.headers["X-Content-Type-Options"] = "nosniff"
+        response.headers["X-Frame-Options"] = "DENY"
+        response.headers["X-XSS-Protection"] = "1; mode=block"
+        response.headers["Content-Security-Policy"] = "; ".join(list(CSP_DIRECTIVES))
+        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
+        response.headers["Permissions-Policy"] = ", ".join(list(PERMISSIONS_POLICY))
+        return response
+
+
+async def ping(request):
+    return JSONResponse({"status": "ok"})
+
+
+def build_app(middleware_class=None):
+    app = Starlette(routes=[Route("/ping", ping)])
+    if middleware_class is not None:
+        app.add_middleware(middleware_class)
+    return app
+
+
+async def run(app, requests: int) -> float:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": "/ping", "raw_path": b"/ping",
+        "root_path": "", "query_string": b"", "headers": [(b"host", b"localhost")],
+        "client": ("127.0.0.1", 1234), "server": ("localhost", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    # Warm up (builds the middleware stack on first call)
+    for _ in range(200):
+        await app(dict(scope), receive, send)
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return time.perf_counter() - start
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    results = {}
+    for label, middleware_class in [
+        ("no middleware", None),
+        ("BaseHTTPMiddleware", LegacySecurityHeadersMiddleware),
+        ("pure ASGI", SecurityHeadersMiddleware),
+    ]:
+        elapsed = asyncio.run(run(build_app(middleware_class), requests))
+        results[label] = elapsed / requests * 1_000_000
+
+    baseline = results["no middleware"]
+    print(f"{requests} requests per variant")
+    for label, per_request in results.items():
+        overhead = per_request - baseline
+        print(f"  {label:<20} {per_request:8.1f} us/request  (+{overhead:.1f} us middleware)")
+
+
+if __name__ == "__main__":
+    main()
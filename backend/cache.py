@@ -0,0 +1,344 @@
+"""
+Two-tier cache shared by the API workers.
+
+L1 is a small in-process LRU; L2 is Redis (REDIS_URL, optional - without it the
+cache is per-worker only). Entries are JSON envelopes holding the value and
+the time it stops being fresh; after that they are served stale for up to
+CACHE_STALE_TTL_SECONDS while one worker recomputes in the background.
+
+Recomputation is single-flight: within a worker a per-key lock, across
+workers a Redis SET NX lock. A worker that loses the race waits for the
+winner's result in L2 instead of running the same expensive query.
+
+invalidate() deletes the L2 keys and publishes the prefix on a Redis channel
+so every worker drops matching L1 entries.
+
+The Redis client is injected, so tests can pass a fakeredis instance:
+    Cache(redis_client=fakeredis.FakeRedis())
+"""
+import functools
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
+
+from config import settings
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+KEY_PREFIX = "smb:cache:"
+LOCK_PREFIX = "smb:lock:"
+
+class Cache:
+    """L1 (in-process) + L2 (Redis) cache with single-flight recomputation"""
+
+    def __init__(
+        self,
+        redis_client=None,
+        default_ttl: float = 60,
+        stale_ttl: float = 300,
+        lock_timeout: float = 30,
+        l1_max_entries: int = 1000
+    ):
+        self.redis = redis_client
+        self.default_ttl = default_ttl
+        self.stale_ttl = stale_ttl
+        self.lock_timeout = lock_timeout
+        self.l1_max_entries = l1_max_entries
+        self._l1: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (value, fresh_until, stale_until)
+        self._l1_lock = threading.Lock()
+        self._key_locks = {}  # key -> [lock, threads holding or waiting for it]
+        self._key_locks_lock = threading.Lock()
+        self._refreshing = set()
+        self._subscriber: Optional[threading.Thread] = None
+
+    # ─── Public API ─────────────────────────────────────────────────────────
+
+    def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Any],
+        ttl: Optional[float] = None,
+        stale_ttl: Optional[float] = None,
+        background_compute: Optional[Callable[[], Any]] = None
+    ) -> Any:
+        """
+        Return the cached value for key, computing it if needed.
+
+        `compute` runs in the caller's thread on a miss. `background_compute`
+        (default: compute) refreshes stale entries from a worker thread, so it
+        must not depend on request-scoped state such as the request's session.
+        Values must be JSON-serializable; what comes back is the JSON
+        round-tripped value (e.g. Decimals as strings), hit or miss.
+        """
+        ttl = self.default_ttl if ttl is None else ttl
+        stale_ttl = self.stale_ttl if stale_ttl is None else stale_ttl
+        self._ensure_subscriber()
+
+        entry = self._lookup(key)
+        now = time.time()
+        if entry and now < entry[1]:
+            return entry[0]
+        if entry and now < entry[2]:
+            self._refresh_in_background(key, background_compute or compute, ttl, stale_ttl)
+            return entry[0]
+        return self._compute_single_flight(key, compute, ttl, stale_ttl)
+
+    def invalidate(self, prefix: str):
+        """Drop every entry whose key starts with prefix, in all workers."""
+        self._drop_l1(prefix)
+        if self.redis is None:
+            return
+        try:
+            keys = list(self.redis.scan_iter(match=f"{KEY_PREFIX}{prefix}*", count=500))
+            if keys:
+                self.redis.delete(*keys)
+            self.redis.publish(INVALIDATION_CHANNEL, prefix)
+        except Exception as e:
+            print(f"⚠️  Cache invalidation of '{prefix}' failed: {e}")
+
+    # ─── Tiers ──────────────────────────────────────────────────────────────
+
+    def _lookup(self, key: str):
+        with self._l1_lock:
+            entry = self._l1.get(key)
+            if entry:
+                self._l1.move_to_end(key)
+        if entry and time.time() < entry[1]:
+            return entry
+        # L1 missing or stale: L2 may have something fresher from another worker
+        remote = self._l2_get(key)
+        if remote:
+            self._l1_set(key, remote)
+            return remote
+        return entry
+
+    def _store(self, key: str, value: Any, ttl: float, stale_ttl: float) -> Any:
+        """Store in both tiers; returns the value as every later reader will see it (JSON round-tripped)."""
+        now = time.time()
+        payload = json.dumps({"v": value, "f": now + ttl, "s": now + ttl + stale_ttl}, default=str)
+        data = json.loads(payload)
+        self._l1_set(key, (data["v"], data["f"], data["s"]))
+        if self.redis is not None:
+            try:
+                self.redis.set(KEY_PREFIX + key, payload, px=int((ttl + stale_ttl) * 1000))
+            except Exception as e:
+                print(f"⚠️  Cache write of '{key}' to Redis failed: {e}")
+        return data["v"]
+
+    def _l1_set(self, key: str, entry: tuple):
+        with self._l1_lock:
+            self._l1[key] = entry
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _drop_l1(self, prefix: str):
+        with self._l1_lock:
+            for key in [k for k in self._l1 if k.startswith(prefix)]:
+                del self._l1[key]
+
+    def _l2_get(self, key: str):
+        if self.redis is None:
+            return None
+        try:
+            raw = self.redis.get(KEY_PREFIX + key)
+        except Exception as e:
+            print(f"⚠️  Cache read of '{key}' from Redis failed: {e}")
+            return None
+        if raw is None:
+            return None
+        try:
+            data = json.loads(raw)
+            return data["v"], data["f"], data["s"]
+        except (ValueError, TypeError, KeyError) as e:
+            # Corrupt or foreign value: a miss, overwritten by the next store
+            print(f"⚠️  Ignoring unreadable cache entry '{key}' in Redis: {e!r}")
+            return None
+
+    # ─── Single-flight ──────────────────────────────────────────────────────
+
+    @contextmanager
+    def _key_lock(self, key: str):
+        """Hold the per-key lock; it is dropped once no thread holds or waits for it"""
+        with self._key_locks_lock:
+            entry = self._key_locks.get(key)
+            if entry is None:
+                entry = self._key_locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._key_locks_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+
+    def _compute_single_flight(self, key: str, compute, ttl: float, stale_ttl: float):
+        with self._key_lock(key):
+            # Another thread in this worker may have filled it while we waited
+            entry = self._lookup(key)
+            if entry and time.time() < entry[1]:
+                return entry[0]
+
+            token = self._acquire_remote_lock(key)
+            if token is None:
+                # Another worker is computing: wait for its result
+                entry = self._wait_for_remote(key)
+                if entry:
+                    return entry[0]
+            try:
+                return self._store(key, compute(), ttl, stale_ttl)
+            finally:
+                self._release_remote_lock(key, token)
+
+    def _refresh_in_background(self, key: str, compute, ttl: float, stale_ttl: float):
+        with self._key_locks_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            token = self._acquire_remote_lock(key)
+            try:
+                if token is None:
+                    return  # Another worker is already refreshing it
+                self._store(key, compute(), ttl, stale_ttl)
+            except Exception as e:
+                print(f"⚠️  Background refresh of '{key}' failed: {e}")
+            finally:
+                self._release_remote_lock(key, token)
+                with self._key_locks_lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name="cache-refresh", daemon=True).start()
+
+    def _acquire_remote_lock(self, key: str) -> Optional[str]:
+        """Lock token, "" when there is no Redis (local locking only), None if another worker holds it."""
+        if self.redis is None:
+            return ""
+        token = uuid.uuid4().hex
+        try:
+            if self.redis.set(LOCK_PREFIX + key, token, nx=True, px=int(self.lock_timeout * 1000)):
+                return token
+            return None
+        except Exception as e:
+            print(f"⚠️  Cache lock on '{key}' failed, computing without it: {e}")
+            return ""
+
+    def _release_remote_lock(self, key: str, token: Optional[str]):
+        if not token or self.redis is None:
+            return
+        lock_key = LOCK_PREFIX + key
+        try:
+            # Delete the lock only if we still own it (it may have timed out and been re-taken)
+            with self.redis.pipeline() as pipe:
+                pipe.watch(lock_key)
+                if pipe.get(lock_key) in (token, token.encode()):
+                    pipe.multi()
+                    pipe.delete(lock_key)
+                    pipe.execute()
+                else:
+                    pipe.unwatch()
+        except Exception as e:
+            print(f"⚠️  Cache lock release on '{key}' failed: {e}")
+
+    def _wait_for_remote(self, key: str):
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = self._l2_get(key)
+            if entry and time.time() < entry[1]:
+                self._l1_set(key, entry)
+                return entry
+            try:
+                if not self.redis.exists(LOCK_PREFIX + key):
+                    return None  # Winner gave up without storing a value
+            except Exception:
+                return None
+        return None
+
+    # ─── Invalidation fan-out ───────────────────────────────────────────────
+
+    def _ensure_subscriber(self):
+        if self.redis is None or (self._subscriber and self._subscriber.is_alive()):
+            return
+        with self._key_locks_lock:
+            if self._subscriber and self._subscriber.is_alive():
+                return
+            self._subscriber = threading.Thread(target=self._listen, name="cache-invalidation", daemon=True)
+            self._subscriber.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                for message in pubsub.listen():
+                    prefix = message.get("data")
+                    if isinstance(prefix, bytes):
+                        prefix = prefix.decode()
+                    if isinstance(prefix, str):
+                        self._drop_l1(prefix)
+            except Exception as e:
+                print(f"⚠️  Cache invalidation listener error, reconnecting: {e}")
+                time.sleep(5)
+
+
+def _redis_client():
+    if not settings.REDIS_URL:
+        return None
+    try:
+        import redis  # Only imported when a Redis URL is configured
+    except ImportError:
+        print("⚠️  REDIS_URL is set but the redis package is not installed; using per-worker cache only")
+        return None
+    return redis.Redis.from_url(settings.REDIS_URL, socket_timeout=2, socket_connect_timeout=2)
+
+
+cache = Cache(
+    redis_client=_redis_client(),
+    default_ttl=settings.CACHE_DEFAULT_TTL_SECONDS,
+    stale_ttl=settings.CACHE_STALE_TTL_SECONDS,
+    lock_timeout=settings.CACHE_LOCK_TIMEOUT_SECONDS,
+)
+
+
+REQUEST_SCOPED_PARAMS = ("db", "request", "response", "current_user")
+
+
+def cached_endpoint(namespace: str, ttl: Optional[float] = None, stale_ttl: Optional[float] = None):
+    """
+    Cache a sync endpoint's response per query-parameter combination.
+
+    The response is stored JSON-encoded and re-validated by the route's
+    response_model. Background refreshes run with their own DB session.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            from fastapi.encoders import jsonable_encoder
+            from database import SessionLocal
+
+            params = {k: v for k, v in kwargs.items() if k not in REQUEST_SCOPED_PARAMS}
+            key = f"{namespace}:{json.dumps(params, sort_keys=True, default=str)}"
+
+            def background_compute():
+                db = SessionLocal()
+                try:
+                    return jsonable_encoder(func(*args, **{**kwargs, "db": db}))
+                finally:
+                    db.close()
+
+            return cache.get_or_compute(
+                key,
+                lambda: jsonable_encoder(func(*args, **kwargs)),
+                ttl=ttl,
+                stale_ttl=stale_ttl,
+                background_compute=background_compute if "db" in kwargs else None
+            )
+        return wrapper
+    return decorator
@@ -0,0 +1,55 @@
+"""
+Conditional GET helpers (weak ETags keyed on a cheap content version)
+"""
+import hashlib
+from typing import Optional
+
+from fastapi import Request, Response
+
+
+def make_etag(*parts) -> str:
+    """
+    Build a weak ETag from version parts such as (count, max(updated_at)).
+
+    The parts should be cheap to compute (an aggregate query) and must change
+    whenever the rendered payload would change.
+    """
+    raw = "|".join("" if p is None else str(p) for p in parts)
+    return 'W/"' + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def not_modified(request: Request, response: Response, *parts, private: bool = True) -> Optional[Response]:
+    """
+    Attach a weak ETag to ``response`` and return a 304 if the client already has it.
+
+    Usage in a GET handler, before doing the expensive work:
+
+        cached = not_modified(request, response, count, last_updated)
+        if cached:
+            return cached
+    """
+    etag = make_etag(request.url.path, *parts)
+    cache_control = "private, no-cache" if private else "no-cache"
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+    return None
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional, List
+from typing import Optional, List, Tuple
 
 
 class Settings(BaseSettings):
@@ -56,6 +56,69 @@ class Settings(BaseSettings):
     # Sentry
     SENTRY_DSN: Optional[str] = None
 
+    # Response compression (brotli is used when the package is installed)
+    COMPRESSION_MINIMUM_SIZE: int = 1024  # bytes; smaller bodies are sent uncompressed
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+
+    # Prometheus metrics (/metrics; requires prometheus_client)
+    METRICS_ENABLED: bool = True
+    METRICS_TOKEN: Optional[str] = None  # Bearer token scrapers must send; required in production
+
+    # Audit log batching
+    AUDIT_LOG_BATCH_SIZE: int = 100
+    AUDIT_LOG_FLUSH_INTERVAL_SECONDS: float = 2.0
+    AUDIT_LOG_FALLBACK_PATH: str = "audit_log_fallback.ndjson"  # Used while the DB is unavailable; on a volume in production
+    AUDIT_LOG_RETENTION_MONTHS: int = 6  # Full months kept in the DB; older ones are archived
+    AUDIT_LOG_ARCHIVE_DIR: str = "audit_archive"  # Must be on a mounted volume in production (see docker-compose.prod.yml)
+
+    # Shared cache: in-process L1 + Redis L2 (per-worker only when REDIS_URL is unset)
+    REDIS_URL: Optional[str] = None
+    CACHE_DEFAULT_TTL_SECONDS: float = 60.0
+    CACHE_STALE_TTL_SECONDS: float = 300.0  # Served stale this long while one worker recomputes
+    CACHE_LOCK_TIMEOUT_SECONDS: float = 30.0
+
+    # System settings cache (each worker polls the settings version this often)
+    SETTINGS_POLL_INTERVAL_SECONDS: float = 5.0
+
+    # Idempotency-Key support on purchase creation/confirmation (idempotency.py)
+    IDEMPOTENCY_KEY_TTL_HOURS: int = 24  # Retries after this are treated as new requests
+
+    # Expired OTP / reset token / session / idempotency key cleanup (auth_maintenance.py)
+    AUTH_CLEANUP_BATCH_SIZE: int = 1000
+    AUTH_CLEANUP_TIME_BUDGET_SECONDS: float = 60.0
+    AUTH_CLEANUP_GRACE_HOURS: int = 24  # Keep unusable rows this long before deleting
+    AUTH_CLEANUP_INTERVAL_MINUTES: float = 0  # > 0 also runs it inside each API worker
+
+    # Expired QR sweep (expire_qr_codes.py)
+    QR_SWEEP_BATCH_SIZE: int = 500
+    QR_SWEEP_TIME_BUDGET_SECONDS: float = 30.0
+    QR_SWEEP_INTERVAL_MINUTES: float = 0  # > 0 also runs it inside each API worker
+
+    # Pending purchase window and reaper (expire_pending_purchases.py)
+    PENDING_PURCHASE_TTL_MINUTES: int = 15  # Pending requests older than this are hidden and then failed
+    PURCHASE_REAPER_BATCH_SIZE: int = 500
+    PURCHASE_REAPER_TIME_BUDGET_SECONDS: float = 30.0
+    PURCHASE_REAPER_INTERVAL_MINUTES: float = 0  # > 0 also runs it inside each API worker
+
+    # Gunicorn process manager (gunicorn_conf.py)
+    WEB_CONCURRENCY: Optional[int] = None  # Worker processes; derived from CPU count when unset
+    WEB_MAX_WORKERS: int = 8  # Cap for the derived worker count (each worker holds its own DB pool)
+    WEB_MAX_REQUESTS: int = 2000  # Recycle a worker after this many requests (0 disables)
+    WEB_MAX_REQUESTS_JITTER: int = 200  # Spread recycling so workers don't restart together
+    WEB_GRACEFUL_TIMEOUT: int = 30  # Seconds a worker gets to finish in-flight requests on SIGTERM
+    WEB_TIMEOUT: int = 60
+
+    # Database connection pool (database.py)
+    DB_MAX_CONNECTIONS: int = 150  # The server's max_connections; pools are sized to fit under it
+    DB_RESERVED_CONNECTIONS: int = 20  # Kept free for cron jobs, migrations and admin shells
+    DB_POOL_SIZE: Optional[int] = None  # Per worker; derived from the connection budget when unset
+    DB_MAX_OVERFLOW: Optional[int] = None  # Per worker; derived from the connection budget when unset
+    DB_POOL_TIMEOUT: float = 10.0  # Seconds a request waits for a free connection before failing
+    DB_POOL_RECYCLE: int = 3600
+    DB_POOL_PRE_PING: str = "idle"  # "always", "idle" (only connections idle > DB_POOL_PRE_PING_IDLE_SECONDS) or "never"
+    DB_POOL_PRE_PING_IDLE_SECONDS: float = 30.0
+
     # CORS Configuration
     CORS_ORIGINS: Optional[str] = None  # Comma-separated list of allowed origins
     
@@ -103,6 +166,31 @@ class Settings(BaseSettings):
             origins.update(dev_origins)
         
         return list(origins)
+
+    def get_web_workers(self) -> int:
+        """Worker processes: WEB_CONCURRENCY, else 2 x usable CPUs + 1 capped at WEB_MAX_WORKERS"""
+        if self.WEB_CONCURRENCY:
+            return self.WEB_CONCURRENCY
+        import os
+        try:
+            cpus = len(os.sched_getaffinity(0))  # Respects container CPU pinning
+        except AttributeError:
+            cpus = os.cpu_count() or 1
+        return max(1, min(2 * cpus + 1, self.WEB_MAX_WORKERS))
+
+    def get_db_pool_limits(self) -> Tuple[int, int]:
+        """
+        (pool_size, max_overflow) per worker process.
+
+        Every worker may open pool_size + max_overflow connections, so the
+        budget (DB_MAX_CONNECTIONS - DB_RESERVED_CONNECTIONS) is split evenly
+        between workers: half kept pooled, half as overflow for peaks.
+        """
+        budget = max(self.DB_MAX_CONNECTIONS - self.DB_RESERVED_CONNECTIONS, 1)
+        per_worker = max(budget // self.get_web_workers(), 1)
+        pool_size = self.DB_POOL_SIZE if self.DB_POOL_SIZE is not None else max(per_worker // 2, 1)
+        max_overflow = self.DB_MAX_OVERFLOW if self.DB_MAX_OVERFLOW is not None else max(per_worker - pool_size, 0)
+        return pool_size, max_overflow
     
     class Config:
         env_file = ".env"
@@ -1,7 +1,10 @@
-from sqlalchemy import create_engine
+import time
+
+from sqlalchemy import create_engine, event, exc, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from config import settings
+from metrics import InstrumentedQueuePool, instrument_engine, pool_stats
 
 # Ensure DATABASE_URL uses pymysql driver
 database_url = settings.DATABASE_URL
@@ -22,16 +25,66 @@ if settings.ENVIRONMENT == "production":
         }
     }
 
+
+def enable_idle_pre_ping(engine, idle_seconds: float):
+    """
+    Ping connections on checkout only if they sat in the pool for idle_seconds.
+
+    A connection that was checked in a moment ago is almost certainly still
+    alive, so busy workers skip the extra round trip that pool_pre_ping makes
+    on every checkout. A failed ping makes the pool replace the connection.
+    """
+    @event.listens_for(engine, "checkin")
+    def _mark_idle(dbapi_connection, connection_record):
+        connection_record.info["idle_since"] = time.monotonic()
+
+    @event.listens_for(engine, "checkout")
+    def _ping_if_idle(dbapi_connection, connection_record, connection_proxy):
+        idle_since = connection_record.info.pop("idle_since", None)
+        if idle_since is None or time.monotonic() - idle_since < idle_seconds:
+            return
+        try:
+            cursor = dbapi_connection.cursor()
+            try:
+                cursor.execute("SELECT 1")
+            finally:
+                cursor.close()
+        except Exception:
+            pool_stats.record_stale_connection()
+            raise exc.DisconnectionError()
+
+
+def check_connection_budget(db):
+    """Warn when all workers' pools together could exceed the server's max_connections"""
+    pool_size, max_overflow = settings.get_db_pool_limits()
+    workers = settings.get_web_workers()
+    peak = workers * (pool_size + max_overflow) + settings.DB_RESERVED_CONNECTIONS
+    print(f"🔌 DB pool: {workers} workers x (pool_size={pool_size} + max_overflow={max_overflow}), "
+          f"{settings.DB_RESERVED_CONNECTIONS} reserved = {peak} connections at peak")
+    if db.bind.dialect.name != "mysql":
+        return
+    server_max = db.execute(text("SELECT @@max_connections")).scalar()
+    if server_max is not None and peak > int(server_max):
+        print(f"⚠️  DB pool peak ({peak}) exceeds the server's max_connections ({server_max}); "
+              f"set DB_MAX_CONNECTIONS={server_max} or lower DB_POOL_SIZE/DB_MAX_OVERFLOW")
+
+
 # Create database engine
+pool_size, max_overflow = settings.get_db_pool_limits()
 engine = create_engine(
     database_url,
-    pool_pre_ping=True,
-    pool_recycle=3600,
-    pool_size=10,  # Connection pool size
-    max_overflow=20,  # Max connections beyond pool_size
+    poolclass=InstrumentedQueuePool,
+    pool_pre_ping=settings.DB_POOL_PRE_PING == "always",
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_size=pool_size,  # Connection pool size (per worker process)
+    max_overflow=max_overflow,  # Max connections beyond pool_size
+    pool_timeout=settings.DB_POOL_TIMEOUT,
     echo=settings.ENVIRONMENT == "development",
     connect_args=connect_args
 )
+if settings.DB_POOL_PRE_PING == "idle":
+    enable_idle_pre_ping(engine, settings.DB_POOL_PRE_PING_IDLE_SECONDS)
+instrument_engine(engine)
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -0,0 +1,46 @@
+"""
+Drop the plaintext token columns from user_sessions.
+
+Sessions are looked up by refresh_token_hash; refresh_token and access_token
+are only kept (nullable, no longer written) so that rolling back to a build
+that still uses them doesn't break login. Run this once the hashed-token
+release is final and no deployed build reads those columns:
+  docker exec storemybottle_backend_prod python drop_legacy_session_columns.py
+Sessions created by an older build after the last startup are hashed first;
+any still without a hash are deactivated (their users log in again).
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+from sqlalchemy import text
+
+from database import SessionLocal
+
+STATEMENTS = [
+    """UPDATE user_sessions SET refresh_token_hash = SHA2(refresh_token, 256)
+    WHERE refresh_token_hash IS NULL AND refresh_token IS NOT NULL""",
+    "UPDATE user_sessions SET is_active = 0 WHERE refresh_token_hash IS NULL",
+    "ALTER TABLE user_sessions DROP COLUMN refresh_token",
+    "ALTER TABLE user_sessions DROP COLUMN access_token",
+]
+
+
+def run():
+    db = SessionLocal()
+    try:
+        for sql in STATEMENTS:
+            try:
+                db.execute(text(sql))
+                db.commit()
+                print(f"  ✅ Applied: {sql[:60]}")
+            except Exception as e:
+                db.rollback()  # Already dropped, or SHA2() missing outside MySQL
+                print(f"  ℹ️  Skipped: {sql[:60]} ({e.__class__.__name__})")
+    finally:
+        db.close()
+    print("✅ Legacy session token column cleanup done")
+
+
+if __name__ == "__main__":
+    run()
@@ -4,6 +4,7 @@ All email sending goes through this module.
 Never raises — logs failures and returns False so callers are never blocked.
 """
 from config import settings
+from metrics import track_external
 
 
 # ─── Shared HTML wrapper ────────────────────────────────────────────────────
@@ -88,12 +89,13 @@ def _send(to: str, subject: str, html: str) -> bool:
     try:
         import resend
         resend.api_key = settings.RESEND_API_KEY
-        resp = resend.Emails.send({
-            "from": settings.FROM_EMAIL,
-            "to": [to],
-            "subject": subject,
-            "html": html,
-        })
+        with track_external("email"):
+            resp = resend.Emails.send({
+                "from": settings.FROM_EMAIL,
+                "to": [to],
+                "subject": subject,
+                "html": html,
+            })
         print(f"✅ Email sent to {to} (id={resp.get('id','?')})")
         return True
     except Exception as e:
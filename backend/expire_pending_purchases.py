@@ -0,0 +1,82 @@
+"""
+Pending purchase reaper.
+Marks pending purchases nobody confirmed within PENDING_PURCHASE_TTL_MINUTES
+as FAILED, so abandoned requests leave the pending set that the customer and
+bartender pending queues poll. Batches walk the (payment_status, created_at)
+index and each batch is its own short transaction.
+
+Run every 5 minutes via cron inside the backend container:
+  docker exec storemybottle_backend_prod python expire_pending_purchases.py
+Options:
+  --batch-size N     purchases failed per transaction (default PURCHASE_REAPER_BATCH_SIZE)
+  --time-budget S    stop starting new batches after S seconds (default PURCHASE_REAPER_TIME_BUDGET_SECONDS)
+
+Setting PURCHASE_REAPER_INTERVAL_MINUTES > 0 also runs it from a background
+thread in each API worker, for deployments without cron.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from database import SessionLocal
+from models import Purchase, PaymentStatus
+from config import settings
+from scheduler import PeriodicJob
+
+
+def run(batch_size: Optional[int] = None, time_budget: Optional[float] = None) -> int:
+    """
+    Fail pending purchases older than the pending window.
+
+    Returns:
+        int: number of purchases marked FAILED
+    """
+    batch_size = batch_size or settings.PURCHASE_REAPER_BATCH_SIZE
+    time_budget = time_budget or settings.PURCHASE_REAPER_TIME_BUDGET_SECONDS
+    deadline = time.monotonic() + time_budget
+    cutoff = datetime.now(timezone.utc) - timedelta(minutes=settings.PENDING_PURCHASE_TTL_MINUTES)
+    failed = 0
+    db = SessionLocal()
+    try:
+        while time.monotonic() < deadline:
+            ids = [r[0] for r in db.query(Purchase.id).filter(
+                Purchase.payment_status == PaymentStatus.PENDING,
+                Purchase.created_at < cutoff
+            ).limit(batch_size).all()]
+            if not ids:
+                break
+            # Re-check status so a purchase confirmed in the meantime is left alone
+            failed += db.query(Purchase).filter(
+                Purchase.id.in_(ids),
+                Purchase.payment_status == PaymentStatus.PENDING
+            ).update({"payment_status": PaymentStatus.FAILED}, synchronize_session=False)
+            db.commit()
+            if len(ids) < batch_size:
+                break
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    if time.monotonic() >= deadline:
+        print(f"⏱️  Pending purchase reaper stopped at its {time_budget:g}s budget: {failed} purchases failed")
+    else:
+        print(f"✅ Pending purchase reaper done: {failed} purchases failed")
+    return failed
+
+
+purchase_reaper_scheduler = PeriodicJob("purchase-reaper", settings.PURCHASE_REAPER_INTERVAL_MINUTES, run)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mark stale pending purchases as FAILED")
+    parser.add_argument("--batch-size", type=int, default=settings.PURCHASE_REAPER_BATCH_SIZE)
+    parser.add_argument("--time-budget", type=float, default=settings.PURCHASE_REAPER_TIME_BUDGET_SECONDS)
+    args = parser.parse_args()
+    run(args.batch_size, args.time_budget)
@@ -0,0 +1,82 @@
+"""
+Expired QR sweeper.
+Marks pending redemptions whose QR code has expired as EXPIRED, so abandoned
+QR codes don't stay pending forever and the QR scan path never has to write
+the status change itself. Batches walk the (status, qr_expires_at) index and
+each batch is its own short transaction.
+
+Run every 5 minutes via cron inside the backend container:
+  docker exec storemybottle_backend_prod python expire_qr_codes.py
+Options:
+  --batch-size N     redemptions expired per transaction (default QR_SWEEP_BATCH_SIZE)
+  --time-budget S    stop starting new batches after S seconds (default QR_SWEEP_TIME_BUDGET_SECONDS)
+
+Setting QR_SWEEP_INTERVAL_MINUTES > 0 also runs it from a background thread in
+each API worker, for deployments without cron.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import argparse
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from database import SessionLocal
+from models import Redemption, RedemptionStatus
+from config import settings
+from scheduler import PeriodicJob
+
+
+def run(batch_size: Optional[int] = None, time_budget: Optional[float] = None) -> int:
+    """
+    Expire stale pending redemptions.
+
+    Returns:
+        int: number of redemptions marked EXPIRED
+    """
+    batch_size = batch_size or settings.QR_SWEEP_BATCH_SIZE
+    time_budget = time_budget or settings.QR_SWEEP_TIME_BUDGET_SECONDS
+    deadline = time.monotonic() + time_budget
+    now = datetime.now(timezone.utc)
+    expired = 0
+    db = SessionLocal()
+    try:
+        while time.monotonic() < deadline:
+            ids = [r[0] for r in db.query(Redemption.id).filter(
+                Redemption.status == RedemptionStatus.PENDING,
+                Redemption.qr_expires_at < now
+            ).limit(batch_size).all()]
+            if not ids:
+                break
+            # Re-check status so a redemption scanned in the meantime is left alone
+            expired += db.query(Redemption).filter(
+                Redemption.id.in_(ids),
+                Redemption.status == RedemptionStatus.PENDING
+            ).update({"status": RedemptionStatus.EXPIRED}, synchronize_session=False)
+            db.commit()
+            if len(ids) < batch_size:
+                break
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    if time.monotonic() >= deadline:
+        print(f"⏱️  QR sweep stopped at its {time_budget:g}s budget: {expired} redemptions expired")
+    else:
+        print(f"✅ QR sweep done: {expired} redemptions expired")
+    return expired
+
+
+qr_sweep_scheduler = PeriodicJob("qr-sweep", settings.QR_SWEEP_INTERVAL_MINUTES, run)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mark expired pending redemptions as EXPIRED")
+    parser.add_argument("--batch-size", type=int, default=settings.QR_SWEEP_BATCH_SIZE)
+    parser.add_argument("--time-budget", type=float, default=settings.QR_SWEEP_TIME_BUDGET_SECONDS)
+    args = parser.parse_args()
+    run(args.batch_size, args.time_budget)
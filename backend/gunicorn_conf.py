@@ -0,0 +1,66 @@
+"""
+Gunicorn configuration for the API (used by start.sh).
+
+  gunicorn -c gunicorn_conf.py main:app
+
+The app is imported once in the master (preload_app) and the database is
+initialized there - connection check, create_all, column migrations - before
+any worker exists. Workers are forked from that master, so they share its
+imported modules copy-on-write and skip the database setup, while still
+starting their own background threads (settings poller, schedulers).
+
+Workers are recycled after WEB_MAX_REQUESTS (+ jitter) requests and drained
+for up to WEB_GRACEFUL_TIMEOUT seconds on SIGTERM. The worker count comes from
+WEB_CONCURRENCY or the CPUs available to the container (see config.py).
+"""
+import os
+
+from config import settings
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = settings.get_web_workers()
+preload_app = True
+
+max_requests = settings.WEB_MAX_REQUESTS
+max_requests_jitter = settings.WEB_MAX_REQUESTS_JITTER
+graceful_timeout = settings.WEB_GRACEFUL_TIMEOUT
+timeout = settings.WEB_TIMEOUT
+keepalive = 5
+
+accesslog = None  # Request logging is done by the app's middleware
+errorlog = "-"
+
+
+def on_starting(server):
+    """
+    Runs once in the master, after main:app has been imported (preload_app)
+    and before any worker is forked. The startup event runs later, in each
+    worker; only the flag set here tells it the database is already set up.
+    """
+    import main  # Already imported by the preload; this is just a lookup
+    try:
+        main.init_database()
+        os.environ[main.DB_INITIALIZED_ENV] = "1"
+    except Exception as e:
+        # Leave the flag unset so each worker retries on its own startup
+        print(f"⚠️  Database initialization in master failed: {e}")
+
+
+def post_fork(server, worker):
+    """Drop connections inherited from the master; the worker opens its own"""
+    from database import engine
+    from metrics import pool_stats
+    engine.dispose(close=False)
+    pool_stats.reset()
+
+
+def child_exit(server, worker):
+    """Remove a dead worker's live gauges from the shared Prometheus directory"""
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
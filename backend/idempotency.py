@@ -0,0 +1,109 @@
+"""
+Idempotency-Key support for POST endpoints.
+
+Clients on flaky connections retry POSTs; with an Idempotency-Key header a
+retry gets the original response back instead of repeating the write. The
+response is stored in idempotency_keys in the same transaction as the write
+it describes, so a key is recorded if and only if its write committed. Two
+concurrent requests with the same key race on the primary key: the loser
+rolls back and replays the winner's response.
+
+Keys are scoped per user and endpoint, expire after IDEMPOTENCY_KEY_TTL_HOURS,
+and are pruned by auth_maintenance.py. Reusing a key with a different request
+body is rejected with 422.
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+
+def _sha256(*parts: str) -> str:
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class IdempotentRequest:
+    """
+    One request's view of its Idempotency-Key; a no-op when the header is absent.
+
+        idem = IdempotentRequest(db, user.id, "purchases.create", key, request.model_dump(mode="json"))
+        replayed = idem.replay()
+        if replayed:
+            return replayed
+        ... write, db.flush() ...
+        return idem.commit(PurchaseResponse.model_validate(obj))
+    """
+
+    def __init__(self, db: Session, user_id: str, endpoint: str, key: Optional[str], payload: dict):
+        self.db = db
+        self.key = key
+        if key is None:
+            return
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"{IDEMPOTENCY_HEADER} must be 1-{MAX_KEY_LENGTH} characters"
+            )
+        self.key_hash = _sha256(user_id, endpoint, key)
+        self.request_hash = _sha256(json.dumps(payload, sort_keys=True, default=str))
+        self._expired_row: Optional[IdempotencyKey] = None
+
+    def replay(self) -> Optional[JSONResponse]:
+        """The stored response for this key, or None if the request should run."""
+        if self.key is None:
+            return None
+        row = self.db.get(IdempotencyKey, self.key_hash, populate_existing=True)
+        if row is None:
+            return None
+        if row.expires_at.replace(tzinfo=None) <= datetime.utcnow():
+            self._expired_row = row  # Reused by commit() instead of inserting a clashing row
+            return None
+        if row.request_hash != self.request_hash:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"{IDEMPOTENCY_HEADER} was already used for a different request"
+            )
+        return JSONResponse(
+            status_code=row.status_code,
+            content=json.loads(row.response_body),
+            headers={"Idempotent-Replayed": "true"}
+        )
+
+    def commit(self, response: BaseModel, status_code: int = 200):
+        """
+        Store the response with the pending write and commit both.
+
+        Returns what to send: `response`, or the stored response of a
+        concurrent request with the same key that committed first.
+        """
+        if self.key is None:
+            self.db.commit()
+            return response
+
+        row = self._expired_row or IdempotencyKey(id=self.key_hash)
+        row.request_hash = self.request_hash
+        row.status_code = status_code
+        row.response_body = response.model_dump_json()
+        row.expires_at = datetime.utcnow() + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+        self.db.add(row)
+        try:
+            self.db.commit()
+        except IntegrityError:
+            self.db.rollback()
+            replayed = self.replay()
+            if replayed is None:
+                raise
+            return replayed
+        return response
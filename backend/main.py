@@ -1,23 +1,26 @@
+import os
+
 from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.exceptions import RequestValidationError
 from fastapi.encoders import jsonable_encoder
 from sqlalchemy.exc import SQLAlchemyError
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
-from starlette.middleware.base import BaseHTTPMiddleware
-import sentry_sdk
-from sentry_sdk.integrations.fastapi import FastApiIntegration
-from sentry_sdk.integrations.sqlalchemy import SqlalchemyIntegration
 
 from config import settings
 from database import engine, Base
+from middleware import CompressionMiddleware, MetricsMiddleware, SecurityHeadersMiddleware
+from metrics import render_metrics
 from routers import venues, auth, purchases, redemptions, profile, admin, push
 
 # Initialise Sentry before anything else (no-op if DSN not set)
 if settings.SENTRY_DSN:
+    import sentry_sdk
+    from sentry_sdk.integrations.fastapi import FastApiIntegration
+    from sentry_sdk.integrations.sqlalchemy import SqlalchemyIntegration
     sentry_sdk.init(
         dsn=settings.SENTRY_DSN,
         integrations=[FastApiIntegration(), SqlalchemyIntegration()],
@@ -39,103 +42,6 @@ def get_real_ip(request: Request) -> str:
 limiter = Limiter(key_func=get_real_ip, default_limits=["200/minute"])
 
 
-# Security Headers Middleware
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
-    """
-    Add security headers to all responses.
-    Implements OWASP security best practices.
-    """
-    async def dispatch(self, request: Request, call_next):
-        # Skip security headers for API documentation endpoints
-        if request.url.path in ["/docs", "/redoc", "/openapi.json"]:
-            response = await call_next(request)
-            return response
-        
-        response = await call_next(request)
-        
-        # HSTS (HTTP Strict Transport Security)
-        # Forces browsers to use HTTPS for all future requests
-        if settings.ENVIRONMENT == "production":
-            # Production: Enforce HTTPS for 1 year, include subdomains
-            response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains; preload"
-        else:
-            # Development: Shorter duration for testing
-            response.headers["Strict-Transport-Security"] = "max-age=3600"
-        
-        # X-Content-Type-Options
-        # Prevents MIME type sniffing
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        
-        # X-Frame-Options
-        # Prevents clickjacking attacks
-        response.headers["X-Frame-Options"] = "DENY"
-        
-        # X-XSS-Protection
-        # Enables browser XSS filter (legacy, but still useful)
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        
-        # Content-Security-Policy
-        # Prevents XSS, clickjacking, and other code injection attacks
-        csp_directives = [
-            "default-src 'self'",
-            "script-src 'self' 'unsafe-inline' 'unsafe-eval' https://cdn.jsdelivr.net",  # Allow Swagger UI CDN
-            "style-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net",  # Allow Swagger UI styles
-            "img-src 'self' data: https:",
-            "font-src 'self' data:",
-            "connect-src 'self'",
-            "frame-ancestors 'none'",
-            "base-uri 'self'",
-            "form-action 'self'"
-        ]
-        response.headers["Content-Security-Policy"] = "; ".join(csp_directives)
-        
-        # Referrer-Policy
-        # Controls how much referrer information is sent
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-        
-        # Permissions-Policy (formerly Feature-Policy)
-        # Controls which browser features can be used
-        permissions = [
-            "geolocation=()",
-            "microphone=()",
-            "camera=()",
-            "payment=()",
-            "usb=()",
-            "magnetometer=()",
-            "gyroscope=()",
-            "accelerometer=()"
-        ]
-        response.headers["Permissions-Policy"] = ", ".join(permissions)
-        
-        return response
-
-
-# HTTPS Redirect Middleware (Production only)
-class HTTPSRedirectMiddleware(BaseHTTPMiddleware):
-    """
-    Redirect all HTTP requests to HTTPS in production.
-    When behind a reverse proxy (like Nginx), check X-Forwarded-Proto header.
-    """
-    async def dispatch(self, request: Request, call_next):
-        # Only redirect in production
-        if settings.ENVIRONMENT == "production":
-            # Check X-Forwarded-Proto header (set by Nginx)
-            forwarded_proto = request.headers.get("x-forwarded-proto", "")
-            
-            # If no proxy header, fall back to checking request scheme
-            if forwarded_proto:
-                # Behind proxy: trust the X-Forwarded-Proto header
-                if forwarded_proto == "http":
-                    # Build HTTPS URL
-                    https_url = request.url.replace(scheme="https")
-                    return RedirectResponse(url=str(https_url), status_code=301)
-            elif request.url.scheme == "http":
-                # Direct connection: check request scheme
-                https_url = request.url.replace(scheme="https")
-                return RedirectResponse(url=str(https_url), status_code=301)
-        
-        return await call_next(request)
-
 # Create FastAPI app
 app = FastAPI(
     title="StoreMyBottle API",
@@ -151,7 +57,7 @@ app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
 # Add security middlewares
 # Note: HTTPS redirect is handled by Nginx reverse proxy, not by the app
-app.add_middleware(SecurityHeadersMiddleware)
+app.add_middleware(SecurityHeadersMiddleware, production=settings.ENVIRONMENT == "production")
 
 # CORS middleware - Secure configuration
 # No wildcards allowed when using credentials (HttpOnly cookies)
@@ -162,11 +68,26 @@ app.add_middleware(
     allow_origins=cors_origins,  # Specific origins only (no wildcards)
     allow_credentials=True,  # Required for HttpOnly cookies
     allow_methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"],
-    allow_headers=["Content-Type", "Authorization", "Accept"],
-    expose_headers=["Content-Length", "Content-Type"],
+    allow_headers=["Content-Type", "Authorization", "Accept", "If-None-Match"],
+    expose_headers=[
+        "Content-Length", "Content-Type", "Content-Disposition", "ETag",
+        "X-Export-Row-Count", "X-Export-Total-Amount", "X-Export-Total-Ml",
+    ],
     max_age=3600,  # Cache preflight requests for 1 hour
 )
 
+# Compression - wraps the security headers and CORS middlewares
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+    gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+    brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
+)
+
+# Metrics - registered last so latency includes every other middleware
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 
 # Exception handlers
 @app.exception_handler(RequestValidationError)
@@ -193,6 +114,124 @@ async def sqlalchemy_exception_handler(request: Request, exc: SQLAlchemyError):
     )
 
 
+# Environment flag set by the gunicorn master once it has initialized the
+# database, so forked workers skip it (see gunicorn_conf.py)
+DB_INITIALIZED_ENV = "SMB_DB_INITIALIZED"
+
+
+def init_database():
+    """Check the connection, create missing tables and apply column migrations"""
+    print("🗄️  Checking database connection...")
+    # Test connection
+    from database import SessionLocal, check_connection_budget
+    from sqlalchemy import text
+    db = SessionLocal()
+    db.execute(text("SELECT 1"))
+    check_connection_budget(db)
+    db.close()
+    print("✅ Database connection successful")
+    
+    # Create tables if they don't exist
+    print("📊 Creating database tables if needed...")
+    Base.metadata.create_all(bind=engine)
+    print("✅ Database tables ready")
+
+    # Add new columns that may not exist on older deployments
+    print("🔧 Running column migrations...")
+    db = SessionLocal()
+    try:
+        migrations = [
+            "ALTER TABLE purchases ADD COLUMN warning_3d_sent BOOLEAN NOT NULL DEFAULT FALSE",
+            "ALTER TABLE bottles ADD COLUMN stock_count INT NULL",
+            "ALTER TABLE redemptions ADD COLUMN remaining_ml_after INT NULL",
+            "ALTER TABLE bottles ADD COLUMN category VARCHAR(100) NULL",
+            "ALTER TABLE bottles ADD COLUMN description VARCHAR(1000) NULL",
+            # push_subscriptions may have been created with wrong column types — recreate if missing
+            """CREATE TABLE IF NOT EXISTS push_subscriptions (
+                id VARCHAR(36) NOT NULL PRIMARY KEY,
+                user_id VARCHAR(36) NOT NULL,
+                endpoint VARCHAR(500) NOT NULL UNIQUE,
+                p256dh VARCHAR(500) NOT NULL,
+                auth VARCHAR(100) NOT NULL,
+                created_at DATETIME DEFAULT NOW(),
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+            )""",
+            # Seed per-user promotion counters from confirmed purchases (only users without a counter yet)
+            """INSERT INTO promotion_usages (id, promotion_id, user_id, use_count)
+            SELECT UUID(), pr.id, pu.user_id, COUNT(*)
+            FROM purchases pu JOIN promotions pr ON pr.code = pu.promotion_code
+            WHERE pu.payment_status = 'CONFIRMED'
+            AND NOT EXISTS (
+                SELECT 1 FROM promotion_usages u WHERE u.promotion_id = pr.id AND u.user_id = pu.user_id
+            )
+            GROUP BY pr.id, pu.user_id""",
+            # ...and bring the global counter up to the same data (never lowered, so slots aren't reopened)
+            """UPDATE promotions SET usage_count = GREATEST(usage_count, (
+                SELECT COALESCE(SUM(u.use_count), 0) FROM promotion_usages u WHERE u.promotion_id = promotions.id
+            ))""",
+            "ALTER TABLE support_tickets ADD COLUMN comments_count INT NOT NULL DEFAULT 0",
+            "ALTER TABLE support_tickets ADD COLUMN last_activity_at DATETIME NULL",
+            # Backfill denormalized ticket activity (new tickets set last_activity_at on insert)
+            """UPDATE support_tickets SET
+                comments_count = (SELECT COUNT(*) FROM ticket_comments c WHERE c.ticket_id = support_tickets.id),
+                last_activity_at = COALESCE(
+                    (SELECT MAX(c.created_at) FROM ticket_comments c WHERE c.ticket_id = support_tickets.id),
+                    support_tickets.created_at
+                )
+            WHERE last_activity_at IS NULL""",
+            # Audit log search: composite indexes matching the filters + keyset order
+            "CREATE INDEX ix_audit_logs_created_id ON audit_logs (created_at, id)",
+            "CREATE INDEX ix_audit_logs_user_created ON audit_logs (user_id, created_at, id)",
+            "CREATE INDEX ix_audit_logs_action_created ON audit_logs (action, created_at, id)",
+            "CREATE INDEX ix_audit_logs_entity_created ON audit_logs (entity_type, entity_id, created_at, id)",
+            # Sessions keep only a sha256 of the refresh token (SHA2() matches hashlib's hex digest).
+            # The plaintext columns stay, nullable and unwritten, so a rolled-back build still
+            # works; the backfill also hashes sessions such a build created. They are dropped
+            # by drop_legacy_session_columns.py once no deployed build reads them.
+            "ALTER TABLE user_sessions ADD COLUMN refresh_token_hash VARCHAR(64) NULL",
+            """UPDATE user_sessions SET refresh_token_hash = SHA2(refresh_token, 256)
+            WHERE refresh_token_hash IS NULL AND refresh_token IS NOT NULL""",
+            "CREATE UNIQUE INDEX ix_user_sessions_refresh_token_hash ON user_sessions (refresh_token_hash)",
+            "ALTER TABLE user_sessions MODIFY refresh_token VARCHAR(500) NULL",
+            "ALTER TABLE user_sessions MODIFY access_token VARCHAR(500) NULL",
+            # Auth cleanup scans by expiry; OTP lookups filter phone + is_verified + expires_at
+            "CREATE INDEX ix_otps_expires_at ON otps (expires_at)",
+            "CREATE INDEX ix_otps_phone_verified_expires ON otps (phone, is_verified, expires_at)",
+            "CREATE INDEX ix_redemptions_status_qr_expires ON redemptions (status, qr_expires_at)",
+            "CREATE INDEX ix_purchases_venue_status_created ON purchases (venue_id, payment_status, created_at)",
+            "CREATE INDEX ix_purchases_status_created ON purchases (payment_status, created_at)",
+            # Venue listing: indexed city, coordinates for bounding-box search
+            "ALTER TABLE venues ADD COLUMN city VARCHAR(100) NULL",
+            "ALTER TABLE venues ADD COLUMN latitude DECIMAL(9,6) NULL",
+            "ALTER TABLE venues ADD COLUMN longitude DECIMAL(9,6) NULL",
+            "CREATE INDEX ix_venues_city ON venues (city)",
+            "CREATE INDEX ix_venues_lat_lng ON venues (latitude, longitude)",
+        ]
+        # Full-text venue search (MySQL FULLTEXT / SQLite FTS5)
+        from venue_search import search_index_ddl, backfill_venue_cities
+        migrations += search_index_ddl(db.bind.dialect.name)
+        for sql in migrations:
+            try:
+                db.execute(text(sql))
+                db.commit()
+                print(f"  ✅ Migration applied: {sql[:60]}")
+            except Exception as col_err:
+                db.rollback()  # Column already exists — safe to ignore
+                print(f"  ℹ️  Skipped (already exists): {sql[:60]}")
+        try:
+            filled = backfill_venue_cities(db)
+            if filled:
+                print(f"  ✅ Backfilled city for {filled} venues")
+        except Exception as backfill_err:
+            db.rollback()
+            print(f"⚠️  Venue city backfill failed (non-fatal): {backfill_err}")
+    except Exception as mig_err:
+        print(f"⚠️  Migration block failed (non-fatal): {mig_err}")
+    finally:
+        db.close()
+    print("✅ Column migrations done")
+
+
 # Startup event
 @app.on_event("startup")
 async def startup_event():
@@ -204,56 +243,28 @@ async def startup_event():
     print(f"🔐 HTTPS Enforcement: {'✅ Enabled' if settings.ENVIRONMENT == 'production' else '⚠️  Disabled (dev mode)'}")
     print(f"🛡️  Security Headers: ✅ Enabled")
     
-    # Auto-initialize database on startup (for production deployments)
     try:
-        print("🗄️  Checking database connection...")
-        # Test connection
-        from database import SessionLocal
-        from sqlalchemy import text
-        db = SessionLocal()
-        db.execute(text("SELECT 1"))
-        db.close()
-        print("✅ Database connection successful")
-        
-        # Create tables if they don't exist
-        print("📊 Creating database tables if needed...")
-        Base.metadata.create_all(bind=engine)
-        print("✅ Database tables ready")
-
-        # Add new columns that may not exist on older deployments
-        print("🔧 Running column migrations...")
-        db = SessionLocal()
-        try:
-            migrations = [
-                "ALTER TABLE purchases ADD COLUMN warning_3d_sent BOOLEAN NOT NULL DEFAULT FALSE",
-                "ALTER TABLE bottles ADD COLUMN stock_count INT NULL",
-                "ALTER TABLE redemptions ADD COLUMN remaining_ml_after INT NULL",
-                "ALTER TABLE bottles ADD COLUMN category VARCHAR(100) NULL",
-                "ALTER TABLE bottles ADD COLUMN description VARCHAR(1000) NULL",
-                # push_subscriptions may have been created with wrong column types — recreate if missing
-                """CREATE TABLE IF NOT EXISTS push_subscriptions (
-                    id VARCHAR(36) NOT NULL PRIMARY KEY,
-                    user_id VARCHAR(36) NOT NULL,
-                    endpoint VARCHAR(500) NOT NULL UNIQUE,
-                    p256dh VARCHAR(500) NOT NULL,
-                    auth VARCHAR(100) NOT NULL,
-                    created_at DATETIME DEFAULT NOW(),
-                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-                )""",
-            ]
-            for sql in migrations:
-                try:
-                    db.execute(text(sql))
-                    db.commit()
-                    print(f"  ✅ Migration applied: {sql[:60]}")
-                except Exception as col_err:
-                    db.rollback()  # Column already exists — safe to ignore
-                    print(f"  ℹ️  Skipped (already exists): {sql[:60]}")
-        except Exception as mig_err:
-            print(f"⚠️  Migration block failed (non-fatal): {mig_err}")
-        finally:
-            db.close()
-        print("✅ Column migrations done")
+        # Auto-initialize database on startup (for production deployments)
+        if os.environ.get(DB_INITIALIZED_ENV) != "1":
+            init_database()
+
+        # Load system settings into memory and start watching for changes
+        from settings_service import settings_service
+        settings_service.start()
+        print("✅ System settings loaded")
+
+        # Optional in-process maintenance jobs (cron runs the scripts otherwise)
+        from auth_maintenance import auth_cleanup_scheduler
+        from expire_qr_codes import qr_sweep_scheduler
+        from expire_pending_purchases import purchase_reaper_scheduler
+        auth_cleanup_scheduler.start()
+        qr_sweep_scheduler.start()
+        purchase_reaper_scheduler.start()
+
+        # Audit entries a previous process couldn't write (DB outage, crash mid-replay)
+        import threading
+        from audit_log import audit_log_writer
+        threading.Thread(target=audit_log_writer.replay_pending, name="audit-log-replay", daemon=True).start()
         
     except Exception as e:
         print(f"⚠️  Database initialization warning: {e}")
@@ -268,6 +279,17 @@ async def startup_event():
 async def shutdown_event():
     """Run on application shutdown"""
     print("👋 Shutting down StoreMyBottle API...")
+    # Write any buffered audit entries before the worker exits
+    from audit_log import audit_log_writer
+    audit_log_writer.stop()
+    from settings_service import settings_service
+    settings_service.stop()
+    from auth_maintenance import auth_cleanup_scheduler
+    from expire_qr_codes import qr_sweep_scheduler
+    from expire_pending_purchases import purchase_reaper_scheduler
+    auth_cleanup_scheduler.stop()
+    qr_sweep_scheduler.stop()
+    purchase_reaper_scheduler.stop()
 
 
 # Health check endpoint
@@ -281,6 +303,28 @@ def health_check():
     }
 
 
+# Prometheus metrics endpoint (bearer token from METRICS_TOKEN; never served open in production)
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint(request: Request):
+    """Prometheus scrape endpoint"""
+    if settings.METRICS_TOKEN:
+        import secrets
+        supplied = request.headers.get("authorization", "")
+        if not secrets.compare_digest(supplied.encode(), f"Bearer {settings.METRICS_TOKEN}".encode()):
+            return JSONResponse(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                content={"detail": "Invalid metrics token"},
+                headers={"WWW-Authenticate": "Bearer"}
+            )
+    elif settings.ENVIRONMENT == "production":
+        return JSONResponse(status_code=404, content={"detail": "Metrics are not enabled"})
+    rendered = render_metrics() if settings.METRICS_ENABLED else None
+    if rendered is None:
+        return JSONResponse(status_code=404, content={"detail": "Metrics are not enabled"})
+    body, content_type = rendered
+    return Response(content=body, media_type=content_type)
+
+
 # Root endpoint
 @app.get("/")
 def root():
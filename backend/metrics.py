@@ -0,0 +1,239 @@
+"""
+Prometheus metrics for the API.
+
+Everything here is a no-op when prometheus_client isn't installed, so the app
+runs the same without it. With several uvicorn workers, set
+PROMETHEUS_MULTIPROC_DIR to a shared empty directory so /metrics aggregates
+all workers instead of reporting whichever one served the scrape.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Gauge, Histogram
+except ImportError:
+    prometheus_client = None
+
+
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+# Buckets tuned for an API whose typical request is a few ms to a few hundred ms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+EXTERNAL_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+if prometheus_client is not None:
+    HTTP_REQUEST_DURATION = Histogram(
+        "http_request_duration_seconds", "HTTP request latency by route",
+        ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+    )
+    HTTP_REQUESTS_IN_PROGRESS = Gauge(
+        "http_requests_in_progress", "HTTP requests currently being served",
+        ["method"], multiprocess_mode="livesum",
+    )
+    DB_POOL_CHECKOUT_WAIT = Histogram(
+        "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled DB connection",
+        buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+    )
+    DB_POOL_CHECKOUT_TIMEOUTS = Counter(
+        "db_pool_checkout_timeouts_total", "Checkouts that gave up waiting for a pooled DB connection",
+    )
+    DB_POOL_CHECKED_OUT = Gauge(
+        "db_pool_checked_out", "DB connections currently checked out",
+        multiprocess_mode="livesum",
+    )
+    DB_POOL_OVERFLOW = Gauge(
+        "db_pool_overflow", "DB connections open beyond pool_size",
+        multiprocess_mode="livesum",
+    )
+    SQL_STATEMENTS_PER_REQUEST = Histogram(
+        "sql_statements_per_request", "SQL statements executed per HTTP request",
+        ["route"], buckets=SQL_COUNT_BUCKETS,
+    )
+    SQL_SECONDS_PER_REQUEST = Histogram(
+        "sql_seconds_per_request", "Time spent in SQL per HTTP request",
+        ["route"], buckets=LATENCY_BUCKETS,
+    )
+    SQL_STATEMENTS = Counter(
+        "sql_statements_total", "SQL statements executed (requests, cron jobs and background work)",
+    )
+    EXTERNAL_CALL_DURATION = Histogram(
+        "external_call_duration_seconds", "Outbound call latency (email, push)",
+        ["service", "outcome"], buckets=EXTERNAL_BUCKETS,
+    )
+
+
+class RequestStats:
+    """SQL counters for one request; shared by reference with threadpool workers."""
+    __slots__ = ("statements", "sql_seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.sql_seconds = 0.0
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def start_request() -> RequestStats:
+    """Begin collecting SQL stats for the current request context."""
+    stats = RequestStats()
+    _request_stats.set(stats)
+    return stats
+
+
+def observe_request(method: str, route: str, status_code: int, seconds: float, stats: RequestStats):
+    if prometheus_client is None:
+        return
+    HTTP_REQUEST_DURATION.labels(method, route, str(status_code)).observe(seconds)
+    SQL_STATEMENTS_PER_REQUEST.labels(route).observe(stats.statements)
+    SQL_SECONDS_PER_REQUEST.labels(route).observe(stats.sql_seconds)
+
+
+@contextmanager
+def track_in_progress(method: str):
+    if prometheus_client is None:
+        yield
+        return
+    gauge = HTTP_REQUESTS_IN_PROGRESS.labels(method)
+    gauge.inc()
+    try:
+        yield
+    finally:
+        gauge.dec()
+
+
+@contextmanager
+def track_external(service: str):
+    """Time an outbound call; the outcome label is "error" if the block raises."""
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        if prometheus_client is not None:
+            EXTERNAL_CALL_DURATION.labels(service, outcome).observe(time.perf_counter() - start)
+
+
+class PoolStats:
+    """
+    Checkout statistics for this process's connection pool.
+
+    Kept whether or not prometheus_client is installed, for the admin
+    pool endpoint; counters are per worker process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.timeouts = 0
+            self.wait_seconds_total = 0.0
+            self.wait_seconds_max = 0.0
+            self.stale_connections = 0  # Failed an idle pre-ping and were replaced
+
+    def record_checkout(self, waited: float, timed_out: bool):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def record_stale_connection(self):
+        with self._lock:
+            self.stale_connections += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "stale_connections": self.stale_connections,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_avg": round(self.wait_seconds_total / attempts, 6) if attempts else 0.0,
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+            }
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a free connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            pool_stats.record_checkout(waited, timed_out)
+            if prometheus_client is not None:
+                DB_POOL_CHECKOUT_WAIT.observe(waited)
+                if timed_out:
+                    DB_POOL_CHECKOUT_TIMEOUTS.inc()
+
+
+def instrument_engine(engine):
+    """Attach SQL timing and pool occupancy listeners to an engine."""
+    if prometheus_client is None:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        SQL_STATEMENTS.inc()
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.sql_seconds += elapsed
+
+    if not isinstance(engine.pool, QueuePool):
+        return
+
+    def _update_pool_gauges(*args):
+        # Read engine.pool each time: dispose() swaps in a fresh pool
+        DB_POOL_CHECKED_OUT.set(engine.pool.checkedout())
+        DB_POOL_OVERFLOW.set(max(engine.pool.overflow(), 0))
+
+    event.listen(engine, "checkout", _update_pool_gauges)
+    event.listen(engine, "checkin", _update_pool_gauges)
+
+
+def render_metrics():
+    """Return (body, content_type) for the /metrics endpoint, or None if unavailable."""
+    if prometheus_client is None:
+        return None
+    if MULTIPROCESS:
+        from prometheus_client import CollectorRegistry, multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
@@ -0,0 +1,314 @@
+"""
+Pure ASGI middlewares for the API.
+
+These wrap ``send`` directly instead of subclassing ``BaseHTTPMiddleware``,
+which spawns a task and an in-memory stream for every request.
+"""
+import time
+import zlib
+
+from starlette.datastructures import URL
+from starlette.responses import RedirectResponse
+
+import metrics
+
+try:
+    import brotli  # Optional: falls back to gzip when not installed
+except ImportError:
+    brotli = None
+
+
+# Paths that render Swagger/ReDoc and need their own CSP
+DOCS_PATHS = frozenset(["/docs", "/redoc", "/openapi.json"])
+
+# Content-Security-Policy
+# Prevents XSS, clickjacking, and other code injection attacks
+CSP_DIRECTIVES = [
+    "default-src 'self'",
+    "script-src 'self' 'unsafe-inline' 'unsafe-eval' https://cdn.jsdelivr.net",  # Allow Swagger UI CDN
+    "style-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net",  # Allow Swagger UI styles
+    "img-src 'self' data: https:",
+    "font-src 'self' data:",
+    "connect-src 'self'",
+    "frame-ancestors 'none'",
+    "base-uri 'self'",
+    "form-action 'self'"
+]
+
+# Permissions-Policy (formerly Feature-Policy)
+# Controls which browser features can be used
+PERMISSIONS_POLICY = [
+    "geolocation=()",
+    "microphone=()",
+    "camera=()",
+    "payment=()",
+    "usb=()",
+    "magnetometer=()",
+    "gyroscope=()",
+    "accelerometer=()"
+]
+
+
+def build_security_headers(production: bool) -> list:
+    """
+    Build the raw ASGI header list added to every response.
+    Implements OWASP security best practices.
+    """
+    headers = [
+        # HSTS: production enforces HTTPS for 1 year incl. subdomains, dev uses a short duration
+        ("Strict-Transport-Security", "max-age=31536000; includeSubDomains; preload" if production else "max-age=3600"),
+        # Prevents MIME type sniffing
+        ("X-Content-Type-Options", "nosniff"),
+        # Prevents clickjacking attacks
+        ("X-Frame-Options", "DENY"),
+        # Enables browser XSS filter (legacy, but still useful)
+        ("X-XSS-Protection", "1; mode=block"),
+        ("Content-Security-Policy", "; ".join(CSP_DIRECTIVES)),
+        # Controls how much referrer information is sent
+        ("Referrer-Policy", "strict-origin-when-cross-origin"),
+        ("Permissions-Policy", ", ".join(PERMISSIONS_POLICY)),
+    ]
+    return [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+
+
+class SecurityHeadersMiddleware:
+    """
+    Add security headers to all responses.
+
+    The header list is built once at startup; per request we only extend the
+    outgoing header list in ``http.response.start``.
+    """
+
+    def __init__(self, app, production: bool = False):
+        self.app = app
+        self.headers = build_security_headers(production)
+        self.header_names = frozenset(name for name, _ in self.headers)
+
+    async def __call__(self, scope, receive, send):
+        # Skip security headers for API documentation endpoints
+        if scope["type"] != "http" or scope["path"] in DOCS_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                # Our values win over anything a handler set for the same header
+                headers = [h for h in message.get("headers", []) if h[0] not in self.header_names]
+                headers.extend(self.headers)
+                message["headers"] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+class HTTPSRedirectMiddleware:
+    """
+    Redirect all HTTP requests to HTTPS in production.
+    When behind a reverse proxy (like Nginx), check X-Forwarded-Proto header.
+
+    Not registered by default: in production Nginx handles the redirect.
+    Outside production (production=False) requests pass through untouched.
+    """
+
+    def __init__(self, app, production: bool = False):
+        self.app = app
+        self.production = production
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.production:
+            await self.app(scope, receive, send)
+            return
+
+        forwarded_proto = ""
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-proto":
+                forwarded_proto = value.decode("latin-1")
+                break
+
+        # Behind proxy: trust the X-Forwarded-Proto header; otherwise check the request scheme
+        if forwarded_proto == "http" or (not forwarded_proto and scope.get("scheme") == "http"):
+            https_url = URL(scope=scope).replace(scheme="https")
+            response = RedirectResponse(url=str(https_url), status_code=301)
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
+
+
+class MetricsMiddleware:
+    """
+    Record per-route latency, in-flight requests and SQL statements per request.
+
+    The route label is the matched path template (e.g. /api/venues/{venue_id}),
+    never the raw path, to keep label cardinality bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        stats = metrics.start_request()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            with metrics.track_in_progress(method):
+                await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            metrics.observe_request(method, route_path, status_code, time.perf_counter() - start, stats)
+
+
+# Content types that are already compressed or must not be buffered
+UNCOMPRESSIBLE_PREFIXES = ("image/", "video/", "audio/", "application/gzip", "application/zip", "text/event-stream")
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with Brotli or gzip depending on Accept-Encoding.
+
+    Bodies smaller than ``minimum_size`` are sent as-is, as are responses that
+    already carry a Content-Encoding or an uncompressible content type.
+    Streaming responses are compressed incrementally.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1").lower()
+                break
+
+        if brotli is not None and "br" in accept_encoding:
+            encoding = "br"
+        elif "gzip" in accept_encoding:
+            encoding = "gzip"
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(send, encoding, self.minimum_size, self.gzip_level, self.brotli_quality)
+        await self.app(scope, receive, responder)
+
+
+class _CompressionResponder:
+    """Wraps ``send`` for a single response and decides whether to compress it."""
+
+    def __init__(self, send, encoding: str, minimum_size: int, gzip_level: int, brotli_quality: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.start_message = None
+        self.compressor = None
+        self.passthrough = False
+        self.pending = b""
+
+    def _new_compressor(self):
+        if self.encoding == "br":
+            return brotli.Compressor(quality=self.brotli_quality)
+        return zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self.compressor.process(data)
+        return self.compressor.compress(data)
+
+    def _finish(self) -> bytes:
+        if self.encoding == "br":
+            return self.compressor.finish()
+        return self.compressor.flush()
+
+    def _should_skip(self, headers) -> bool:
+        for name, value in headers:
+            if name == b"content-encoding":
+                return True
+            if name == b"content-type" and value.decode("latin-1").startswith(UNCOMPRESSIBLE_PREFIXES):
+                return True
+        return False
+
+    def _compressed_headers(self, length=None):
+        headers = [
+            (name, value) for name, value in self.start_message["headers"]
+            if name not in (b"content-length", b"vary")
+        ]
+        vary = [value for name, value in self.start_message["headers"] if name == b"vary"]
+        vary_value = b", ".join(vary + [b"Accept-Encoding"]) if vary else b"Accept-Encoding"
+        headers.append((b"vary", vary_value))
+        headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+        if length is not None:
+            headers.append((b"content-length", str(length).encode("latin-1")))
+        # A strong ETag no longer matches the transformed bytes
+        return [
+            (name, b"W/" + value if name == b"etag" and not value.startswith(b"W/") else value)
+            for name, value in headers
+        ]
+
+    async def __call__(self, message):
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            self.start_message = message
+            if message["status"] < 200 or message["status"] in (204, 304) or self._should_skip(message["headers"]):
+                self.passthrough = True
+                await self.send(message)
+            return
+
+        if message_type != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            # Hold back the start message until we know the body is big enough
+            self.pending += body
+            if more_body and len(self.pending) < self.minimum_size:
+                return
+            body, self.pending = self.pending, b""
+
+            if not more_body:
+                if len(body) < self.minimum_size:
+                    self.passthrough = True
+                    await self.send(self.start_message)
+                    await self.send({"type": "http.response.body", "body": body})
+                    return
+                self.compressor = self._new_compressor()
+                compressed = self._compress(body) + self._finish()
+                await self.send({**self.start_message, "headers": self._compressed_headers(len(compressed))})
+                await self.send({"type": "http.response.body", "body": compressed})
+                return
+
+            # Streaming body: compress chunk by chunk without a Content-Length
+            self.compressor = self._new_compressor()
+            await self.send({**self.start_message, "headers": self._compressed_headers()})
+
+        chunk = self._compress(body)
+        if not more_body:
+            chunk += self._finish()
+        if chunk or not more_body:
+            await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Numeric, Boolean, DateTime, Date, ForeignKey, Enum as SQLEnum, Text, UniqueConstraint
+from sqlalchemy import Column, String, Integer, Numeric, Boolean, DateTime, Date, ForeignKey, Enum as SQLEnum, Text, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -113,6 +113,9 @@ class Venue(Base):
     contact_email = Column(String(255), nullable=True)
     contact_phone = Column(String(20), nullable=True)
     image_url = Column(String(1000), nullable=True)
+    city = Column(String(100), nullable=True, index=True)  # Normalized (see sanitization.normalize_city)
+    latitude = Column(Numeric(9, 6), nullable=True)
+    longitude = Column(Numeric(9, 6), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
@@ -121,6 +124,11 @@ class Venue(Base):
     purchases = relationship("Purchase", back_populates="venue")
     redemptions = relationship("Redemption", back_populates="venue")
 
+    __table_args__ = (
+        # Bounding-box search: range on latitude, longitude checked from the index
+        Index("ix_venues_lat_lng", "latitude", "longitude"),
+    )
+
 
 class Bottle(Base):
     """Bottle catalog model"""
@@ -174,6 +182,13 @@ class Purchase(Base):
     venue = relationship("Venue", back_populates="purchases")
     redemptions = relationship("Redemption", back_populates="purchase", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Bartender pending queue: one venue's live pending requests, newest first
+        Index("ix_purchases_venue_status_created", "venue_id", "payment_status", "created_at"),
+        # Pending purchase reaper: stale pending rows across all venues
+        Index("ix_purchases_status_created", "payment_status", "created_at"),
+    )
+
 
 class Redemption(Base):
     """Peg redemptions"""
@@ -199,6 +214,11 @@ class Redemption(Base):
     user = relationship("User", back_populates="redemptions")
     venue = relationship("Venue", back_populates="redemptions")
 
+    __table_args__ = (
+        # Expired QR sweep: pending rows ordered by expiry
+        Index("ix_redemptions_status_qr_expires", "status", "qr_expires_at"),
+    )
+
 
 class OTP(Base):
     """OTP for phone authentication"""
@@ -207,10 +227,15 @@ class OTP(Base):
     id = Column(String(36), primary_key=True, default=generate_uuid)
     phone = Column(String(20), nullable=False, index=True)
     otp_code = Column(String(6), nullable=False)
-    expires_at = Column(DateTime(timezone=True), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
     is_verified = Column(Boolean, default=False, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (
+        # Matches the create_otp/verify_otp lookups
+        Index("ix_otps_phone_verified_expires", "phone", "is_verified", "expires_at"),
+    )
+
 
 
 class Promotion(Base):
@@ -239,6 +264,20 @@ class Promotion(Base):
     venue = relationship("Venue", backref="promotions")
 
 
+class PromotionUsage(Base):
+    """Per-user promotion usage counter, incremented when a purchase is confirmed"""
+    __tablename__ = "promotion_usages"
+    __table_args__ = (
+        UniqueConstraint("promotion_id", "user_id", name="uq_promotion_user_usage"),
+    )
+    
+    id = Column(String(36), primary_key=True, default=generate_uuid)
+    promotion_id = Column(String(36), ForeignKey("promotions.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    use_count = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
 
 class SupportTicket(Base):
     """Support tickets for customer issues"""
@@ -255,6 +294,8 @@ class SupportTicket(Base):
     assigned_to_id = Column(String(36), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
     resolved_at = Column(DateTime(timezone=True), nullable=True)
     closed_at = Column(DateTime(timezone=True), nullable=True)
+    comments_count = Column(Integer, default=0, nullable=False)  # Maintained on comment insert
+    last_activity_at = Column(DateTime(timezone=True), nullable=True)  # Creation or latest comment
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
@@ -264,6 +305,25 @@ class SupportTicket(Base):
     comments = relationship("TicketComment", back_populates="ticket", cascade="all, delete-orphan")
 
 
+class IdempotencyKey(Base):
+    """Stored response of a POST sent with an Idempotency-Key header, replayed to retries"""
+    __tablename__ = "idempotency_keys"
+    
+    id = Column(String(64), primary_key=True)  # sha256 of user, endpoint and the client's key
+    request_hash = Column(String(64), nullable=False)  # sha256 of the request; a reused key must match it
+    status_code = Column(Integer, nullable=False)
+    response_body = Column(Text, nullable=False)  # JSON
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class IdSequence(Base):
+    """Named counters: human-readable identifiers (e.g. ticket numbers) and cache versions"""
+    __tablename__ = "id_sequences"
+    
+    name = Column(String(50), primary_key=True)
+    next_value = Column(Integer, nullable=False)  # First value not yet handed out to any worker
+
+
 class TicketComment(Base):
     """Comments/replies on support tickets"""
     __tablename__ = "ticket_comments"
@@ -283,6 +343,13 @@ class TicketComment(Base):
 class AuditLog(Base):
     """Audit logs for tracking admin actions"""
     __tablename__ = "audit_logs"
+    __table_args__ = (
+        # One index per filter, each ending in (created_at, id) to serve the keyset ordering
+        Index("ix_audit_logs_created_id", "created_at", "id"),
+        Index("ix_audit_logs_user_created", "user_id", "created_at", "id"),
+        Index("ix_audit_logs_action_created", "action", "created_at", "id"),
+        Index("ix_audit_logs_entity_created", "entity_type", "entity_id", "created_at", "id"),
+    )
     
     id = Column(String(36), primary_key=True, default=generate_uuid)
     user_id = Column(String(36), nullable=True, index=True)
@@ -317,8 +384,8 @@ class UserSession(Base):
     
     id = Column(String(36), primary_key=True, default=generate_uuid)
     user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
-    refresh_token = Column(String(500), unique=True, nullable=False, index=True)
-    access_token = Column(String(500), nullable=False)
+    # sha256 hex of the refresh token; nullable only until drop_legacy_session_columns.py has run
+    refresh_token_hash = Column(String(64), unique=True, nullable=True, index=True)
     device_info = Column(String(500), nullable=True)  # Browser, OS, device type
     ip_address = Column(String(45), nullable=True)  # IPv4 or IPv6
     user_agent = Column(Text, nullable=True)  # Full user agent string
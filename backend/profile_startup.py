@@ -0,0 +1,72 @@
+"""
+Startup import profiler.
+
+Imports a module in a fresh interpreter with `python -X importtime` and
+reports where the import time goes: the slowest modules by cumulative time
+and the totals per top-level package. Use it to check that a change doesn't
+pull a heavy dependency back into API or cron startup.
+
+Usage:
+  python profile_startup.py                       # the API (main)
+  python profile_startup.py send_expiry_warnings  # a cron script
+Options:
+  --top N        modules / packages to list (default 25)
+  --runs N       best of N fresh imports, to smooth out disk cache noise (default 3)
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+
+def import_times(module: str) -> List[Tuple[str, int, int]]:
+    """(module, self_us, cumulative_us) for every module imported by `module`"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"❌ import {module} failed:\n{result.stderr[-2000:]}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def package_totals(rows: List[Tuple[str, int, int]]) -> Dict[str, int]:
+    """Self time summed per top-level package"""
+    totals = defaultdict(int)
+    for name, self_us, _ in rows:
+        totals[name.split(".")[0]] += self_us
+    return totals
+
+
+def report(module: str, top: int, runs: int):
+    rows = min((import_times(module) for _ in range(max(runs, 1))), key=lambda r: sum(s for _, s, _ in r))
+    total_us = sum(self_us for _, self_us, _ in rows)
+    print(f"⏱️  import {module}: {total_us / 1000:.0f} ms, {len(rows)} modules (best of {runs})\n")
+
+    print(f"Slowest modules (cumulative ms, self ms):")
+    for name, self_us, cumulative_us in sorted(rows, key=lambda r: r[2], reverse=True)[:top]:
+        print(f"  {cumulative_us / 1000:8.1f} {self_us / 1000:8.1f}  {name}")
+
+    print(f"\nBy top-level package (ms, % of total):")
+    for package, self_us in sorted(package_totals(rows).items(), key=lambda p: p[1], reverse=True)[:top]:
+        print(f"  {self_us / 1000:8.1f} {self_us * 100 / total_us:5.1f}%  {package}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report import time per module")
+    parser.add_argument("module", nargs="?", default="main")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    report(args.module, args.top, args.runs)
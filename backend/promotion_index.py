@@ -0,0 +1,198 @@
+"""
+In-memory promotion index and atomic usage counters.
+
+Validation bursts during flash promos read promotion rules from a per-worker
+snapshot of the promotions table instead of querying MySQL every time. The
+snapshot is dropped on create/update/delete in this worker and reloaded at
+most every PROMOTION_INDEX_TTL_SECONDS so other workers pick changes up too.
+
+Usage limits are enforced where it matters - at purchase confirmation - with
+conditional UPDATEs, so a slightly stale usage_count in the snapshot can only
+make validation optimistic, never let a limit be exceeded.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import Promotion, PromotionStatus, PromotionType, PromotionUsage, Venue
+
+PROMOTION_INDEX_TTL_SECONDS = 15
+
+
+@dataclass(frozen=True)
+class PromotionRule:
+    """Immutable snapshot of a promotion plus its venue name"""
+    id: str
+    code: str
+    name: str
+    description: Optional[str]
+    type: PromotionType
+    value: Decimal
+    min_purchase_amount: Optional[Decimal]
+    max_discount_amount: Optional[Decimal]
+    usage_limit: Optional[int]
+    usage_count: int
+    per_user_limit: Optional[int]
+    venue_id: Optional[str]
+    venue_name: Optional[str]
+    valid_from: datetime
+    valid_until: datetime
+    status: PromotionStatus
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+    def check(self, purchase_amount: Decimal, venue_id: str, now: datetime) -> Optional[str]:
+        """Return the rejection message, or None if the rule applies (per-user limit checked separately)."""
+        if self.status != PromotionStatus.ACTIVE:
+            return "Promotion is not active"
+        if now < self.valid_from:
+            return "Promotion has not started yet"
+        if now > self.valid_until:
+            return "Promotion has expired"
+        if self.venue_id and self.venue_id != venue_id:
+            return "Promotion not valid for this venue"
+        if self.min_purchase_amount and purchase_amount < self.min_purchase_amount:
+            return f"Minimum purchase amount is ₹{self.min_purchase_amount}"
+        if self.usage_limit and self.usage_count >= self.usage_limit:
+            return "Promotion usage limit reached"
+        return None
+
+    def discount_for(self, purchase_amount: Decimal):
+        discount_amount = 0
+        if self.type == PromotionType.PERCENTAGE:
+            discount_amount = (purchase_amount * self.value) / 100
+            if self.max_discount_amount:
+                discount_amount = min(discount_amount, self.max_discount_amount)
+        elif self.type == PromotionType.FIXED_AMOUNT:
+            discount_amount = min(self.value, purchase_amount)
+        return discount_amount
+
+
+class PromotionIndex:
+    """Code -> PromotionRule map, loaded with one query"""
+
+    def __init__(self, ttl_seconds: float = PROMOTION_INDEX_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._rules: Optional[Dict[str, PromotionRule]] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._rules = None
+
+    def get(self, db: Session, code: str) -> Optional[PromotionRule]:
+        rules = self._rules
+        if rules is None or time.monotonic() - self._loaded_at > self.ttl_seconds:
+            rules = self._load(db)
+        return rules.get(code.upper())
+
+    def _load(self, db: Session) -> Dict[str, PromotionRule]:
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            if self._rules is not None and time.monotonic() - self._loaded_at <= self.ttl_seconds:
+                return self._rules
+            rows = db.query(Promotion, Venue.name).outerjoin(Venue, Promotion.venue_id == Venue.id).all()
+            rules = {
+                promo.code: PromotionRule(
+                    id=promo.id,
+                    code=promo.code,
+                    name=promo.name,
+                    description=promo.description,
+                    type=promo.type,
+                    value=promo.value,
+                    min_purchase_amount=promo.min_purchase_amount,
+                    max_discount_amount=promo.max_discount_amount,
+                    usage_limit=promo.usage_limit,
+                    usage_count=promo.usage_count,
+                    per_user_limit=promo.per_user_limit,
+                    venue_id=promo.venue_id,
+                    venue_name=venue_name,
+                    valid_from=promo.valid_from,
+                    valid_until=promo.valid_until,
+                    status=promo.status,
+                    created_at=promo.created_at,
+                    updated_at=promo.updated_at,
+                )
+                for promo, venue_name in rows
+            }
+            self._rules = rules
+            self._loaded_at = time.monotonic()
+            return rules
+
+
+promotion_index = PromotionIndex()
+
+
+def get_user_usage(db: Session, promotion_id: str, user_id: str) -> int:
+    """How many confirmed purchases this user has made with the promotion."""
+    count = db.query(PromotionUsage.use_count).filter(
+        PromotionUsage.promotion_id == promotion_id,
+        PromotionUsage.user_id == user_id
+    ).scalar()
+    return count or 0
+
+
+def claim_promotion_usage(db: Session, code: str, user_id: str) -> Tuple[bool, str]:
+    """
+    Atomically consume one use of a promotion for a user.
+
+    Must run inside the purchase confirmation transaction; the caller commits
+    or rolls back. Both counters are bumped with conditional UPDATEs so
+    concurrent confirmations can't overshoot usage_limit or per_user_limit.
+    A promotion deleted or renamed since the purchase was priced has nothing
+    left to count against, so the claim succeeds without touching counters.
+
+    Returns:
+        tuple: (claimed, error_message)
+    """
+    promo = db.query(Promotion.id, Promotion.per_user_limit).filter(Promotion.code == code.upper()).first()
+    if not promo:
+        return True, ""
+
+    claimed = db.execute(
+        update(Promotion)
+        .where(
+            Promotion.id == promo.id,
+            # usage_limit NULL or 0 means unlimited, as in validation
+            (Promotion.usage_limit.is_(None)) | (Promotion.usage_limit == 0)
+            | (Promotion.usage_count < Promotion.usage_limit)
+        )
+        .values(usage_count=Promotion.usage_count + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not claimed:
+        return False, "Promotion usage limit reached"
+
+    if not _increment_user_usage(db, promo.id, user_id, promo.per_user_limit):
+        return False, "You have reached the usage limit for this promotion"
+    return True, ""
+
+
+def _increment_user_usage(db: Session, promotion_id: str, user_id: str, per_user_limit: Optional[int]) -> bool:
+    stmt = update(PromotionUsage).where(
+        PromotionUsage.promotion_id == promotion_id,
+        PromotionUsage.user_id == user_id
+    )
+    if per_user_limit:
+        stmt = stmt.where(PromotionUsage.use_count < per_user_limit)
+    stmt = stmt.values(use_count=PromotionUsage.use_count + 1).execution_options(synchronize_session=False)
+
+    if db.execute(stmt).rowcount:
+        return True
+
+    # No row yet (or limit reached): try to create the counter
+    try:
+        with db.begin_nested():
+            db.add(PromotionUsage(promotion_id=promotion_id, user_id=user_id, use_count=1))
+        return True
+    except IntegrityError:
+        # Row already existed, or a concurrent confirmation just created it
+        return bool(db.execute(stmt).rowcount)
@@ -1,15 +1,33 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import func, or_, select
+from sqlalchemy.exc import IntegrityError
+from typing import List, Optional, Tuple
 from datetime import datetime, timedelta, date
-
-from database import get_db
-from models import User, Venue, Bottle, Purchase, PaymentStatus, Redemption, RedemptionStatus
-from auth import get_current_active_admin
+from decimal import Decimal
+import base64
+import csv
+import enum
+import io
+import json
+import zlib
+
+from database import get_db, SessionLocal
+from cache import cache, cached_endpoint
+from conditional import not_modified
+from promotion_index import promotion_index, get_user_usage
+from venue_rankings import get_venue_rankings, get_venue_rank
+from models import User, Venue, Bottle, Purchase, PaymentStatus, Redemption, RedemptionStatus, generate_uuid
+from auth import get_current_active_admin, invalidate_venue_name
+from sanitization import city_from_location
 from schemas import (
-    UserResponse, UserRoleUpdate, VenueCreate, VenueResponse, 
+    UserResponse, UserRoleUpdate, VenueCreate, VenueUpdate, VenueResponse, 
     BottleCreate, BottleResponse, BottleAdminResponse, BottleUpdate, VenueList,
+    BottleBulkItem, BottleBulkRequest, BottleBulkRowResult, BottleBulkResponse,
     PurchaseAdminResponse, PurchaseAdminList,
     RedemptionAdminResponse, RedemptionAdminList,
     BartenderResponse, BartenderList, BartenderCreate, BartenderUpdate,
@@ -40,6 +58,7 @@ router = APIRouter(
 )
 
 @router.get("/stats")
+@cached_endpoint("analytics:stats")
 def get_dashboard_stats(db: Session = Depends(get_db)):
     """Get global dashboard stats"""
     total_users = db.query(User).count()
@@ -104,11 +123,15 @@ def create_venue(venue: VenueCreate, db: Session = Depends(get_db), current_user
         is_open=venue.is_open,
         image_url=venue.image_url,
         contact_email=venue.contact_email,
-        contact_phone=venue.contact_phone
+        contact_phone=venue.contact_phone,
+        city=venue.city,
+        latitude=venue.latitude,
+        longitude=venue.longitude
     )
     db.add(db_venue)
     db.commit()
     db.refresh(db_venue)
+    cache.invalidate("analytics:")
     try:
         create_audit_log(db, current_user.id, current_user.name, "create", "venue", db_venue.id, f"Created venue: {db_venue.name}")
     except Exception:
@@ -118,7 +141,7 @@ def create_venue(venue: VenueCreate, db: Session = Depends(get_db), current_user
 @router.put("/venues/{venue_id}", response_model=VenueResponse)
 def update_venue(
     venue_id: str,
-    venue_update: VenueCreate, # Reusing Create schema for now, or create VenueUpdate
+    venue_update: VenueUpdate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_admin)
 ):
@@ -126,11 +149,16 @@ def update_venue(
     if not venue:
         raise HTTPException(status_code=404, detail="Venue not found")
     
-    for key, value in venue_update.dict().items():
+    changes = venue_update.model_dump(exclude_unset=True)
+    if "city" not in changes and changes.get("location", venue.location) != venue.location:
+        changes["city"] = city_from_location(changes["location"])
+    for key, value in changes.items():
         setattr(venue, key, value)
     
     db.commit()
     db.refresh(venue)
+    invalidate_venue_name(venue_id)
+    cache.invalidate("analytics:")
     try:
         create_audit_log(db, current_user.id, current_user.name, "update", "venue", venue_id, f"Updated venue: {venue.name}")
     except Exception:
@@ -150,6 +178,8 @@ def delete_venue(
     venue_name = venue.name
     db.delete(venue)
     db.commit()
+    invalidate_venue_name(venue_id)
+    cache.invalidate("analytics:")
     try:
         create_audit_log(db, current_user.id, current_user.name, "delete", "venue", venue_id, f"Deleted venue: {venue_name}")
     except Exception:
@@ -324,90 +354,377 @@ def delete_bottle(bottle_id: str, db: Session = Depends(get_db), current_user: U
     return {"message": "Bottle deleted successfully"}
 
 
+# ============ Bulk Bottle Operations ============
+
+BULK_BOTTLE_MAX_ROWS = 5000
+BULK_BOTTLE_COLUMNS = (
+    "venue_id", "brand", "name", "price", "volume_ml", "image_url",
+    "is_available", "stock_count", "category", "description"
+)
+BULK_BOTTLE_REQUIRED = ("venue_id", "brand", "name", "price", "volume_ml")
+
+# (item, parse_error) — exactly one of the two is set
+BulkRow = Tuple[Optional[BottleBulkItem], Optional[str]]
+
+
+def _format_validation_error(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in exc.errors()
+    )
+
+
+def _parse_bottle_bulk_csv(raw: bytes) -> List[BulkRow]:
+    """Parse a CSV upload into bulk rows. Empty cells are treated as "not provided"."""
+    try:
+        text = raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV must be UTF-8 encoded")
+
+    rows: List[BulkRow] = []
+    for record in csv.DictReader(io.StringIO(text)):
+        data = {
+            key.strip(): value.strip()
+            for key, value in record.items()
+            if key and isinstance(value, str) and value.strip() != ""
+        }
+        try:
+            rows.append((BottleBulkItem.model_validate(data), None))
+        except ValidationError as e:
+            rows.append((None, _format_validation_error(e)))
+    return rows
+
+
+def _apply_bottle_bulk(
+    db: Session,
+    rows: List[BulkRow],
+    operation: str,
+    all_or_nothing: bool,
+    current_user: User
+) -> BottleBulkResponse:
+    """Validate all rows with set-based lookups, then write them in one transaction."""
+    plan = [
+        (index, (item.op if item and item.op else operation), item, parse_error)
+        for index, (item, parse_error) in enumerate(rows)
+    ]
+
+    # One query each for referenced bottles, referenced venues and purchase counts
+    bottle_ids = {item.id for _, _, item, _ in plan if item and item.id}
+    existing = {}
+    if bottle_ids:
+        existing = dict(db.query(Bottle.id, Bottle.venue_id).filter(Bottle.id.in_(bottle_ids)).all())
+
+    venue_ids = {item.venue_id for _, _, item, _ in plan if item and item.venue_id}
+    venues = {}
+    if venue_ids:
+        venues = dict(db.query(Venue.id, Venue.name).filter(Venue.id.in_(venue_ids)).all())
+
+    delete_ids = {item.id for _, op, item, _ in plan if op == "delete" and item and item.id in existing}
+    purchase_counts = {}
+    if delete_ids:
+        purchase_counts = dict(
+            db.query(Purchase.bottle_id, func.count(Purchase.id))
+            .filter(Purchase.bottle_id.in_(delete_ids))
+            .group_by(Purchase.bottle_id)
+            .all()
+        )
+
+    results: List[BottleBulkRowResult] = []
+    inserts, updates, deletes = [], [], []
+    seen_ids = set()
+
+    for index, op, item, parse_error in plan:
+        if parse_error:
+            results.append(BottleBulkRowResult(index=index, op=op, status="error", error=parse_error))
+            continue
+
+        if op == "upsert":
+            op = "update" if item.id in existing else "create"
+
+        fields = item.dict(exclude_unset=True, exclude={"op", "id"})
+        error = None
+
+        if item.id and item.id in seen_ids:
+            error = "Bottle appears more than once in this batch"
+        elif op == "create":
+            missing = [f for f in BULK_BOTTLE_REQUIRED if fields.get(f) is None]
+            if missing:
+                error = f"Missing required fields: {', '.join(missing)}"
+            elif item.id and item.id in existing:
+                error = "Bottle already exists"
+            elif fields["venue_id"] not in venues:
+                error = "Venue not found"
+        elif op == "update":
+            if not item.id or item.id not in existing:
+                error = "Bottle not found"
+            elif not fields:
+                error = "No fields to update"
+            elif any(fields[f] is None for f in BULK_BOTTLE_REQUIRED + ("is_available",) if f in fields):
+                error = "Required fields cannot be null"
+            elif "venue_id" in fields and fields["venue_id"] not in venues:
+                error = "Venue not found"
+        elif op == "delete":
+            if not item.id or item.id not in existing:
+                error = "Bottle not found"
+            elif purchase_counts.get(item.id):
+                error = (
+                    f"Cannot delete bottle with {purchase_counts[item.id]} existing purchases. "
+                    "Consider marking as unavailable instead."
+                )
+
+        if error:
+            results.append(BottleBulkRowResult(index=index, op=op, status="error", id=item.id, error=error))
+            continue
+
+        if op == "create":
+            mapping = {column: fields.get(column) for column in BULK_BOTTLE_COLUMNS}
+            mapping["id"] = item.id or generate_uuid()
+            if mapping["is_available"] is None:
+                mapping["is_available"] = True
+            inserts.append(mapping)
+            seen_ids.add(mapping["id"])
+            results.append(BottleBulkRowResult(index=index, op=op, status="created", id=mapping["id"]))
+            continue
+
+        seen_ids.add(item.id)
+        if op == "update":
+            updates.append({"id": item.id, **fields})
+            results.append(BottleBulkRowResult(index=index, op=op, status="updated", id=item.id))
+        else:
+            deletes.append(item.id)
+            results.append(BottleBulkRowResult(index=index, op=op, status="deleted", id=item.id))
+
+    failed = sum(1 for r in results if r.status == "error")
+    if failed and all_or_nothing:
+        for r in results:
+            if r.status != "error":
+                r.status = "skipped"
+        return BottleBulkResponse(results=results, created=0, updated=0, deleted=0, failed=failed)
+
+    try:
+        if inserts:
+            db.bulk_insert_mappings(Bottle, inserts)
+        if updates:
+            db.bulk_update_mappings(Bottle, updates)
+        if deletes:
+            db.query(Bottle).filter(Bottle.id.in_(deletes)).delete(synchronize_session=False)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Bulk operation conflicts with existing data; no rows were written"
+        )
+
+    try:
+        create_audit_log(
+            db, current_user.id, current_user.name, "bulk", "bottle", None,
+            f"Bulk bottle operation: {len(inserts)} created, {len(updates)} updated, "
+            f"{len(deletes)} deleted, {failed} failed"
+        )
+    except Exception:
+        pass
+
+    return BottleBulkResponse(
+        results=results,
+        created=len(inserts),
+        updated=len(updates),
+        deleted=len(deletes),
+        failed=failed
+    )
+
+
+@router.post("/bottles/bulk", response_model=BottleBulkResponse)
+async def bulk_bottles(
+    request: Request,
+    operation: str = Query("create", pattern="^(create|update|upsert|delete)$"),
+    all_or_nothing: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_admin)
+):
+    """
+    Create, update, upsert or delete many bottles in one request.
+
+    Accepts a JSON ``BottleBulkRequest`` body, or a ``text/csv`` body whose header
+    row names bottle columns (plus optional ``op`` and ``id``). For CSV uploads the
+    operation and all_or_nothing flags are taken from the query string.
+    Rows are validated together and written in a single transaction; each row
+    gets its own result entry.
+    """
+    raw = await request.body()
+
+    if "csv" in request.headers.get("content-type", ""):
+        rows = _parse_bottle_bulk_csv(raw)
+    else:
+        try:
+            payload = BottleBulkRequest.model_validate_json(raw)
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+        operation = payload.operation
+        all_or_nothing = payload.all_or_nothing
+        rows = [(item, None) for item in payload.items]
+
+    if not rows:
+        raise HTTPException(status_code=400, detail="No rows provided")
+    if len(rows) > BULK_BOTTLE_MAX_ROWS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Bulk operations are limited to {BULK_BOTTLE_MAX_ROWS} rows"
+        )
+
+    # Validation and writes are blocking DB work — keep them off the event loop
+    return await run_in_threadpool(_apply_bottle_bulk, db, rows, operation, all_or_nothing, current_user)
+
+
 # ============ Purchase Management ============
 
+# Admin listing columns, selected directly so rows never load full entities
+StaffUser = aliased(User)
+
+PURCHASE_ADMIN_COLUMNS = {
+    "id": Purchase.id,
+    "user_id": Purchase.user_id,
+    "user_name": User.name,
+    "user_email": User.email,
+    "bottle_id": Purchase.bottle_id,
+    "bottle_name": Bottle.name,
+    "bottle_brand": Bottle.brand,
+    "venue_id": Purchase.venue_id,
+    "venue_name": Venue.name,
+    "total_ml": Purchase.total_ml,
+    "remaining_ml": Purchase.remaining_ml,
+    "purchase_price": Purchase.purchase_price,
+    "payment_status": Purchase.payment_status,
+    "payment_method": Purchase.payment_method,
+    "purchased_at": Purchase.purchased_at,
+    "created_at": Purchase.created_at,
+}
+
+REDEMPTION_ADMIN_COLUMNS = {
+    "id": Redemption.id,
+    "purchase_id": Redemption.purchase_id,
+    "user_id": Redemption.user_id,
+    "user_name": User.name,
+    "user_email": User.email,
+    "bottle_id": Purchase.bottle_id,
+    "bottle_name": Bottle.name,
+    "bottle_brand": Bottle.brand,
+    "venue_id": Redemption.venue_id,
+    "venue_name": Venue.name,
+    "peg_size_ml": Redemption.peg_size_ml,
+    "status": Redemption.status,
+    "qr_expires_at": Redemption.qr_expires_at,
+    "redeemed_at": Redemption.redeemed_at,
+    "redeemed_by_staff_id": Redemption.redeemed_by_staff_id,
+    "redeemed_by_staff_name": StaffUser.name,
+    "created_at": Redemption.created_at,
+}
+
+
+def _parse_fields(fields: Optional[str], columns: dict) -> Optional[List[str]]:
+    """Column names requested with ?fields=a,b,c (None = all). id is always included."""
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in columns]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    if "id" not in names:
+        names.insert(0, "id")
+    return names
+
+
+def _purchase_rows_query(db: Session, names: List[str]):
+    columns = [PURCHASE_ADMIN_COLUMNS[name].label(name) for name in names]
+    return db.query(*columns).select_from(Purchase) \
+        .join(User, Purchase.user_id == User.id) \
+        .join(Bottle, Purchase.bottle_id == Bottle.id) \
+        .join(Venue, Purchase.venue_id == Venue.id)
+
+
+def _redemption_rows_query(db: Session, names: List[str]):
+    columns = [REDEMPTION_ADMIN_COLUMNS[name].label(name) for name in names]
+    return db.query(*columns).select_from(Redemption) \
+        .join(User, Redemption.user_id == User.id) \
+        .join(Purchase, Redemption.purchase_id == Purchase.id) \
+        .join(Bottle, Purchase.bottle_id == Bottle.id) \
+        .join(Venue, Redemption.venue_id == Venue.id) \
+        .outerjoin(StaffUser, Redemption.redeemed_by_staff_id == StaffUser.id)
+
+
+def _projected_list(key: str, model, names: List[str], rows, total: int, response: Optional[Response] = None):
+    """
+    Partial rows for ?fields=. They can't satisfy the full response model, so
+    they're serialized with it (same JSON types) and returned directly.
+    """
+    include = set(names)
+    items = [model.model_construct(**row._mapping).model_dump(mode="json", include=include) for row in rows]
+    # Carry over the ETag/Cache-Control set by not_modified()
+    headers = {k: v for k, v in response.headers.items() if k in ("etag", "cache-control")} if response else None
+    return JSONResponse(content={key: items, "total": total}, headers=headers)
+
+
 @router.get("/purchases", response_model=PurchaseAdminList)
 def get_purchases(
+    request: Request,
+    response: Response,
     status: Optional[str] = None,
     venue_id: Optional[str] = None,
     user_id: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return (default: all)"),
     skip: int = 0,
     limit: int = 100,
     db: Session = Depends(get_db)
 ):
     """List all purchases with filters"""
-    query = db.query(Purchase).join(User).join(Bottle).join(Venue)
+    names = _parse_fields(fields, PURCHASE_ADMIN_COLUMNS)
+    filters = []
     
     # Apply filters
     if status:
         try:
             status_enum = PaymentStatus(status)
-            query = query.filter(Purchase.payment_status == status_enum)
+            filters.append(Purchase.payment_status == status_enum)
         except ValueError:
             pass  # Invalid status, ignore filter
     
     if venue_id:
-        query = query.filter(Purchase.venue_id == venue_id)
+        filters.append(Purchase.venue_id == venue_id)
     
     if user_id:
-        query = query.filter(Purchase.user_id == user_id)
-    
-    # Order by most recent first
-    query = query.order_by(Purchase.created_at.desc())
-    
-    total = query.count()
-    purchases = query.offset(skip).limit(limit).all()
-    
-    # Transform to admin response
-    result = []
-    for purchase in purchases:
-        result.append(PurchaseAdminResponse(
-            id=purchase.id,
-            user_id=purchase.user_id,
-            user_name=purchase.user.name,
-            user_email=purchase.user.email,
-            bottle_id=purchase.bottle_id,
-            bottle_name=purchase.bottle.name,
-            bottle_brand=purchase.bottle.brand,
-            venue_id=purchase.venue_id,
-            venue_name=purchase.venue.name,
-            total_ml=purchase.total_ml,
-            remaining_ml=purchase.remaining_ml,
-            purchase_price=purchase.purchase_price,
-            payment_status=purchase.payment_status,
-            payment_method=purchase.payment_method,
-            purchased_at=purchase.purchased_at,
-            created_at=purchase.created_at
-        ))
-    
-    return PurchaseAdminList(purchases=result, total=total)
+        filters.append(Purchase.user_id == user_id)
+    
+    # Content version: the filtered purchases plus the joined names shown per row
+    version = db.query(
+        func.count(Purchase.id),
+        func.max(Purchase.updated_at),
+        select(func.max(User.updated_at)).scalar_subquery(),
+        select(func.max(Bottle.updated_at)).scalar_subquery(),
+        select(func.max(Venue.updated_at)).scalar_subquery(),
+    ).filter(*filters).one()
+    cached = not_modified(request, response, *version, fields)
+    if cached:
+        return cached
+    
+    # The version count doubles as the total (every purchase has its user, bottle and venue)
+    total = version[0]
+    rows = _purchase_rows_query(db, names or list(PURCHASE_ADMIN_COLUMNS)) \
+        .filter(*filters) \
+        .order_by(Purchase.created_at.desc()) \
+        .offset(skip).limit(limit).all()
+    
+    if names:
+        return _projected_list("purchases", PurchaseAdminResponse, names, rows, total, response)
+    return PurchaseAdminList(purchases=[PurchaseAdminResponse(**row._mapping) for row in rows], total=total)
 
 
 @router.get("/purchases/{purchase_id}", response_model=PurchaseAdminResponse)
 def get_purchase(purchase_id: str, db: Session = Depends(get_db)):
     """Get purchase details"""
-    purchase = db.query(Purchase).filter(Purchase.id == purchase_id).first()
-    if not purchase:
+    row = _purchase_rows_query(db, list(PURCHASE_ADMIN_COLUMNS)).filter(Purchase.id == purchase_id).first()
+    if not row:
         raise HTTPException(status_code=404, detail="Purchase not found")
     
-    return PurchaseAdminResponse(
-        id=purchase.id,
-        user_id=purchase.user_id,
-        user_name=purchase.user.name,
-        user_email=purchase.user.email,
-        bottle_id=purchase.bottle_id,
-        bottle_name=purchase.bottle.name,
-        bottle_brand=purchase.bottle.brand,
-        venue_id=purchase.venue_id,
-        venue_name=purchase.venue.name,
-        total_ml=purchase.total_ml,
-        remaining_ml=purchase.remaining_ml,
-        purchase_price=purchase.purchase_price,
-        payment_status=purchase.payment_status,
-        payment_method=purchase.payment_method,
-        purchased_at=purchase.purchased_at,
-        created_at=purchase.created_at
-    )
+    return PurchaseAdminResponse(**row._mapping)
 
 
 # ============ Redemption Management ============
@@ -417,103 +734,90 @@ def get_redemptions(
     status: Optional[str] = None,
     venue_id: Optional[str] = None,
     user_id: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return (default: all)"),
     skip: int = 0,
     limit: int = 100,
     db: Session = Depends(get_db)
 ):
     """List all redemptions with filters"""
-    query = db.query(Redemption).join(User).join(Purchase).join(Bottle).join(Venue)
+    names = _parse_fields(fields, REDEMPTION_ADMIN_COLUMNS)
+    filters = []
     
     # Apply filters
     if status:
         try:
             status_enum = RedemptionStatus(status)
-            query = query.filter(Redemption.status == status_enum)
+            filters.append(Redemption.status == status_enum)
         except ValueError:
             pass  # Invalid status, ignore filter
     
     if venue_id:
-        query = query.filter(Redemption.venue_id == venue_id)
+        filters.append(Redemption.venue_id == venue_id)
     
     if user_id:
-        query = query.filter(Redemption.user_id == user_id)
+        filters.append(Redemption.user_id == user_id)
     
-    # Order by most recent first
-    query = query.order_by(Redemption.created_at.desc())
-    
-    total = query.count()
-    redemptions = query.offset(skip).limit(limit).all()
-    
-    # Transform to admin response
-    result = []
-    for redemption in redemptions:
-        # Get bartender name if redeemed
-        bartender_name = None
-        if redemption.redeemed_by_staff_id:
-            bartender = db.query(User).filter(User.id == redemption.redeemed_by_staff_id).first()
-            if bartender:
-                bartender_name = bartender.name
-        
-        result.append(RedemptionAdminResponse(
-            id=redemption.id,
-            purchase_id=redemption.purchase_id,
-            user_id=redemption.user_id,
-            user_name=redemption.user.name,
-            user_email=redemption.user.email,
-            bottle_id=redemption.purchase.bottle_id,
-            bottle_name=redemption.purchase.bottle.name,
-            bottle_brand=redemption.purchase.bottle.brand,
-            venue_id=redemption.venue_id,
-            venue_name=redemption.venue.name,
-            peg_size_ml=redemption.peg_size_ml,
-            status=redemption.status,
-            qr_expires_at=redemption.qr_expires_at,
-            redeemed_at=redemption.redeemed_at,
-            redeemed_by_staff_id=redemption.redeemed_by_staff_id,
-            redeemed_by_staff_name=bartender_name,
-            created_at=redemption.created_at
-        ))
+    total = db.query(func.count(Redemption.id)).filter(*filters).scalar()
+    rows = _redemption_rows_query(db, names or list(REDEMPTION_ADMIN_COLUMNS)) \
+        .filter(*filters) \
+        .order_by(Redemption.created_at.desc()) \
+        .offset(skip).limit(limit).all()
     
-    return RedemptionAdminList(redemptions=result, total=total)
+    if names:
+        return _projected_list("redemptions", RedemptionAdminResponse, names, rows, total)
+    return RedemptionAdminList(redemptions=[RedemptionAdminResponse(**row._mapping) for row in rows], total=total)
 
 
 @router.get("/redemptions/{redemption_id}", response_model=RedemptionAdminResponse)
 def get_redemption(redemption_id: str, db: Session = Depends(get_db)):
     """Get redemption details"""
-    redemption = db.query(Redemption).filter(Redemption.id == redemption_id).first()
-    if not redemption:
+    row = _redemption_rows_query(db, list(REDEMPTION_ADMIN_COLUMNS)).filter(Redemption.id == redemption_id).first()
+    if not row:
         raise HTTPException(status_code=404, detail="Redemption not found")
     
-    # Get bartender name if redeemed
-    bartender_name = None
-    if redemption.redeemed_by_staff_id:
-        bartender = db.query(User).filter(User.id == redemption.redeemed_by_staff_id).first()
-        if bartender:
-            bartender_name = bartender.name
-    
-    return RedemptionAdminResponse(
-        id=redemption.id,
-        purchase_id=redemption.purchase_id,
-        user_id=redemption.user_id,
-        user_name=redemption.user.name,
-        user_email=redemption.user.email,
-        bottle_id=redemption.purchase.bottle_id,
-        bottle_name=redemption.purchase.bottle.name,
-        bottle_brand=redemption.purchase.bottle.brand,
-        venue_id=redemption.venue_id,
-        venue_name=redemption.venue.name,
-        peg_size_ml=redemption.peg_size_ml,
-        status=redemption.status,
-        qr_expires_at=redemption.qr_expires_at,
-        redeemed_at=redemption.redeemed_at,
-        redeemed_by_staff_id=redemption.redeemed_by_staff_id,
-        redeemed_by_staff_name=bartender_name,
-        created_at=redemption.created_at
-    )
+    return RedemptionAdminResponse(**row._mapping)
 
 
 # ============ Bartender Management ============
 
+def _bartender_rows_query(db: Session):
+    """Bartender response columns with the venue name joined in"""
+    return db.query(
+        User.id, User.name, User.email, User.phone, User.venue_id,
+        Venue.name.label("venue_name"), User.created_at
+    ).outerjoin(Venue, User.venue_id == Venue.id).filter(User.role == "bartender")
+
+
+def _contact_conflicts(db: Session, email: Optional[str], phone: Optional[str], exclude_id: Optional[str] = None) -> set:
+    """Which of email/phone already belong to another user, checked with one query"""
+    conditions = []
+    if email:
+        conditions.append(User.email == email)
+    if phone:
+        conditions.append(User.phone == phone)
+    if not conditions:
+        return set()
+    query = db.query(User.email, User.phone).filter(or_(*conditions))
+    if exclude_id:
+        query = query.filter(User.id != exclude_id)
+    conflicts = set()
+    for row in query.limit(2).all():
+        if email and row.email == email:
+            conflicts.add("email")
+        if phone and row.phone == phone:
+            conflicts.add("phone")
+    return conflicts
+
+
+def _contact_conflict_from_integrity_error(e: IntegrityError) -> Optional[str]:
+    """Map a unique-constraint violation on users to the offending field"""
+    message = str(e.orig).lower()
+    for field in ("email", "phone"):
+        if field in message:
+            return field
+    return None
+
+
 @router.get("/bartenders", response_model=BartenderList)
 def get_bartenders(
     venue_id: Optional[str] = None,
@@ -522,65 +826,30 @@ def get_bartenders(
     db: Session = Depends(get_db)
 ):
     """List all bartenders with venue information"""
-    query = db.query(User).filter(User.role == "bartender")
+    filters = [User.role == "bartender"]
     
     if venue_id:
-        query = query.filter(User.venue_id == venue_id)
+        filters.append(User.venue_id == venue_id)
     
-    # Order by most recent first
-    query = query.order_by(User.created_at.desc())
-    
-    total = query.count()
-    bartenders = query.offset(skip).limit(limit).all()
+    total = db.query(func.count(User.id)).filter(*filters).scalar()
     
-    # Transform to include venue name
-    result = []
-    for bartender in bartenders:
-        venue_name = None
-        if bartender.venue_id:
-            venue = db.query(Venue).filter(Venue.id == bartender.venue_id).first()
-            if venue:
-                venue_name = venue.name
-        
-        result.append(BartenderResponse(
-            id=bartender.id,
-            name=bartender.name,
-            email=bartender.email,
-            phone=bartender.phone,
-            venue_id=bartender.venue_id,
-            venue_name=venue_name,
-            created_at=bartender.created_at
-        ))
+    # Order by most recent first
+    rows = _bartender_rows_query(db).filter(*filters) \
+        .order_by(User.created_at.desc()) \
+        .offset(skip).limit(limit).all()
     
-    return BartenderList(bartenders=result, total=total)
+    return BartenderList(bartenders=[BartenderResponse(**row._mapping) for row in rows], total=total)
 
 
 @router.get("/bartenders/{bartender_id}", response_model=BartenderResponse)
 def get_bartender(bartender_id: str, db: Session = Depends(get_db)):
     """Get bartender details"""
-    bartender = db.query(User).filter(
-        User.id == bartender_id,
-        User.role == "bartender"
-    ).first()
+    row = _bartender_rows_query(db).filter(User.id == bartender_id).first()
     
-    if not bartender:
+    if not row:
         raise HTTPException(status_code=404, detail="Bartender not found")
     
-    venue_name = None
-    if bartender.venue_id:
-        venue = db.query(Venue).filter(Venue.id == bartender.venue_id).first()
-        if venue:
-            venue_name = venue.name
-    
-    return BartenderResponse(
-        id=bartender.id,
-        name=bartender.name,
-        email=bartender.email,
-        phone=bartender.phone,
-        venue_id=bartender.venue_id,
-        venue_name=venue_name,
-        created_at=bartender.created_at
-    )
+    return BartenderResponse(**row._mapping)
 
 
 @router.post("/bartenders", response_model=BartenderResponse)
@@ -601,19 +870,15 @@ def create_bartender(
         )
     
     # Check if email or phone already exists
-    if bartender.email:
-        existing = db.query(User).filter(User.email == bartender.email).first()
-        if existing:
-            raise HTTPException(status_code=400, detail="Email already registered")
-    
-    if bartender.phone:
-        existing = db.query(User).filter(User.phone == bartender.phone).first()
-        if existing:
-            raise HTTPException(status_code=400, detail="Phone already registered")
+    conflicts = _contact_conflicts(db, bartender.email, bartender.phone)
+    if "email" in conflicts:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    if "phone" in conflicts:
+        raise HTTPException(status_code=400, detail="Phone already registered")
     
     # Verify venue exists
-    venue = db.query(Venue).filter(Venue.id == bartender.venue_id).first()
-    if not venue:
+    venue_name = db.query(Venue.name).filter(Venue.id == bartender.venue_id).scalar()
+    if venue_name is None:
         raise HTTPException(status_code=404, detail="Venue not found")
     
     # Create bartender user
@@ -627,10 +892,16 @@ def create_bartender(
     )
     
     db.add(db_bartender)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError as e:
+        # A concurrent signup took the email/phone after our check
+        db.rollback()
+        field = _contact_conflict_from_integrity_error(e)
+        raise HTTPException(status_code=400, detail=f"{field.capitalize()} already registered" if field else "Bartender conflicts with an existing user")
     db.refresh(db_bartender)
     try:
-        create_audit_log(db, current_user.id, current_user.name, "create", "bartender", db_bartender.id, f"Created bartender: {db_bartender.name} at {venue.name}")
+        create_audit_log(db, current_user.id, current_user.name, "create", "bartender", db_bartender.id, f"Created bartender: {db_bartender.name} at {venue_name}")
     except Exception:
         pass
     
@@ -640,7 +911,7 @@ def create_bartender(
         email=db_bartender.email,
         phone=db_bartender.phone,
         venue_id=db_bartender.venue_id,
-        venue_name=venue.name,
+        venue_name=venue_name,
         created_at=db_bartender.created_at
     )
 
@@ -665,54 +936,36 @@ def update_bartender(
     update_data = bartender_update.dict(exclude_unset=True)
     
     # Check for duplicate email/phone if being updated
-    if 'email' in update_data and update_data['email']:
-        existing = db.query(User).filter(
-            User.email == update_data['email'],
-            User.id != bartender_id
-        ).first()
-        if existing:
-            raise HTTPException(status_code=400, detail="Email already in use")
-    
-    if 'phone' in update_data and update_data['phone']:
-        existing = db.query(User).filter(
-            User.phone == update_data['phone'],
-            User.id != bartender_id
-        ).first()
-        if existing:
-            raise HTTPException(status_code=400, detail="Phone already in use")
+    conflicts = _contact_conflicts(db, update_data.get('email'), update_data.get('phone'), exclude_id=bartender_id)
+    if "email" in conflicts:
+        raise HTTPException(status_code=400, detail="Email already in use")
+    if "phone" in conflicts:
+        raise HTTPException(status_code=400, detail="Phone already in use")
     
     # Verify venue exists if being updated
     if 'venue_id' in update_data and update_data['venue_id']:
-        venue = db.query(Venue).filter(Venue.id == update_data['venue_id']).first()
+        venue = db.query(Venue.id).filter(Venue.id == update_data['venue_id']).first()
         if not venue:
             raise HTTPException(status_code=404, detail="Venue not found")
     
     for key, value in update_data.items():
         setattr(bartender, key, value)
     
-    db.commit()
-    db.refresh(bartender)
+    try:
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        field = _contact_conflict_from_integrity_error(e)
+        raise HTTPException(status_code=400, detail=f"{field.capitalize()} already in use" if field else "Update conflicts with an existing user")
     
-    venue_name = None
-    if bartender.venue_id:
-        venue = db.query(Venue).filter(Venue.id == bartender.venue_id).first()
-        if venue:
-            venue_name = venue.name
+    row = _bartender_rows_query(db).filter(User.id == bartender_id).one()
     
     try:
-        create_audit_log(db, current_user.id, current_user.name, "update", "bartender", bartender_id, f"Updated bartender: {bartender.name}")
+        create_audit_log(db, current_user.id, current_user.name, "update", "bartender", bartender_id, f"Updated bartender: {row.name}")
     except Exception:
         pass
 
-    return BartenderResponse(
-        id=bartender.id,
-        name=bartender.name,
-        email=bartender.email,
-        phone=bartender.phone,
-        venue_id=bartender.venue_id,
-        venue_name=venue_name,
-        created_at=bartender.created_at
-    )
+    return BartenderResponse(**row._mapping)
 
 
 @router.delete("/bartenders/{bartender_id}")
@@ -750,6 +1003,7 @@ def delete_bartender(bartender_id: str, db: Session = Depends(get_db), current_u
 # ============ Analytics Endpoints ============
 
 @router.get("/analytics/revenue", response_model=RevenueAnalytics)
+@cached_endpoint("analytics:revenue")
 def get_revenue_analytics(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
@@ -858,6 +1112,7 @@ def get_revenue_analytics(
 
 
 @router.get("/analytics/sales", response_model=SalesAnalytics)
+@cached_endpoint("analytics:sales")
 def get_sales_analytics(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
@@ -978,6 +1233,7 @@ def get_sales_analytics(
 
 
 @router.get("/analytics/redemptions", response_model=RedemptionAnalytics)
+@cached_endpoint("analytics:redemptions")
 def get_redemption_analytics(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
@@ -1066,6 +1322,7 @@ def get_redemption_analytics(
 
 
 @router.get("/analytics/users", response_model=UserAnalytics)
+@cached_endpoint("analytics:users")
 def get_user_analytics(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
@@ -1156,7 +1413,11 @@ def get_revenue_report(
     venue_id: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """Generate detailed revenue report"""
+    """Generate detailed revenue report
+
+    Returns every matching purchase inline; use /exports/purchases for
+    month-end or larger ranges.
+    """
     
     # Parse dates
     if start_date:
@@ -1177,7 +1438,7 @@ def get_revenue_report(
         Bottle.brand.label('bottle_brand'),
         Purchase.purchase_price,
         Purchase.payment_method
-    ).join(Venue).join(Bottle).filter(
+    ).select_from(Purchase).join(Venue).join(Bottle).filter(
         Purchase.payment_status == PaymentStatus.CONFIRMED,
         Purchase.purchased_at >= start,
         Purchase.purchased_at <= end
@@ -1186,6 +1447,19 @@ def get_revenue_report(
     if venue_id:
         query = query.filter(Purchase.venue_id == venue_id)
     
+    # Totals come from SQL rather than summing the item list in Python
+    totals_query = db.query(
+        func.count(Purchase.id).label('transactions'),
+        func.sum(Purchase.purchase_price).label('revenue')
+    ).filter(
+        Purchase.payment_status == PaymentStatus.CONFIRMED,
+        Purchase.purchased_at >= start,
+        Purchase.purchased_at <= end
+    )
+    if venue_id:
+        totals_query = totals_query.filter(Purchase.venue_id == venue_id)
+    totals = totals_query.one()
+    
     purchases = query.order_by(Purchase.purchased_at.desc()).all()
     
     # Build report items
@@ -1202,14 +1476,10 @@ def get_revenue_report(
             payment_method=p.payment_method.value if p.payment_method else None
         ))
     
-    # Calculate totals
-    total_revenue = sum(item.total_revenue for item in items)
-    total_transactions = len(items)
-    
     return RevenueReport(
         items=items,
-        total_revenue=total_revenue,
-        total_transactions=total_transactions,
+        total_revenue=totals.revenue or 0,
+        total_transactions=totals.transactions or 0,
         start_date=str(start.date()),
         end_date=str(end.date())
     )
@@ -1430,15 +1700,210 @@ def get_user_activity_report(
     )
 
 
+# ============ Export Endpoints ============
+
+EXPORT_BATCH_SIZE = 1000
+
+
+def _export_cell(value):
+    """Convert a DB value to a CSV/JSON-friendly scalar."""
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _export_purchases_query(start: datetime, end: datetime, venue_id: Optional[str], status_filter: PaymentStatus):
+    """Row and totals statements for the purchases export."""
+    # Confirmed purchases are dated by payment time; pending/failed ones only have created_at
+    date_column = Purchase.purchased_at if status_filter == PaymentStatus.CONFIRMED else Purchase.created_at
+    filters = [
+        Purchase.payment_status == status_filter,
+        date_column >= start,
+        date_column < end
+    ]
+    if venue_id:
+        filters.append(Purchase.venue_id == venue_id)
+
+    rows = select(
+        Purchase.id.label('purchase_id'),
+        Purchase.purchased_at,
+        Purchase.created_at,
+        Venue.name.label('venue_name'),
+        Bottle.brand.label('bottle_brand'),
+        Bottle.name.label('bottle_name'),
+        Purchase.user_id,
+        Purchase.total_ml,
+        Purchase.purchase_price,
+        Purchase.discount_amount,
+        Purchase.promotion_code,
+        Purchase.payment_method,
+        Purchase.payment_status
+    ).join(Venue, Purchase.venue_id == Venue.id).join(
+        Bottle, Purchase.bottle_id == Bottle.id
+    ).where(*filters).order_by(date_column)
+
+    totals = select(
+        func.count(Purchase.id),
+        func.sum(Purchase.purchase_price)
+    ).where(*filters)
+
+    return rows, totals
+
+
+def _export_redemptions_query(start: datetime, end: datetime, venue_id: Optional[str], status_filter: Optional[RedemptionStatus]):
+    """Row and totals statements for the redemptions export."""
+    filters = [
+        Redemption.created_at >= start,
+        Redemption.created_at < end
+    ]
+    if status_filter:
+        filters.append(Redemption.status == status_filter)
+    if venue_id:
+        filters.append(Redemption.venue_id == venue_id)
+
+    rows = select(
+        Redemption.id.label('redemption_id'),
+        Redemption.purchase_id,
+        Redemption.created_at,
+        Redemption.redeemed_at,
+        Redemption.status,
+        Venue.name.label('venue_name'),
+        Bottle.brand.label('bottle_brand'),
+        Bottle.name.label('bottle_name'),
+        Redemption.user_id,
+        Redemption.peg_size_ml,
+        Redemption.remaining_ml_after,
+        Redemption.redeemed_by_staff_id
+    ).join(Purchase, Redemption.purchase_id == Purchase.id).join(
+        Bottle, Purchase.bottle_id == Bottle.id
+    ).join(Venue, Redemption.venue_id == Venue.id).where(*filters).order_by(Redemption.created_at)
+
+    totals = select(
+        func.count(Redemption.id),
+        func.sum(Redemption.peg_size_ml)
+    ).where(*filters)
+
+    return rows, totals
+
+
+def _iter_export(stmt, fields: List[str], fmt: str, compress: bool):
+    """
+    Stream rows from a server-side cursor as CSV or NDJSON, optionally gzipped.
+    Memory stays bounded by EXPORT_BATCH_SIZE regardless of the date range.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 -> gzip container
+
+    def encode(text: str) -> bytes:
+        data = text.encode("utf-8")
+        return compressor.compress(data) if compressor else data
+
+    # Own session: the response body is produced after the request-scoped session is released
+    db = SessionLocal()
+    try:
+        if fmt == "csv":
+            header = io.StringIO()
+            csv.writer(header).writerow(fields)
+            yield encode(header.getvalue())
+
+        result = db.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for partition in result.partitions():
+            buffer = io.StringIO()
+            if fmt == "csv":
+                writer = csv.writer(buffer)
+                for row in partition:
+                    writer.writerow(["" if v is None else _export_cell(v) for v in row])
+            else:
+                for row in partition:
+                    buffer.write(json.dumps({k: _export_cell(v) for k, v in zip(fields, row)}))
+                    buffer.write("\n")
+            chunk = encode(buffer.getvalue())
+            if chunk:
+                yield chunk
+
+        if compressor:
+            yield compressor.flush()
+    finally:
+        db.close()
+
+
+@router.get("/exports/{dataset}")
+def export_dataset(
+    dataset: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    venue_id: Optional[str] = None,
+    status_filter: Optional[str] = Query(None, alias="status"),
+    fmt: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+    compress: bool = Query(False, alias="gzip"),
+    db: Session = Depends(get_db)
+):
+    """
+    Stream purchases or redemptions for accounting as CSV or NDJSON.
+
+    Dates are inclusive (YYYY-MM-DD). Purchases default to confirmed ones;
+    redemptions default to all statuses. Row count and totals are computed
+    in SQL up front and returned in X-Export-* headers.
+    """
+    if start_date:
+        start = datetime.strptime(start_date, "%Y-%m-%d")
+    else:
+        start = datetime.now() - timedelta(days=30)
+
+    if end_date:
+        last_day = datetime.strptime(end_date, "%Y-%m-%d")
+        end = last_day + timedelta(days=1)  # Exclusive upper bound
+    else:
+        last_day = end = datetime.now()
+
+    try:
+        if dataset == "purchases":
+            payment_status = PaymentStatus(status_filter) if status_filter else PaymentStatus.CONFIRMED
+            stmt, totals_stmt = _export_purchases_query(start, end, venue_id, payment_status)
+            total_header = "X-Export-Total-Amount"
+        elif dataset == "redemptions":
+            redemption_status = RedemptionStatus(status_filter) if status_filter else None
+            stmt, totals_stmt = _export_redemptions_query(start, end, venue_id, redemption_status)
+            total_header = "X-Export-Total-Ml"
+        else:
+            raise HTTPException(status_code=404, detail="Unknown export dataset")
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid status: {status_filter}")
+
+    row_count, total = db.execute(totals_stmt).one()
+    fields = [column.name for column in stmt.selected_columns]
+
+    filename = f"{dataset}_{start.date()}_{last_day.date()}.{fmt}"
+    if compress:
+        filename += ".gz"
+        media_type = "application/gzip"
+    else:
+        media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+
+    return StreamingResponse(
+        _iter_export(stmt, fields, fmt, compress),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Export-Row-Count": str(row_count or 0),
+            total_header: str(total or 0)
+        }
+    )
+
+
 # ============ Venue Analytics Endpoints ============
 
 @router.get("/analytics/venues/comparison", response_model=VenuePerformanceComparison)
+@cached_endpoint("analytics:venue_comparison")
 def get_venue_comparison(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """Get venue performance comparison - OPTIMIZED"""
+    """Get venue performance comparison"""
     from schemas import VenuePerformanceComparison, VenuePerformanceMetrics, VenueComparisonItem
     
     # Parse dates
@@ -1452,84 +1917,14 @@ def get_venue_comparison(
     else:
         end = datetime.now()
     
-    # Get all venues with aggregated data in fewer queries
-    venues = db.query(Venue).all()
-    total_venues = len(venues)
-    
-    # Get all purchase data in one query
-    purchase_data = db.query(
-        Purchase.venue_id,
-        func.sum(Purchase.purchase_price).label('total_revenue'),
-        func.count(Purchase.id).label('total_bottles_sold'),
-        func.count(func.distinct(Purchase.user_id)).label('total_customers')
-    ).filter(
-        Purchase.payment_status == PaymentStatus.CONFIRMED
-    ).group_by(Purchase.venue_id).all()
-    
-    # Get redemption data in one query
-    redemption_data = db.query(
-        Redemption.venue_id,
-        func.count(Redemption.id).label('total_redemptions')
-    ).filter(
-        Redemption.status == RedemptionStatus.REDEEMED
-    ).group_by(Redemption.venue_id).all()
-    
-    # Get active bottles in one query
-    bottle_data = db.query(
-        Bottle.venue_id,
-        func.count(Bottle.id).label('active_bottles')
-    ).filter(
-        Bottle.is_available == True
-    ).group_by(Bottle.venue_id).all()
-    
-    # Create lookup dictionaries
-    purchase_lookup = {p.venue_id: p for p in purchase_data}
-    redemption_lookup = {r.venue_id: r for r in redemption_data}
-    bottle_lookup = {b.venue_id: b for b in bottle_data}
-    
-    # Calculate metrics for each venue
-    venue_metrics = []
-    for venue in venues:
-        p_data = purchase_lookup.get(venue.id)
-        r_data = redemption_lookup.get(venue.id)
-        b_data = bottle_lookup.get(venue.id)
-        
-        total_revenue = float(p_data.total_revenue) if p_data and p_data.total_revenue else 0
-        total_bottles_sold = p_data.total_bottles_sold if p_data else 0
-        total_customers = p_data.total_customers if p_data else 0
-        total_redemptions = r_data.total_redemptions if r_data else 0
-        active_bottles = b_data.active_bottles if b_data else 0
-        
-        # Average order value
-        average_order_value = total_revenue / total_bottles_sold if total_bottles_sold > 0 else 0
-        
-        # Redemption rate
-        redemption_rate = (total_redemptions / total_bottles_sold * 100) if total_bottles_sold > 0 else 0.0
-        
-        venue_metrics.append({
-            'venue_id': venue.id,
-            'venue_name': venue.name,
-            'total_revenue': total_revenue,
-            'total_bottles_sold': total_bottles_sold,
-            'total_redemptions': total_redemptions,
-            'active_bottles': active_bottles,
-            'total_customers': total_customers,
-            'average_order_value': average_order_value,
-            'redemption_rate': redemption_rate
-        })
-    
-    # Sort by revenue and assign ranks
-    venue_metrics_sorted_revenue = sorted(venue_metrics, key=lambda x: x['total_revenue'], reverse=True)
-    for idx, vm in enumerate(venue_metrics_sorted_revenue):
-        vm['revenue_rank'] = idx + 1
-    
-    # Sort by sales and assign ranks
-    venue_metrics_sorted_sales = sorted(venue_metrics, key=lambda x: x['total_bottles_sold'], reverse=True)
-    for idx, vm in enumerate(venue_metrics_sorted_sales):
-        for vm2 in venue_metrics:
-            if vm2['venue_id'] == vm['venue_id']:
-                vm2['sales_rank'] = idx + 1
-                break
+    # Metrics and ranks for every venue in one windowed query. Aggregates are
+    # all-time unless a date range was passed explicitly.
+    venue_metrics = get_venue_rankings(
+        db,
+        start if start_date else None,
+        end if end_date else None
+    )
+    total_venues = len(venue_metrics)
     
     # Build response
     venues_list = [
@@ -1716,29 +2111,8 @@ def get_venue_detailed_analytics(
         for b in top_bottles_data
     ]
     
-    # Calculate rankings - OPTIMIZED with single queries
-    all_venues = db.query(Venue).all()
-    total_venues = len(all_venues)
-    
-    # Revenue ranking - single query
-    venue_revenues = db.query(
-        Purchase.venue_id,
-        func.sum(Purchase.purchase_price).label('revenue')
-    ).filter(
-        Purchase.payment_status == PaymentStatus.CONFIRMED
-    ).group_by(Purchase.venue_id).order_by(func.sum(Purchase.purchase_price).desc()).all()
-    
-    revenue_rank = next((idx + 1 for idx, vr in enumerate(venue_revenues) if vr.venue_id == venue_id), total_venues)
-    
-    # Sales ranking - single query
-    venue_sales = db.query(
-        Purchase.venue_id,
-        func.count(Purchase.id).label('sales')
-    ).filter(
-        Purchase.payment_status == PaymentStatus.CONFIRMED
-    ).group_by(Purchase.venue_id).order_by(func.count(Purchase.id).desc()).all()
-    
-    sales_rank = next((idx + 1 for idx, vs in enumerate(venue_sales) if vs.venue_id == venue_id), total_venues)
+    # Rankings (all time, like the totals above) from the shared windowed query
+    revenue_rank, sales_rank, total_venues = get_venue_rank(db, venue_id)
     
     return VenueDetailedAnalytics(
         venue_id=venue.id,
@@ -1911,6 +2285,7 @@ def create_promotion(
     db.add(db_promotion)
     db.commit()
     db.refresh(db_promotion)
+    promotion_index.invalidate()
     
     venue_name = None
     if db_promotion.venue_id:
@@ -1984,6 +2359,7 @@ def update_promotion(
     
     db.commit()
     db.refresh(promo)
+    promotion_index.invalidate()
     
     venue_name = None
     if promo.venue_id:
@@ -2024,6 +2400,7 @@ def delete_promotion(promotion_id: str, db: Session = Depends(get_db)):
     
     db.delete(promo)
     db.commit()
+    promotion_index.invalidate()
     return {"message": "Promotion deleted successfully"}
 
 
@@ -2033,117 +2410,108 @@ def validate_promotion(
     db: Session = Depends(get_db)
 ):
     """Validate a promotion code"""
-    from models import Promotion, PromotionStatus, PromotionType, Purchase, PaymentStatus
     from schemas import PromotionValidation, PromotionValidationResponse, PromotionResponse
     
-    # Find promotion by code
-    promo = db.query(Promotion).filter(Promotion.code == validation.code.upper()).first()
+    # Find promotion by code (served from the in-memory index)
+    rule = promotion_index.get(db, validation.code)
     
-    if not promo:
+    if not rule:
         return PromotionValidationResponse(
             valid=False,
             message="Invalid promotion code"
         )
     
-    # Check status
-    if promo.status != PromotionStatus.ACTIVE:
+    # Check status, dates, venue, minimum amount and total usage limit
+    message = rule.check(validation.purchase_amount, validation.venue_id, datetime.now())
+    if message:
         return PromotionValidationResponse(
             valid=False,
-            message="Promotion is not active"
-        )
-    
-    # Check dates
-    now = datetime.now()
-    if now < promo.valid_from:
-        return PromotionValidationResponse(
-            valid=False,
-            message="Promotion has not started yet"
-        )
-    if now > promo.valid_until:
-        return PromotionValidationResponse(
-            valid=False,
-            message="Promotion has expired"
-        )
-    
-    # Check venue
-    if promo.venue_id and promo.venue_id != validation.venue_id:
-        return PromotionValidationResponse(
-            valid=False,
-            message="Promotion not valid for this venue"
-        )
-    
-    # Check minimum purchase amount
-    if promo.min_purchase_amount and validation.purchase_amount < promo.min_purchase_amount:
-        return PromotionValidationResponse(
-            valid=False,
-            message=f"Minimum purchase amount is ₹{promo.min_purchase_amount}"
-        )
-    
-    # Check usage limit
-    if promo.usage_limit and promo.usage_count >= promo.usage_limit:
-        return PromotionValidationResponse(
-            valid=False,
-            message="Promotion usage limit reached"
+            message=message
         )
     
     # Check per-user limit
-    if promo.per_user_limit:
-        user_usage = db.query(func.count(Purchase.id)).filter(
-            Purchase.user_id == validation.user_id,
-            Purchase.promotion_code == promo.code,
-            Purchase.payment_status == PaymentStatus.CONFIRMED
-        ).scalar() or 0
+    if rule.per_user_limit:
+        user_usage = get_user_usage(db, rule.id, validation.user_id)
         
-        if user_usage >= promo.per_user_limit:
+        if user_usage >= rule.per_user_limit:
             return PromotionValidationResponse(
                 valid=False,
                 message="You have reached the usage limit for this promotion"
             )
     
-    # Calculate discount
-    discount_amount = 0
-    if promo.type == PromotionType.PERCENTAGE:
-        discount_amount = (validation.purchase_amount * promo.value) / 100
-        if promo.max_discount_amount:
-            discount_amount = min(discount_amount, promo.max_discount_amount)
-    elif promo.type == PromotionType.FIXED_AMOUNT:
-        discount_amount = min(promo.value, validation.purchase_amount)
-    
-    venue_name = None
-    if promo.venue_id:
-        venue = db.query(Venue).filter(Venue.id == promo.venue_id).first()
-        if venue:
-            venue_name = venue.name
-    
     return PromotionValidationResponse(
         valid=True,
         message="Promotion code is valid",
         promotion=PromotionResponse(
-            id=promo.id,
-            code=promo.code,
-            name=promo.name,
-            description=promo.description,
-            type=promo.type.value,
-            value=promo.value,
-            min_purchase_amount=promo.min_purchase_amount,
-            max_discount_amount=promo.max_discount_amount,
-            usage_limit=promo.usage_limit,
-            usage_count=promo.usage_count,
-            per_user_limit=promo.per_user_limit,
-            venue_id=promo.venue_id,
-            venue_name=venue_name,
-            valid_from=promo.valid_from,
-            valid_until=promo.valid_until,
-            status=promo.status.value,
-            created_at=promo.created_at,
-            updated_at=promo.updated_at
+            id=rule.id,
+            code=rule.code,
+            name=rule.name,
+            description=rule.description,
+            type=rule.type.value,
+            value=rule.value,
+            min_purchase_amount=rule.min_purchase_amount,
+            max_discount_amount=rule.max_discount_amount,
+            usage_limit=rule.usage_limit,
+            usage_count=rule.usage_count,
+            per_user_limit=rule.per_user_limit,
+            venue_id=rule.venue_id,
+            venue_name=rule.venue_name,
+            valid_from=rule.valid_from,
+            valid_until=rule.valid_until,
+            status=rule.status.value,
+            created_at=rule.created_at,
+            updated_at=rule.updated_at
         ),
-        discount_amount=discount_amount
+        discount_amount=rule.discount_for(validation.purchase_amount)
     )
 
 
 # ============ Support Ticket Management Endpoints ============
 
+def _ticket_rows_query(db: Session):
+    """
+    Tickets joined with reporter and assignee names in one query.
+    Rows are (SupportTicket, user_name, user_email, assigned_to_name).
+    """
+    from models import SupportTicket
+    
+    reporter = aliased(User)
+    assignee = aliased(User)
+    return db.query(
+        SupportTicket,
+        reporter.name,
+        reporter.email,
+        assignee.name,
+    ).outerjoin(
+        reporter, SupportTicket.user_id == reporter.id
+    ).outerjoin(
+        assignee, SupportTicket.assigned_to_id == assignee.id
+    )
+
+
+def _ticket_response_fields(ticket, user_name, user_email, assigned_to_name) -> dict:
+    return dict(
+        id=ticket.id,
+        ticket_number=ticket.ticket_number,
+        user_id=ticket.user_id,
+        user_name=user_name or "Unknown",
+        user_email=user_email,
+        subject=ticket.subject,
+        description=ticket.description,
+        category=ticket.category.value,
+        priority=ticket.priority.value,
+        status=ticket.status.value,
+        assigned_to_id=ticket.assigned_to_id,
+        assigned_to_name=assigned_to_name,
+        resolved_at=ticket.resolved_at,
+        closed_at=ticket.closed_at,
+        created_at=ticket.created_at,
+        updated_at=ticket.updated_at,
+        comments_count=ticket.comments_count,
+        last_activity_at=ticket.last_activity_at
+    )
+
+
 @router.get("/tickets", response_model=SupportTicketList)
 def get_support_tickets(
     status: Optional[str] = None,
@@ -2155,81 +2523,48 @@ def get_support_tickets(
     db: Session = Depends(get_db)
 ):
     """List all support tickets with filters"""
-    from models import SupportTicket, TicketStatus, TicketCategory, TicketPriority, TicketComment
+    from models import SupportTicket, TicketStatus, TicketCategory, TicketPriority
     from schemas import SupportTicketList, SupportTicketResponse
     
-    query = db.query(SupportTicket)
+    filters = []
     
     # Apply filters
     if status:
         try:
             status_enum = TicketStatus(status)
-            query = query.filter(SupportTicket.status == status_enum)
+            filters.append(SupportTicket.status == status_enum)
         except ValueError:
             pass
     
     if category:
         try:
             category_enum = TicketCategory(category)
-            query = query.filter(SupportTicket.category == category_enum)
+            filters.append(SupportTicket.category == category_enum)
         except ValueError:
             pass
     
     if priority:
         try:
             priority_enum = TicketPriority(priority)
-            query = query.filter(SupportTicket.priority == priority_enum)
+            filters.append(SupportTicket.priority == priority_enum)
         except ValueError:
             pass
     
     if assigned_to_id:
         if assigned_to_id == "unassigned":
-            query = query.filter(SupportTicket.assigned_to_id == None)
+            filters.append(SupportTicket.assigned_to_id == None)
         else:
-            query = query.filter(SupportTicket.assigned_to_id == assigned_to_id)
+            filters.append(SupportTicket.assigned_to_id == assigned_to_id)
     
-    # Order by most recent first
-    query = query.order_by(SupportTicket.created_at.desc())
+    total = db.query(func.count(SupportTicket.id)).filter(*filters).scalar()
     
-    total = query.count()
-    tickets = query.offset(skip).limit(limit).all()
+    # Names come from the joins and comments_count is denormalized, so the
+    # page costs one query however many tickets it has
+    rows = _ticket_rows_query(db).filter(*filters).order_by(
+        SupportTicket.created_at.desc()
+    ).offset(skip).limit(limit).all()
     
-    # Transform to include user and assignee names
-    result = []
-    for ticket in tickets:
-        user_name = ticket.user.name if ticket.user else "Unknown"
-        user_email = ticket.user.email if ticket.user else None
-        
-        assigned_to_name = None
-        if ticket.assigned_to_id:
-            assignee = db.query(User).filter(User.id == ticket.assigned_to_id).first()
-            if assignee:
-                assigned_to_name = assignee.name
-        
-        # Count comments
-        comments_count = db.query(func.count(TicketComment.id)).filter(
-            TicketComment.ticket_id == ticket.id
-        ).scalar() or 0
-        
-        result.append(SupportTicketResponse(
-            id=ticket.id,
-            ticket_number=ticket.ticket_number,
-            user_id=ticket.user_id,
-            user_name=user_name,
-            user_email=user_email,
-            subject=ticket.subject,
-            description=ticket.description,
-            category=ticket.category.value,
-            priority=ticket.priority.value,
-            status=ticket.status.value,
-            assigned_to_id=ticket.assigned_to_id,
-            assigned_to_name=assigned_to_name,
-            resolved_at=ticket.resolved_at,
-            closed_at=ticket.closed_at,
-            created_at=ticket.created_at,
-            updated_at=ticket.updated_at,
-            comments_count=comments_count
-        ))
+    result = [SupportTicketResponse(**_ticket_response_fields(*row)) for row in rows]
     
     return SupportTicketList(tickets=result, total=total)
 
@@ -2240,57 +2575,33 @@ def get_support_ticket(ticket_id: str, db: Session = Depends(get_db)):
     from models import SupportTicket, TicketComment
     from schemas import SupportTicketDetailResponse, TicketCommentResponse
     
-    ticket = db.query(SupportTicket).filter(SupportTicket.id == ticket_id).first()
-    if not ticket:
+    row = _ticket_rows_query(db).filter(SupportTicket.id == ticket_id).first()
+    if not row:
         raise HTTPException(status_code=404, detail="Ticket not found")
     
-    user_name = ticket.user.name if ticket.user else "Unknown"
-    user_email = ticket.user.email if ticket.user else None
-    
-    assigned_to_name = None
-    if ticket.assigned_to_id:
-        assignee = db.query(User).filter(User.id == ticket.assigned_to_id).first()
-        if assignee:
-            assigned_to_name = assignee.name
-    
-    # Get comments
-    comments = db.query(TicketComment).filter(
+    # Get comments with their authors in one query
+    comments = db.query(TicketComment, User.name).outerjoin(
+        User, TicketComment.user_id == User.id
+    ).filter(
         TicketComment.ticket_id == ticket_id
     ).order_by(TicketComment.created_at.asc()).all()
     
-    comments_list = []
-    for comment in comments:
-        comment_user = db.query(User).filter(User.id == comment.user_id).first()
-        comments_list.append(TicketCommentResponse(
+    comments_list = [
+        TicketCommentResponse(
             id=comment.id,
             ticket_id=comment.ticket_id,
             user_id=comment.user_id,
-            user_name=comment_user.name if comment_user else "Unknown",
+            user_name=author_name or "Unknown",
             comment=comment.comment,
             is_internal=comment.is_internal,
             created_at=comment.created_at
-        ))
+        )
+        for comment, author_name in comments
+    ]
     
-    return SupportTicketDetailResponse(
-        id=ticket.id,
-        ticket_number=ticket.ticket_number,
-        user_id=ticket.user_id,
-        user_name=user_name,
-        user_email=user_email,
-        subject=ticket.subject,
-        description=ticket.description,
-        category=ticket.category.value,
-        priority=ticket.priority.value,
-        status=ticket.status.value,
-        assigned_to_id=ticket.assigned_to_id,
-        assigned_to_name=assigned_to_name,
-        resolved_at=ticket.resolved_at,
-        closed_at=ticket.closed_at,
-        created_at=ticket.created_at,
-        updated_at=ticket.updated_at,
-        comments_count=len(comments_list),
-        comments=comments_list
-    )
+    fields = _ticket_response_fields(*row)
+    fields["comments_count"] = len(comments_list)
+    return SupportTicketDetailResponse(**fields, comments=comments_list)
 
 
 @router.post("/tickets", response_model=SupportTicketResponse)
@@ -2302,24 +2613,18 @@ def create_support_ticket(
     """Create a new support ticket"""
     from models import SupportTicket, TicketCategory, TicketPriority, TicketStatus
     from schemas import SupportTicketCreate, SupportTicketResponse
-    import random
+    from sequences import next_ticket_number
     
-    # Generate unique ticket number
-    while True:
-        ticket_number = f"TKT-{random.randint(100000, 999999)}"
-        existing = db.query(SupportTicket).filter(SupportTicket.ticket_number == ticket_number).first()
-        if not existing:
-            break
-    
-    # Create ticket
+    # Create ticket (numbers come from a per-worker block of the ticket sequence)
     db_ticket = SupportTicket(
-        ticket_number=ticket_number,
+        ticket_number=next_ticket_number(),
         user_id=current_user.id,  # Admin creating on behalf of user
         subject=ticket.subject,
         description=ticket.description,
         category=TicketCategory(ticket.category),
         priority=TicketPriority(ticket.priority),
-        status=TicketStatus.OPEN
+        status=TicketStatus.OPEN,
+        last_activity_at=func.now()
     )
     
     db.add(db_ticket)
@@ -2343,7 +2648,8 @@ def create_support_ticket(
         closed_at=None,
         created_at=db_ticket.created_at,
         updated_at=db_ticket.updated_at,
-        comments_count=0
+        comments_count=0,
+        last_activity_at=db_ticket.last_activity_at
     )
 
 
@@ -2354,7 +2660,7 @@ def update_support_ticket(
     db: Session = Depends(get_db)
 ):
     """Update support ticket details"""
-    from models import SupportTicket, TicketCategory, TicketPriority, TicketStatus, TicketComment
+    from models import SupportTicket, TicketCategory, TicketPriority, TicketStatus
     from schemas import SupportTicketUpdate, SupportTicketResponse
     
     ticket = db.query(SupportTicket).filter(SupportTicket.id == ticket_id).first()
@@ -2391,40 +2697,9 @@ def update_support_ticket(
         setattr(ticket, key, value)
     
     db.commit()
-    db.refresh(ticket)
-    
-    user_name = ticket.user.name if ticket.user else "Unknown"
-    user_email = ticket.user.email if ticket.user else None
-    
-    assigned_to_name = None
-    if ticket.assigned_to_id:
-        assignee = db.query(User).filter(User.id == ticket.assigned_to_id).first()
-        if assignee:
-            assigned_to_name = assignee.name
-    
-    comments_count = db.query(func.count(TicketComment.id)).filter(
-        TicketComment.ticket_id == ticket.id
-    ).scalar() or 0
     
-    return SupportTicketResponse(
-        id=ticket.id,
-        ticket_number=ticket.ticket_number,
-        user_id=ticket.user_id,
-        user_name=user_name,
-        user_email=user_email,
-        subject=ticket.subject,
-        description=ticket.description,
-        category=ticket.category.value,
-        priority=ticket.priority.value,
-        status=ticket.status.value,
-        assigned_to_id=ticket.assigned_to_id,
-        assigned_to_name=assigned_to_name,
-        resolved_at=ticket.resolved_at,
-        closed_at=ticket.closed_at,
-        created_at=ticket.created_at,
-        updated_at=ticket.updated_at,
-        comments_count=comments_count
-    )
+    row = _ticket_rows_query(db).filter(SupportTicket.id == ticket.id).first()
+    return SupportTicketResponse(**_ticket_response_fields(*row))
 
 
 @router.delete("/tickets/{ticket_id}")
@@ -2466,6 +2741,17 @@ def add_ticket_comment(
     )
     
     db.add(db_comment)
+    
+    # Keep the denormalized counters in step, in the same transaction
+    db.query(SupportTicket).filter(SupportTicket.id == ticket_id).update(
+        {
+            SupportTicket.comments_count: SupportTicket.comments_count + 1,
+            SupportTicket.last_activity_at: func.now(),
+            SupportTicket.updated_at: SupportTicket.updated_at,  # A comment isn't a ticket edit
+        },
+        synchronize_session=False
+    )
+    
     db.commit()
     db.refresh(db_comment)
     
@@ -2482,55 +2768,97 @@ def add_ticket_comment(
 
 # ============ Audit Log Endpoints ============
 
+def _encode_audit_cursor(created_at: datetime, log_id: str) -> str:
+    raw = json.dumps([created_at.isoformat(), log_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_audit_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        created_at, log_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), log_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @router.get("/audit-logs", response_model=AuditLogList)
 def get_audit_logs(
     user_id: Optional[str] = None,
     action: Optional[str] = None,
     entity_type: Optional[str] = None,
+    entity_id: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    cursor: Optional[str] = None,
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=1000),
     db: Session = Depends(get_db)
 ):
-    """List all audit logs with filters"""
+    """
+    List audit logs with filters, newest first.
+    
+    Prefer cursor pagination: pass the returned ``next_cursor`` back as
+    ``cursor``. It seeks on (created_at, id) instead of counting and skipping
+    rows, so deep pages stay as fast as the first. ``skip`` still works and
+    the first page (no cursor) includes ``total``.
+    Entries older than AUDIT_LOG_RETENTION_MONTHS live in the gzip archives
+    written by archive_audit_logs.py.
+    """
     from models import AuditLog
     from schemas import AuditLogList, AuditLogResponse
     from datetime import datetime
     
-    query = db.query(AuditLog)
+    filters = []
     
     # Apply filters
     if user_id:
-        query = query.filter(AuditLog.user_id == user_id)
+        filters.append(AuditLog.user_id == user_id)
     
     if action:
-        query = query.filter(AuditLog.action == action)
+        filters.append(AuditLog.action == action)
     
     if entity_type:
-        query = query.filter(AuditLog.entity_type == entity_type)
+        filters.append(AuditLog.entity_type == entity_type)
+    
+    if entity_id:
+        filters.append(AuditLog.entity_id == entity_id)
     
     if start_date:
         try:
             start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-            query = query.filter(AuditLog.created_at >= start_dt)
+            filters.append(AuditLog.created_at >= start_dt)
         except ValueError:
             pass
     
     if end_date:
         try:
             end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
-            query = query.filter(AuditLog.created_at <= end_dt)
+            filters.append(AuditLog.created_at <= end_dt)
         except ValueError:
             pass
     
-    # Order by most recent first
-    query = query.order_by(AuditLog.created_at.desc())
+    # Order by most recent first (id breaks ties so the cursor is stable)
+    query = db.query(AuditLog).filter(*filters).order_by(AuditLog.created_at.desc(), AuditLog.id.desc())
     
-    total = query.count()
-    logs = query.offset(skip).limit(limit).all()
+    total = None
+    if cursor:
+        cursor_created_at, cursor_id = _decode_audit_cursor(cursor)
+        query = query.filter(
+            (AuditLog.created_at < cursor_created_at)
+            | ((AuditLog.created_at == cursor_created_at) & (AuditLog.id < cursor_id))
+        )
+    else:
+        total = db.query(func.count(AuditLog.id)).filter(*filters).scalar()
+        query = query.offset(skip)
+    
+    logs = query.limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(logs) > limit:
+        logs = logs[:limit]
+        next_cursor = _encode_audit_cursor(logs[-1].created_at, logs[-1].id)
     
-    return AuditLogList(logs=logs, total=total)
+    return AuditLogList(logs=logs, total=total, next_cursor=next_cursor)
 
 
 # Helper function to create audit log entries
@@ -2545,12 +2873,15 @@ def create_audit_log(
     ip_address: Optional[str] = None,
     user_agent: Optional[str] = None
 ):
-    """Create an audit log entry"""
-    from models import AuditLog
-    import uuid
+    """
+    Queue an audit log entry.
     
-    audit_log = AuditLog(
-        id=str(uuid.uuid4()),
+    The entry is written by the batched writer in audit_log.py, so this adds
+    no commit to the caller's request. ``db`` is kept for call-site compatibility.
+    """
+    from audit_log import enqueue_audit_log
+    
+    return enqueue_audit_log(
         user_id=user_id,
         user_name=user_name,
         action=action,
@@ -2560,11 +2891,6 @@ def create_audit_log(
         ip_address=ip_address,
         user_agent=user_agent
     )
-    
-    db.add(audit_log)
-    db.commit()
-    
-    return audit_log
 
 
 # ============ System Settings Endpoints ============
@@ -2572,39 +2898,30 @@ def create_audit_log(
 @router.get("/settings", response_model=SystemSettingsList)
 def get_system_settings(
     category: Optional[str] = None,
-    is_public: Optional[bool] = None,
-    db: Session = Depends(get_db)
+    is_public: Optional[bool] = None
 ):
-    """List all system settings with filters"""
-    from models import SystemSetting
-    from schemas import SystemSettingsList, SystemSettingResponse
-    
-    query = db.query(SystemSetting)
-    
-    # Apply filters
-    if category:
-        query = query.filter(SystemSetting.category == category)
-    
-    if is_public is not None:
-        query = query.filter(SystemSetting.is_public == is_public)
+    """List all system settings with filters (served from the in-memory settings map)"""
+    from schemas import SystemSettingsList
+    from settings_service import settings_service
+    
+    settings = [
+        entry for entry in settings_service.entries()
+        if (not category or entry.category == category)
+        and (is_public is None or entry.is_public == is_public)
+    ]
     
     # Order by category and key
-    query = query.order_by(SystemSetting.category, SystemSetting.setting_key)
+    settings.sort(key=lambda entry: (entry.category, entry.setting_key))
     
-    settings = query.all()
-    total = len(settings)
-    
-    return SystemSettingsList(settings=settings, total=total)
+    return SystemSettingsList(settings=settings, total=len(settings))
 
 
 @router.get("/settings/{setting_key}", response_model=SystemSettingResponse)
-def get_system_setting(setting_key: str, db: Session = Depends(get_db)):
+def get_system_setting(setting_key: str):
     """Get a specific system setting"""
-    from models import SystemSetting
+    from settings_service import settings_service
     
-    setting = db.query(SystemSetting).filter(
-        SystemSetting.setting_key == setting_key
-    ).first()
+    setting = settings_service.get_entry(setting_key)
     
     if not setting:
         raise HTTPException(status_code=404, detail="Setting not found")
@@ -2612,6 +2929,18 @@ def get_system_setting(setting_key: str, db: Session = Depends(get_db)):
     return setting
 
 
+def _validate_setting_value(setting_value: Optional[str], data_type: str):
+    """Reject values that don't parse as the setting's data_type"""
+    from settings_service import DATA_TYPES, parse_setting_value
+    
+    if data_type not in DATA_TYPES:
+        raise ValueError(f"data_type must be one of: {', '.join(DATA_TYPES)}")
+    try:
+        parse_setting_value(setting_value, data_type)
+    except ValueError:
+        raise ValueError(f"Value is not a valid {data_type}")
+
+
 @router.post("/settings", response_model=SystemSettingResponse)
 def create_system_setting(
     setting_data: SystemSettingCreate,
@@ -2619,26 +2948,33 @@ def create_system_setting(
 ):
     """Create a new system setting"""
     from models import SystemSetting
+    from settings_service import bump_settings_version, settings_service
     import uuid
     
     # Check if setting already exists
-    existing = db.query(SystemSetting).filter(
+    existing = db.query(SystemSetting.id).filter(
         SystemSetting.setting_key == setting_data.setting_key
     ).first()
     
     if existing:
         raise HTTPException(status_code=400, detail="Setting key already exists")
     
+    try:
+        _validate_setting_value(setting_data.setting_value, setting_data.data_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     setting = SystemSetting(
         id=str(uuid.uuid4()),
         **setting_data.dict()
     )
     
     db.add(setting)
+    bump_settings_version(db)
     db.commit()
-    db.refresh(setting)
+    settings_service.reload(db)
     
-    return setting
+    return settings_service.get_entry(setting_data.setting_key)
 
 
 @router.put("/settings/{setting_key}", response_model=SystemSettingResponse)
@@ -2649,6 +2985,7 @@ def update_system_setting(
 ):
     """Update a system setting"""
     from models import SystemSetting
+    from settings_service import bump_settings_version, settings_service
     
     setting = db.query(SystemSetting).filter(
         SystemSetting.setting_key == setting_key
@@ -2659,13 +2996,19 @@ def update_system_setting(
     
     # Update fields
     update_data = setting_data.dict(exclude_unset=True)
+    if "setting_value" in update_data:
+        try:
+            _validate_setting_value(update_data["setting_value"], setting.data_type)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     for field, value in update_data.items():
         setattr(setting, field, value)
     
+    bump_settings_version(db)
     db.commit()
-    db.refresh(setting)
+    settings_service.reload(db)
     
-    return setting
+    return settings_service.get_entry(setting_key)
 
 
 @router.post("/settings/bulk-update")
@@ -2673,33 +3016,43 @@ def bulk_update_settings(
     bulk_data: SystemSettingsBulkUpdate,
     db: Session = Depends(get_db)
 ):
-    """Bulk update multiple settings"""
+    """Bulk update multiple settings in one transaction"""
     from models import SystemSetting
+    from settings_service import bump_settings_version, settings_service
     
-    updated_count = 0
-    errors = []
-    
+    updates = {}
     for setting_update in bulk_data.settings:
-        try:
-            setting_key = setting_update.get("setting_key")
-            setting_value = setting_update.get("setting_value")
-            
-            if not setting_key:
-                continue
-            
-            setting = db.query(SystemSetting).filter(
-                SystemSetting.setting_key == setting_key
-            ).first()
-            
-            if setting:
-                setting.setting_value = setting_value
-                updated_count += 1
-            else:
+        setting_key = setting_update.get("setting_key")
+        if setting_key:
+            updates[setting_key] = setting_update.get("setting_value")
+    
+    errors = []
+    updated_count = 0
+    if updates:
+        # One query for every affected row
+        settings = db.query(SystemSetting).filter(
+            SystemSetting.setting_key.in_(list(updates))
+        ).all()
+        found = {setting.setting_key: setting for setting in settings}
+        
+        for setting_key, setting_value in updates.items():
+            setting = found.get(setting_key)
+            if not setting:
                 errors.append(f"Setting not found: {setting_key}")
-        except Exception as e:
-            errors.append(f"Error updating {setting_key}: {str(e)}")
+                continue
+            try:
+                _validate_setting_value(setting_value, setting.data_type)
+            except ValueError as e:
+                errors.append(f"Error updating {setting_key}: {str(e)}")
+                continue
+            setting.setting_value = setting_value
+            updated_count += 1
     
-    db.commit()
+    if updated_count:
+        # Single commit and a single version bump for the whole batch
+        bump_settings_version(db)
+        db.commit()
+        settings_service.reload(db)
     
     return {
         "updated": updated_count,
@@ -2712,6 +3065,7 @@ def bulk_update_settings(
 def delete_system_setting(setting_key: str, db: Session = Depends(get_db)):
     """Delete a system setting"""
     from models import SystemSetting
+    from settings_service import bump_settings_version, settings_service
     
     setting = db.query(SystemSetting).filter(
         SystemSetting.setting_key == setting_key
@@ -2721,7 +3075,35 @@ def delete_system_setting(setting_key: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Setting not found")
     
     db.delete(setting)
+    bump_settings_version(db)
     db.commit()
+    settings_service.reload(db)
     
     return {"message": "Setting deleted successfully"}
 
+
+
+# ============ System Diagnostics ============
+
+@router.get("/system/db-pool")
+def get_db_pool_status():
+    """Connection pool configuration, occupancy and checkout stats of the worker serving this request"""
+    import os
+    from config import settings
+    from database import engine
+    from metrics import pool_stats
+
+    pool = engine.pool
+    pool_size, max_overflow = settings.get_db_pool_limits()
+    return {
+        "pid": os.getpid(),
+        "workers": settings.get_web_workers(),
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "timeout_seconds": settings.DB_POOL_TIMEOUT,
+        "pre_ping": settings.DB_POOL_PRE_PING,
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        **pool_stats.snapshot(),
+    }
@@ -14,7 +14,7 @@ from schemas import (
 )
 from auth import (
     create_access_token, create_refresh_token, create_session, 
-    get_session_by_refresh_token, update_session_tokens, invalidate_session,
+    decode_refresh_token, rotate_refresh_token, invalidate_session, get_venue_name,
     invalidate_all_user_sessions, verify_google_token, create_otp, verify_otp,
     send_otp_sms, get_current_user, hash_password, verify_password,
     create_password_reset_token, verify_password_reset_token, 
@@ -104,7 +104,6 @@ def login(request_data: LoginRequest, request: Request, response: Response, db:
         create_session(
             db=db,
             user_id=user.id,
-            access_token=access_token,
             refresh_token=refresh_token
         )
         
@@ -112,12 +111,7 @@ def login(request_data: LoginRequest, request: Request, response: Response, db:
         set_auth_cookies(response, access_token, refresh_token)
         
         # Get venue name if venue_id exists
-        venue_name = None
-        if user.venue_id:
-            from models import Venue
-            venue = db.query(Venue).filter(Venue.id == user.venue_id).first()
-            if venue:
-                venue_name = venue.name
+        venue_name = get_venue_name(db, user.venue_id)
 
         user_response = UserResponse(
             id=user.id,
@@ -210,7 +204,6 @@ def signup(request_data: SignupRequest, request: Request, response: Response, db
     create_session(
         db=db,
         user_id=user.id,
-        access_token=access_token,
         refresh_token=refresh_token
     )
     
@@ -346,7 +339,6 @@ def verify_otp_endpoint(request_data: PhoneVerifyOTPRequest, request: Request, d
     create_session(
         db=db,
         user_id=user.id,
-        access_token=access_token,
         refresh_token=refresh_token
     )
     
@@ -372,12 +364,7 @@ def verify_otp_endpoint(request_data: PhoneVerifyOTPRequest, request: Request, d
 def get_current_user_profile(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """Get current user profile"""
     # Get venue name if venue_id exists
-    venue_name = None
-    if current_user.venue_id:
-        from models import Venue
-        venue = db.query(Venue).filter(Venue.id == current_user.venue_id).first()
-        if venue:
-            venue_name = venue.name
+    venue_name = get_venue_name(db, current_user.venue_id)
             
     # Create response manually to include venue_name
     return UserResponse(
@@ -397,24 +384,30 @@ def get_current_user_profile(current_user: User = Depends(get_current_user), db:
 @router.post("/refresh", response_model=TokenResponse)
 def refresh_access_token(request: RefreshTokenRequest, response: Response, db: Session = Depends(get_db)):
     """Refresh access token using refresh token"""
-    # Get session by refresh token
-    session = get_session_by_refresh_token(db, request.refresh_token)
-    
-    if not session:
+    user_id = decode_refresh_token(request.refresh_token)
+    if not user_id:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired refresh token"
         )
     
-    # Get user
-    user = db.query(User).filter(User.id == session.user_id).first()
+    # Get user (the new tokens carry their current role)
+    user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
         )
     
-    # Create new tokens
+    # Look up and rotate the session in one statement
+    new_refresh_token = rotate_refresh_token(db, request.refresh_token, user)
+    if not new_refresh_token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired refresh token"
+        )
+    
+    # Create new access token
     role_str = user.role.value if hasattr(user.role, 'value') else str(user.role)
     
     new_access_token = create_access_token(data={
@@ -423,24 +416,11 @@ def refresh_access_token(request: RefreshTokenRequest, response: Response, db: S
         "venue_id": user.venue_id
     })
     
-    new_refresh_token = create_refresh_token(data={
-        "sub": user.id,
-        "role": role_str
-    })
-    
-    # Update session with new tokens
-    update_session_tokens(db, session.id, new_access_token, new_refresh_token)
-    
     # Set new HttpOnly cookies
     set_auth_cookies(response, new_access_token, new_refresh_token)
     
     # Get venue name
-    venue_name = None
-    if user.venue_id:
-        from models import Venue
-        venue = db.query(Venue).filter(Venue.id == user.venue_id).first()
-        if venue:
-            venue_name = venue.name
+    venue_name = get_venue_name(db, user.venue_id)
     
     user_response = UserResponse(
         id=user.id,
@@ -453,6 +433,9 @@ def refresh_access_token(request: RefreshTokenRequest, response: Response, db: S
         created_at=user.created_at
     )
     
+    # Commit the rotation last: committing expires `user`, which would cost a reload
+    db.commit()
+    
     return TokenResponse(
         access_token=new_access_token,
         refresh_token=new_refresh_token,
@@ -3,8 +3,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func, or_
 from decimal import Decimal
 from typing import List, Optional
-import cloudinary
-import cloudinary.uploader
+import functools
 import os
 
 from database import get_db
@@ -14,13 +13,19 @@ from auth import get_current_user, get_current_active_bartender
 
 router = APIRouter(prefix="/api/profile", tags=["profile"])
 
-# Configure Cloudinary
-cloudinary.config(
-    cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
-    api_key=os.getenv("CLOUDINARY_API_KEY"),
-    api_secret=os.getenv("CLOUDINARY_API_SECRET"),
-    secure=True,
-)
+
+@functools.lru_cache(maxsize=None)
+def _cloudinary_uploader():
+    """Import and configure Cloudinary on the first avatar upload"""
+    import cloudinary
+    import cloudinary.uploader
+    cloudinary.config(
+        cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
+        api_key=os.getenv("CLOUDINARY_API_KEY"),
+        api_secret=os.getenv("CLOUDINARY_API_SECRET"),
+        secure=True,
+    )
+    return cloudinary.uploader
 
 
 @router.get("", response_model=ProfileResponse)
@@ -111,7 +116,7 @@ async def upload_avatar(
         raise HTTPException(status_code=400, detail="Image must be under 5MB")
 
     try:
-        result = cloudinary.uploader.upload(
+        result = _cloudinary_uploader().upload(
             contents,
             folder="storemybottle/avatars",
             public_id=f"user_{current_user.id}",
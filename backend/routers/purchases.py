@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, status
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 from typing import List, Optional
 
+from config import settings
 from database import get_db
 from models import User, Purchase, Bottle, Venue, PaymentStatus
 from schemas import (
@@ -11,6 +12,8 @@ from schemas import (
     UserBottleResponse, UserBottleList, PurchaseRequestResponse, ProcessPurchaseRequest
 )
 from auth import get_current_user, get_current_active_bartender, verify_purchase_ownership, verify_venue_access
+from promotion_index import claim_promotion_usage
+from idempotency import IDEMPOTENCY_HEADER, IdempotentRequest
 
 router = APIRouter(prefix="/api/purchases", tags=["purchases"])
 
@@ -18,10 +21,16 @@ router = APIRouter(prefix="/api/purchases", tags=["purchases"])
 @router.post("", response_model=PurchaseResponse)
 def create_purchase(
     request: PurchaseCreateRequest,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Create a new purchase (initiate payment)"""
+    """Create a new purchase (initiate payment). Retries with the same Idempotency-Key get the same purchase back."""
+    idem = IdempotentRequest(db, current_user.id, "purchases.create", idempotency_key, request.model_dump(mode="json"))
+    replayed = idem.replay()
+    if replayed:
+        return replayed
+    
     # Verify bottle exists and is available
     bottle = db.query(Bottle).filter(
         Bottle.id == request.bottle_id,
@@ -55,20 +64,28 @@ def create_purchase(
     )
     
     db.add(purchase)
-    db.commit()
-    db.refresh(purchase)
+    db.flush()
     
-    return purchase
+    return idem.commit(PurchaseResponse.model_validate(purchase))
 
 
 @router.post("/{purchase_id}/confirm", response_model=PurchaseResponse)
 def confirm_purchase(
     purchase_id: str,
     request: PurchaseConfirmRequest,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Confirm payment for a purchase"""
+    """Confirm payment for a purchase. Retries with the same Idempotency-Key replay the first confirmation."""
+    idem = IdempotentRequest(
+        db, current_user.id, "purchases.confirm", idempotency_key,
+        {"purchase_id": purchase_id, **request.model_dump(mode="json")}
+    )
+    replayed = idem.replay()
+    if replayed:
+        return replayed
+    
     # Get purchase with row lock
     purchase = db.query(Purchase).filter(
         Purchase.id == purchase_id,
@@ -82,25 +99,43 @@ def confirm_purchase(
         )
     
     if purchase.payment_status != PaymentStatus.PENDING:
+        # A retry that waited on the row lock: the first request may have just stored its response
+        db.rollback()
+        replayed = idem.replay()
+        if replayed:
+            return replayed
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Purchase already processed with status: {purchase.payment_status.value}"
         )
     
+    # Consume the applied promotion in the same transaction (usage limits are atomic)
+    if purchase.promotion_code:
+        claimed, message = claim_promotion_usage(db, purchase.promotion_code, purchase.user_id)
+        if not claimed:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=message
+            )
+    
     # Update purchase atomically
     purchase.payment_status = PaymentStatus.CONFIRMED
     purchase.payment_method = request.payment_method
     purchase.purchased_at = datetime.now(timezone.utc)
     purchase.expires_at = purchase.purchased_at + timedelta(days=30)
     
+    response = PurchaseResponse.model_validate(purchase)
     try:
-        db.commit()
+        response = idem.commit(response)
     except Exception as e:
         db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to confirm purchase: {str(e)}"
         )
+    if not isinstance(response, PurchaseResponse):
+        return response  # Replayed: a concurrent retry confirmed it first
     
     db.refresh(purchase)
     
@@ -131,7 +166,6 @@ def confirm_purchase(
     # Send purchase confirmation email (non-blocking)
     try:
         from email_service import send_purchase_confirmation_email
-        from datetime import timedelta
         user = db.query(User).filter(User.id == purchase.user_id).first()
         if user and user.email:
             bottle = db.query(Bottle).filter(Bottle.id == purchase.bottle_id).first()
@@ -155,7 +189,7 @@ def confirm_purchase(
     except Exception as e:
         print(f"Purchase confirmation email failed: {e}")
 
-    return purchase
+    return response
 
 
 @router.post("/{purchase_id}/cancel", response_model=PurchaseResponse)
@@ -258,15 +292,15 @@ def get_pending_purchases(
     
     Only returns purchases that are:
     - Still pending (not confirmed/failed)
-    - Created within the last 15 minutes
+    - Created within the pending window (PENDING_PURCHASE_TTL_MINUTES)
     """
-    # Calculate expiration time (15 minutes ago)
-    expiration_time = datetime.now(timezone.utc) - timedelta(minutes=15)
+    # Calculate expiration time (older requests are failed by expire_pending_purchases.py)
+    expiration_time = datetime.now(timezone.utc) - timedelta(minutes=settings.PENDING_PURCHASE_TTL_MINUTES)
     
     purchases = db.query(Purchase).filter(
         Purchase.user_id == current_user.id,
         Purchase.payment_status == PaymentStatus.PENDING,
-        Purchase.created_at >= expiration_time  # Only show purchases from last 15 minutes
+        Purchase.created_at >= expiration_time  # Only show purchases inside the pending window
     ).order_by(Purchase.created_at.desc()).all()
     
     return purchases
@@ -341,15 +375,15 @@ def get_pending_purchases_for_venue(
     
     Only returns purchases that are:
     - Still pending (not confirmed/failed)
-    - Created within the last 15 minutes
+    - Created within the pending window (PENDING_PURCHASE_TTL_MINUTES)
     """
-    # Calculate expiration time (15 minutes ago)
-    expiration_time = datetime.now(timezone.utc) - timedelta(minutes=15)
+    # Calculate expiration time (older requests are failed by expire_pending_purchases.py)
+    expiration_time = datetime.now(timezone.utc) - timedelta(minutes=settings.PENDING_PURCHASE_TTL_MINUTES)
 
     purchases = db.query(Purchase).filter(
         Purchase.venue_id == venue.id,
         Purchase.payment_status == PaymentStatus.PENDING,
-        Purchase.created_at >= expiration_time  # Only show purchases from last 15 minutes
+        Purchase.created_at >= expiration_time  # Only show purchases inside the pending window
     ).order_by(Purchase.created_at.desc()).all()
     
     response = []
@@ -395,6 +429,16 @@ def process_purchase(
         )
         
     if request.action == "confirm":
+        # Consume the applied promotion in the same transaction (usage limits are atomic)
+        if purchase.promotion_code:
+            claimed, message = claim_promotion_usage(db, purchase.promotion_code, purchase.user_id)
+            if not claimed:
+                db.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=message
+                )
+        
         # Confirm payment
         purchase.payment_status = PaymentStatus.CONFIRMED
         # If payment method is not set, default to CASH (since bartender is confirming manually)
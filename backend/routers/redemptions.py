@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
+from sqlalchemy import func
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 import json
 
 from database import get_db
+from conditional import not_modified
 from models import User, Purchase, Redemption, RedemptionStatus, PaymentStatus, Venue
 from schemas import (
     RedemptionCreateRequest, RedemptionResponse, QRValidationRequest,
@@ -145,8 +147,7 @@ def validate_redemption_qr(
         expiry = expiry.replace(tzinfo=timezone.utc)
         
     if expiry < datetime.now(timezone.utc):
-        redemption.status = RedemptionStatus.EXPIRED
-        db.commit()
+        # Left pending; expire_qr_codes.py flips the status in bulk
         return QRValidationResponse(
             success=False,
             message="QR code has expired"
@@ -268,10 +269,20 @@ def validate_redemption_qr(
 
 @router.get("/history", response_model=RedemptionHistoryList)
 def get_redemption_history(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get user's redemption history"""
+    # Cheap version check first: unchanged history -> 304 without building the list
+    count, last_updated = db.query(
+        func.count(Redemption.id), func.max(Redemption.updated_at)
+    ).filter(Redemption.user_id == current_user.id).one()
+    cached = not_modified(request, response, current_user.id, count, last_updated)
+    if cached:
+        return cached
+
     redemptions = db.query(Redemption).filter(
         Redemption.user_id == current_user.id
     ).order_by(Redemption.created_at.desc()).all()
@@ -1,11 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from typing import List, Optional
 
 from database import get_db
+from conditional import not_modified
 from models import Venue, Bottle, Purchase, PaymentStatus, VenueRating
 from auth import get_current_user
+from sanitization import normalize_city
+from venue_search import search_condition
 from schemas import (
     VenueResponse, VenueList, BottleResponse, BottleList, VenueStatsResponse,
     VenueRateRequest
@@ -42,20 +45,43 @@ def get_venues(
     limit: int = 20, 
     search: Optional[str] = None,
     city: Optional[str] = None,
+    min_lat: Optional[float] = Query(None, ge=-90, le=90),
+    max_lat: Optional[float] = Query(None, ge=-90, le=90),
+    min_lng: Optional[float] = Query(None, ge=-180, le=180),
+    max_lng: Optional[float] = Query(None, ge=-180, le=180),
     db: Session = Depends(get_db)
 ):
-    """Get list of venues with optional city filtering"""
-    query = db.query(Venue)
+    """Get list of venues with optional full-text search, city and bounding-box filtering"""
+    # The total rides along as a window count, so the page and total are one query
+    query = db.query(Venue, func.count().over().label("total"))
     
     if search:
-        query = query.filter(Venue.name.ilike(f"%{search}%"))
+        condition = search_condition(db.bind.dialect.name, search)
+        if condition is not None:
+            query = query.filter(condition)
     
     if city:
-        query = query.filter(Venue.location.ilike(f"%{city}%"))
+        query = query.filter(Venue.city == normalize_city(city))
+    
+    bbox = (min_lat, max_lat, min_lng, max_lng)
+    if any(v is not None for v in bbox):
+        if any(v is None for v in bbox) or min_lat > max_lat or min_lng > max_lng:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Bounding box needs min_lat <= max_lat and min_lng <= max_lng"
+            )
+        query = query.filter(
+            Venue.latitude.between(min_lat, max_lat),
+            Venue.longitude.between(min_lng, max_lng)
+        )
         
-    total = query.count()
-    venues = query.offset(skip).limit(limit).all()
-    enriched = _attach_ratings(venues, db)
+    rows = query.offset(skip).limit(limit).all()
+    if rows:
+        total = rows[0].total
+    else:
+        # Past the last page there is no row to carry the count
+        total = query.with_entities(func.count(Venue.id)).scalar() if skip else 0
+    enriched = _attach_ratings([row.Venue for row in rows], db)
     
     return VenueList(venues=enriched, total=total)
 
@@ -76,6 +102,8 @@ def get_venue(venue_id: str, db: Session = Depends(get_db)):
 @router.get("/{venue_id}/bottles", response_model=BottleList)
 def get_venue_bottles(
     venue_id: str, 
+    request: Request,
+    response: Response,
     skip: int = 0, 
     limit: int = 50,
     category: Optional[str] = None,
@@ -89,6 +117,14 @@ def get_venue_bottles(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Venue not found"
         )
+
+    # Menu version: any bottle insert/update/delete at this venue changes it
+    count, last_updated = db.query(
+        func.count(Bottle.id), func.max(Bottle.updated_at)
+    ).filter(Bottle.venue_id == venue_id).one()
+    cached = not_modified(request, response, count, last_updated, private=False)
+    if cached:
+        return cached
         
     query = db.query(Bottle).filter(
         Bottle.venue_id == venue_id,
@@ -3,7 +3,7 @@ Input sanitization utilities to prevent XSS and injection attacks
 """
 import re
 import bleach
-from typing import Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 
 
 # Allowed HTML tags (empty list = strip all HTML)
@@ -13,6 +13,43 @@ ALLOWED_ATTRIBUTES = {}
 # Allowed protocols for links (if we ever allow HTML)
 ALLOWED_PROTOCOLS = ['http', 'https', 'mailto']
 
+# Printable ASCII without markup characters (<, >, &) plus tab/newline.
+# bleach.clean returns such text unchanged, so we can skip parsing it.
+PLAIN_TEXT_RE = re.compile(r'[\t\n\x20-\x25\x27-\x3b\x3d\x3f-\x7e]*\Z')
+
+# Per-field character filters, compiled once
+NAME_DISALLOWED_RE = re.compile(r'[^\w\s\-\.,&\'()]', re.UNICODE)
+EMAIL_DISALLOWED_RE = re.compile(r'[^\w\.\-\+@]')
+PHONE_DISALLOWED_RE = re.compile(r'[^\d\s\+\-\(\)]')
+ADDRESS_DISALLOWED_RE = re.compile(r'[^\w\s\-\.,#/()]', re.UNICODE)
+WHITESPACE_RE = re.compile(r'\s+')
+EXCESS_NEWLINES_RE = re.compile(r'\n{3,}')
+
+# Common SQL injection patterns (case-insensitive)
+SQL_INJECTION_PATTERNS = [
+    r"(\b(SELECT|INSERT|UPDATE|DELETE|DROP|CREATE|ALTER|EXEC|EXECUTE)\b)",
+    r"(--|#|/\*|\*/)",  # SQL comments
+    r"(\bOR\b.*=.*)",  # OR 1=1
+    r"(\bAND\b.*=.*)",  # AND 1=1
+    r"(;.*\b(SELECT|INSERT|UPDATE|DELETE)\b)",  # Multiple statements
+    r"(\bUNION\b.*\bSELECT\b)",  # UNION SELECT
+]
+
+# Common command injection patterns (case-sensitive)
+COMMAND_INJECTION_PATTERNS = [
+    r"[;&|`$]",  # Command separators and substitution
+    r"\$\(",  # Command substitution
+    r"\.\./",  # Path traversal
+    r"\\x[0-9a-fA-F]{2}",  # Hex encoding
+]
+
+SQL_INJECTION_RE = re.compile("|".join(SQL_INJECTION_PATTERNS), re.IGNORECASE)
+COMMAND_INJECTION_RE = re.compile("|".join(COMMAND_INJECTION_PATTERNS))
+# Both checks in one scan: SQL alternatives scoped case-insensitive, command ones exact
+INJECTION_RE = re.compile(
+    "(?i:" + "|".join(SQL_INJECTION_PATTERNS) + ")|" + "|".join(COMMAND_INJECTION_PATTERNS)
+)
+
 
 def sanitize_html(text: str) -> str:
     """
@@ -28,6 +65,10 @@ def sanitize_html(text: str) -> str:
     if not text:
         return text
     
+    # Fast path: nothing bleach would change
+    if PLAIN_TEXT_RE.match(text):
+        return text
+    
     # Strip all HTML tags
     cleaned = bleach.clean(
         text,
@@ -96,10 +137,10 @@ def sanitize_name(name: str) -> str:
     
     # Allow only safe characters: letters, numbers, spaces, and basic punctuation
     # This prevents SQL injection and command injection
-    name = re.sub(r'[^\w\s\-\.,&\'()]', '', name, flags=re.UNICODE)
+    name = NAME_DISALLOWED_RE.sub('', name)
     
     # Remove excessive whitespace
-    name = re.sub(r'\s+', ' ', name)
+    name = WHITESPACE_RE.sub(' ', name)
     
     return name.strip()
 
@@ -128,7 +169,7 @@ def sanitize_email(email: str) -> str:
     email = email.lower()
     
     # Remove any remaining invalid characters
-    email = re.sub(r'[^\w\.\-\+@]', '', email)
+    email = EMAIL_DISALLOWED_RE.sub('', email)
     
     return email
 
@@ -153,7 +194,7 @@ def sanitize_phone(phone: str) -> str:
     phone = sanitize_string(phone, max_length=20)
     
     # Allow only phone number characters
-    phone = re.sub(r'[^\d\s\+\-\(\)]', '', phone)
+    phone = PHONE_DISALLOWED_RE.sub('', phone)
     
     return phone.strip()
 
@@ -210,14 +251,42 @@ def sanitize_address(address: str) -> str:
     address = sanitize_string(address, max_length=500)
     
     # Allow address-friendly characters
-    address = re.sub(r'[^\w\s\-\.,#/()]', '', address, flags=re.UNICODE)
+    address = ADDRESS_DISALLOWED_RE.sub('', address)
     
     # Remove excessive whitespace
-    address = re.sub(r'\s+', ' ', address)
+    address = WHITESPACE_RE.sub(' ', address)
     
     return address.strip()
 
 
+def normalize_city(city: str) -> str:
+    """
+    Canonical form of a city name, used for the venues.city column and the
+    city filter so they can be compared with a plain (indexed) equality.
+    - Sanitized like an address, no commas
+    - Whitespace collapsed, title-cased ("  navi  MUMBAI " -> "Navi Mumbai")
+    - Max 100 characters
+    
+    Args:
+        city: City name
+        
+    Returns:
+        Normalized city name
+    """
+    if not city:
+        return city
+    
+    city = sanitize_address(city).replace(',', ' ')
+    return WHITESPACE_RE.sub(' ', city).strip().title()[:100]
+
+
+def city_from_location(location: str) -> Optional[str]:
+    """Normalized city from a venue location in the "Area, City" format"""
+    if not location:
+        return None
+    return normalize_city(location.rsplit(',', 1)[-1]) or None
+
+
 def sanitize_description(description: str, max_length: int = 2000) -> str:
     """
     Sanitize a description or long text field.
@@ -246,7 +315,7 @@ def sanitize_description(description: str, max_length: int = 2000) -> str:
     description = description.replace('\r\n', '\n').replace('\r', '\n')
     
     # Remove excessive newlines (more than 2 consecutive)
-    description = re.sub(r'\n{3,}', '\n\n', description)
+    description = EXCESS_NEWLINES_RE.sub('\n\n', description)
     
     # Trim whitespace from each line
     lines = [line.strip() for line in description.split('\n')]
@@ -273,22 +342,7 @@ def validate_no_sql_injection(text: str) -> bool:
     if not text:
         return True
     
-    # Common SQL injection patterns
-    sql_patterns = [
-        r"(\b(SELECT|INSERT|UPDATE|DELETE|DROP|CREATE|ALTER|EXEC|EXECUTE)\b)",
-        r"(--|#|/\*|\*/)",  # SQL comments
-        r"(\bOR\b.*=.*)",  # OR 1=1
-        r"(\bAND\b.*=.*)",  # AND 1=1
-        r"(;.*\b(SELECT|INSERT|UPDATE|DELETE)\b)",  # Multiple statements
-        r"(\bUNION\b.*\bSELECT\b)",  # UNION SELECT
-    ]
-    
-    text_upper = text.upper()
-    for pattern in sql_patterns:
-        if re.search(pattern, text_upper, re.IGNORECASE):
-            return False
-    
-    return True
+    return SQL_INJECTION_RE.search(text) is None
 
 
 def validate_no_command_injection(text: str) -> bool:
@@ -304,19 +358,7 @@ def validate_no_command_injection(text: str) -> bool:
     if not text:
         return True
     
-    # Common command injection patterns
-    command_patterns = [
-        r"[;&|`$]",  # Command separators and substitution
-        r"\$\(",  # Command substitution
-        r"\.\./",  # Path traversal
-        r"\\x[0-9a-fA-F]{2}",  # Hex encoding
-    ]
-    
-    for pattern in command_patterns:
-        if re.search(pattern, text):
-            return False
-    
-    return True
+    return COMMAND_INJECTION_RE.search(text) is None
 
 
 def sanitize_and_validate(
@@ -345,18 +387,10 @@ def sanitize_and_validate(
         return "", True, ""
     
     # Sanitize based on type
-    if field_type == "name":
-        sanitized = sanitize_name(text)
-    elif field_type == "email":
-        sanitized = sanitize_email(text)
-    elif field_type == "phone":
-        sanitized = sanitize_phone(text)
-    elif field_type == "url":
-        sanitized = sanitize_url(text)
-    elif field_type == "address":
-        sanitized = sanitize_address(text)
-    elif field_type == "description":
+    if field_type == "description":
         sanitized = sanitize_description(text, max_length or 2000)
+    elif field_type in FIELD_SANITIZERS:
+        sanitized = FIELD_SANITIZERS[field_type](text)
     else:
         sanitized = sanitize_string(text, max_length)
     
@@ -364,11 +398,47 @@ def sanitize_and_validate(
     if max_length and len(sanitized) > max_length:
         return sanitized[:max_length], False, f"Text exceeds maximum length of {max_length} characters"
     
-    # Check for injection attempts
-    if not validate_no_sql_injection(sanitized):
-        return "", False, "Invalid input detected"
-    
-    if not validate_no_command_injection(sanitized):
+    # Check for SQL and command injection attempts in a single scan
+    if INJECTION_RE.search(sanitized):
         return "", False, "Invalid input detected"
     
     return sanitized, True, ""
+
+
+FIELD_SANITIZERS = {
+    "name": sanitize_name,
+    "email": sanitize_email,
+    "phone": sanitize_phone,
+    "url": sanitize_url,
+    "address": sanitize_address,
+}
+
+
+def sanitize_and_validate_many(
+    texts: Iterable[str],
+    field_type: str = "string",
+    max_length: Optional[int] = None,
+    required: bool = False
+) -> List[Tuple[str, bool, str]]:
+    """
+    Batch version of sanitize_and_validate for bulk imports.
+    
+    Repeated values (brands, categories, cities in a catalog upload) are
+    only sanitized once per batch.
+    
+    Args:
+        texts: Input values to sanitize and validate
+        field_type: Type of field (string, name, email, phone, url, address, description)
+        max_length: Maximum allowed length
+        required: Whether field is required
+        
+    Returns:
+        list of (sanitized_text, is_valid, error_message), in input order
+    """
+    seen: Dict[str, Tuple[str, bool, str]] = {}
+    results = []
+    for text in texts:
+        if text not in seen:
+            seen[text] = sanitize_and_validate(text, field_type, max_length, required)
+        results.append(seen[text])
+    return results
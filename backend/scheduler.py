@@ -0,0 +1,37 @@
+"""
+In-process periodic jobs.
+
+Maintenance scripts normally run from cron (see crontab); deployments without
+cron can enable them per worker by giving them an interval > 0. The jobs are
+written to be safe when several workers run them at once.
+"""
+import threading
+from typing import Callable, Optional
+
+
+class PeriodicJob:
+    """Calls `func` every `interval_minutes` from a daemon thread (disabled when <= 0)"""
+
+    def __init__(self, name: str, interval_minutes: float, func: Callable[[], object]):
+        self.name = name
+        self.interval_minutes = interval_minutes
+        self.func = func
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.interval_minutes <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_minutes * 60):
+            try:
+                self.func()
+            except Exception as e:
+                print(f"⚠️  {self.name} failed: {e}")
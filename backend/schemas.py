@@ -1,9 +1,9 @@
-from pydantic import BaseModel, EmailStr, Field, field_serializer, field_validator
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field, field_serializer, field_validator, model_validator
+from typing import Any, Optional, List
 from datetime import datetime, timezone, date
 from decimal import Decimal
 from models import PaymentStatus, PaymentMethod, RedemptionStatus
-from sanitization import sanitize_name, sanitize_address, sanitize_email, sanitize_phone, sanitize_url
+from sanitization import sanitize_name, sanitize_address, sanitize_email, sanitize_phone, sanitize_url, normalize_city, city_from_location
 
 
 def ensure_timezone_aware(dt: Optional[datetime]) -> Optional[datetime]:
@@ -25,6 +25,9 @@ class VenueBase(BaseModel):
     contact_email: Optional[str] = None
     contact_phone: Optional[str] = None
     image_url: Optional[str] = None
+    city: Optional[str] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
 
 
 class VenueResponse(VenueBase):
@@ -76,6 +79,34 @@ class VenueCreate(VenueBase):
         if v:
             return sanitize_url(v)
         return v
+    
+    @model_validator(mode='after')
+    def normalize_city_field(self):
+        # The city filter matches venues.city exactly, so store the canonical form
+        self.city = normalize_city(self.city) if self.city else city_from_location(self.location)
+        if (self.latitude is None) != (self.longitude is None):
+            raise ValueError('latitude and longitude must be set together')
+        return self
+
+
+class VenueUpdate(VenueCreate):
+    """Partial update: apply with model_dump(exclude_unset=True) so unsent fields keep their values"""
+    name: Optional[str] = None
+    location: Optional[str] = None
+    is_open: Optional[bool] = None
+
+    @model_validator(mode='after')
+    def normalize_city_field(self):
+        # Only the fields sent are touched; the router derives city when location changes
+        for field in ('name', 'location', 'is_open'):
+            if field in self.model_fields_set and getattr(self, field) is None:
+                raise ValueError(f'{field} cannot be null')
+        if self.city:
+            self.city = normalize_city(self.city)
+        if ('latitude' in self.model_fields_set) != ('longitude' in self.model_fields_set) \
+                or (self.latitude is None) != (self.longitude is None):
+            raise ValueError('latitude and longitude must be set together')
+        return self
 
 
 class VenueList(BaseModel):
@@ -173,11 +204,65 @@ class BottleUpdate(BaseModel):
     stock_count: Optional[int] = None
     category: Optional[str] = None
     description: Optional[str] = None
-    
+
     class Config:
         populate_by_name = True
 
 
+class BottleBulkItem(BaseModel):
+    """Single row of a bulk bottle operation (JSON item or CSV row)"""
+    op: Optional[str] = Field(None, pattern="^(create|update|upsert|delete)$")  # Overrides request operation
+    id: Optional[str] = None
+    venue_id: Optional[str] = None
+    brand: Optional[str] = None
+    name: Optional[str] = None
+    price: Optional[Decimal] = None
+    volume_ml: Optional[int] = None
+    image_url: Optional[str] = None
+    is_available: Optional[bool] = None
+    stock_count: Optional[int] = None
+    category: Optional[str] = None
+    description: Optional[str] = None
+
+    @field_validator('brand', 'name')
+    @classmethod
+    def sanitize_text_fields(cls, v):
+        if v:
+            return sanitize_name(v)
+        return v
+
+    @field_validator('image_url')
+    @classmethod
+    def sanitize_image_url(cls, v):
+        if v:
+            return sanitize_url(v)
+        return v
+
+
+class BottleBulkRequest(BaseModel):
+    """Bulk create/update/upsert/delete of bottles"""
+    operation: str = Field("create", pattern="^(create|update|upsert|delete)$")
+    all_or_nothing: bool = False  # Reject the whole batch if any row fails
+    items: List[BottleBulkItem] = Field(..., max_length=5000)
+
+
+class BottleBulkRowResult(BaseModel):
+    """Per-row outcome of a bulk bottle operation"""
+    index: int
+    op: str
+    status: str  # created, updated, deleted, error, skipped
+    id: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BottleBulkResponse(BaseModel):
+    results: List[BottleBulkRowResult]
+    created: int
+    updated: int
+    deleted: int
+    failed: int
+
+
 # ============ Authentication Schemas ============
 
 class LoginRequest(BaseModel):
@@ -1023,6 +1108,7 @@ class SupportTicketResponse(SupportTicketBase):
     created_at: datetime
     updated_at: datetime
     comments_count: int = 0
+    last_activity_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
@@ -1058,7 +1144,8 @@ class AuditLogResponse(BaseModel):
 class AuditLogList(BaseModel):
     """Audit log list response"""
     logs: List[AuditLogResponse]
-    total: int
+    total: Optional[int] = None  # Omitted when paginating by cursor
+    next_cursor: Optional[str] = None  # Pass as ?cursor= to get the next page
 
 
 # ============ System Settings Schemas ============
@@ -1087,6 +1174,7 @@ class SystemSettingResponse(BaseModel):
     description: Optional[str]
     data_type: str
     is_public: bool
+    value: Any = None  # setting_value parsed according to data_type
     created_at: datetime
     updated_at: datetime
     
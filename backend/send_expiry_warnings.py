@@ -14,6 +14,7 @@ from database import SessionLocal
 from models import Purchase, PaymentStatus, PushSubscription
 from email_service import send_expiry_warning_email
 from config import settings
+from metrics import track_external
 
 
 def send_push_notification(endpoint: str, p256dh: str, auth: str, title: str, body: str, url: str = "/"):
@@ -21,12 +22,13 @@ def send_push_notification(endpoint: str, p256dh: str, auth: str, title: str, bo
     try:
         from pywebpush import webpush, WebPushException
         import json
-        webpush(
-            subscription_info={"endpoint": endpoint, "keys": {"p256dh": p256dh, "auth": auth}},
-            data=json.dumps({"title": title, "body": body, "url": url}),
-            vapid_private_key=settings.VAPID_PRIVATE_KEY,
-            vapid_claims={"sub": settings.VAPID_EMAIL},
-        )
+        with track_external("push"):
+            webpush(
+                subscription_info={"endpoint": endpoint, "keys": {"p256dh": p256dh, "auth": auth}},
+                data=json.dumps({"title": title, "body": body, "url": url}),
+                vapid_private_key=settings.VAPID_PRIVATE_KEY,
+                vapid_claims={"sub": settings.VAPID_EMAIL},
+            )
     except Exception as e:
         raise e
 
@@ -0,0 +1,70 @@
+"""
+Monotonic sequence allocator backed by the id_sequences table.
+
+Each worker reserves a block of values with one UPDATE (the row lock
+serializes workers) and hands them out from memory, so generating an
+identifier never needs a read-before-write uniqueness check. Values left in
+a block when a worker exits are skipped; sequences are unique, not gapless.
+"""
+import threading
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal
+from models import IdSequence
+
+
+class SequenceAllocator:
+    """Hands out unique, increasing integers for one named sequence"""
+
+    def __init__(self, name: str, start: int = 1, block_size: int = 20):
+        self.name = name
+        self.start = start
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def next_value(self) -> int:
+        with self._lock:
+            if self._next >= self._end:
+                self._next, self._end = self._reserve_block()
+            value = self._next
+            self._next += 1
+            return value
+
+    def _reserve_block(self):
+        """Claim [start, end) in its own short transaction."""
+        db = SessionLocal()
+        try:
+            # Two attempts: the second only happens if the row didn't exist yet
+            for _ in range(2):
+                reserved = db.execute(
+                    update(IdSequence)
+                    .where(IdSequence.name == self.name)
+                    .values(next_value=IdSequence.next_value + self.block_size)
+                ).rowcount
+                if reserved:
+                    end = db.query(IdSequence.next_value).filter(IdSequence.name == self.name).scalar()
+                    db.commit()
+                    return end - self.block_size, end
+                db.rollback()
+
+                # First use of this sequence: create the row (another worker may win the race)
+                try:
+                    db.add(IdSequence(name=self.name, next_value=self.start))
+                    db.commit()
+                except IntegrityError:
+                    db.rollback()
+            raise RuntimeError(f"Could not reserve values for sequence '{self.name}'")
+        finally:
+            db.close()
+
+
+# Legacy ticket numbers are random 6-digit values, so start above that range
+ticket_sequence = SequenceAllocator("support_ticket", start=1_000_000)
+
+
+def next_ticket_number() -> str:
+    return f"TKT-{ticket_sequence.next_value()}"
@@ -0,0 +1,179 @@
+"""
+Typed, cached system settings.
+
+All SystemSetting rows are loaded into an in-memory map of parsed values, so
+reads (feature toggles on hot paths included) never touch the database.
+Writers bump a version counter row in id_sequences inside the same
+transaction as the settings change; each worker polls that single row every
+SETTINGS_POLL_INTERVAL_SECONDS and reloads when it moves. The writing worker
+reloads immediately.
+"""
+import json
+import re
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from models import IdSequence, SystemSetting
+
+VERSION_COUNTER = "system_settings_version"
+DATA_TYPES = ("string", "text", "email", "number", "boolean", "json")
+TRUE_VALUES = ("true", "1", "yes", "on")
+FALSE_VALUES = ("false", "0", "no", "off", "")
+EMAIL_RE = re.compile(r"^[^\s@]+@[^\s@]+\.[^\s@]+$")  # Same check as the admin Settings page
+
+
+def parse_setting_value(raw: Optional[str], data_type: str) -> Any:
+    """
+    Convert a stored setting string to its typed value.
+    Raises ValueError if the string doesn't match the data type.
+    """
+    if raw is None:
+        return None
+    if data_type == "number":
+        number = float(raw)
+        return int(number) if number.is_integer() and "." not in raw and "e" not in raw.lower() else number
+    if data_type == "boolean":
+        lowered = raw.strip().lower()
+        if lowered in TRUE_VALUES:
+            return True
+        if lowered in FALSE_VALUES:
+            return False
+        raise ValueError(f"'{raw}' is not a boolean")
+    if data_type == "json":
+        return json.loads(raw)
+    if data_type == "email" and raw and not EMAIL_RE.match(raw):
+        raise ValueError(f"'{raw}' is not an email address")
+    return raw
+
+
+@dataclass(frozen=True)
+class SettingEntry:
+    """A cached setting row plus its parsed value"""
+    id: str
+    setting_key: str
+    setting_value: Optional[str]
+    category: str
+    description: Optional[str]
+    data_type: str
+    is_public: bool
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+    value: Any
+
+
+class SettingsService:
+    """In-memory settings map with cross-worker invalidation"""
+
+    def __init__(self, poll_interval: float):
+        self.poll_interval = poll_interval
+        self._entries: Optional[Dict[str, SettingEntry]] = None
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._poller: Optional[threading.Thread] = None
+
+    # ─── Reads (no DB access once loaded) ───────────────────────────────────
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self._snapshot().get(key)
+        return default if entry is None or entry.value is None else entry.value
+
+    def get_bool(self, key: str, default: bool = False) -> bool:
+        value = self.get(key)
+        return value if isinstance(value, bool) else default
+
+    def get_entry(self, key: str) -> Optional[SettingEntry]:
+        return self._snapshot().get(key)
+
+    def entries(self) -> List[SettingEntry]:
+        return list(self._snapshot().values())
+
+    def _snapshot(self) -> Dict[str, SettingEntry]:
+        entries = self._entries
+        if entries is None:
+            entries = self.reload()
+        return entries
+
+    # ─── Loading and invalidation ───────────────────────────────────────────
+
+    def start(self):
+        """Load settings and start the version poller (called on app startup)."""
+        self.reload()
+        if self._poller is None or not self._poller.is_alive():
+            self._stop.clear()
+            self._poller = threading.Thread(target=self._poll, name="settings-poller", daemon=True)
+            self._poller.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def reload(self, db: Optional[Session] = None) -> Dict[str, SettingEntry]:
+        own_session = db is None
+        db = db or SessionLocal()
+        try:
+            with self._lock:
+                version = _read_version(db)
+                entries = {}
+                for row in db.query(SystemSetting).all():
+                    try:
+                        value = parse_setting_value(row.setting_value, row.data_type)
+                    except ValueError:
+                        print(f"⚠️  Setting {row.setting_key} is not a valid {row.data_type}; serving raw value")
+                        value = row.setting_value
+                    entries[row.setting_key] = SettingEntry(
+                        id=row.id,
+                        setting_key=row.setting_key,
+                        setting_value=row.setting_value,
+                        category=row.category,
+                        description=row.description,
+                        data_type=row.data_type,
+                        is_public=row.is_public,
+                        created_at=row.created_at,
+                        updated_at=row.updated_at,
+                        value=value,
+                    )
+                self._entries = entries
+                self._version = version
+                return entries
+        finally:
+            if own_session:
+                db.close()
+
+    def _poll(self):
+        while not self._stop.wait(self.poll_interval):
+            db = SessionLocal()
+            try:
+                if _read_version(db) != self._version:
+                    self.reload(db)
+            except Exception as e:
+                print(f"⚠️  Settings version poll failed: {e}")
+            finally:
+                db.close()
+
+
+def _read_version(db: Session) -> int:
+    return db.query(IdSequence.next_value).filter(IdSequence.name == VERSION_COUNTER).scalar() or 0
+
+
+def bump_settings_version(db: Session):
+    """
+    Mark settings as changed. Call inside the transaction that modifies
+    SystemSetting rows so the bump commits (or rolls back) with them.
+    """
+    bumped = db.execute(
+        update(IdSequence)
+        .where(IdSequence.name == VERSION_COUNTER)
+        .values(next_value=IdSequence.next_value + 1)
+    ).rowcount
+    if not bumped:
+        db.add(IdSequence(name=VERSION_COUNTER, next_value=1))
+
+
+settings_service = SettingsService(poll_interval=settings.SETTINGS_POLL_INTERVAL_SECONDS)
@@ -1,19 +1,28 @@
 #!/bin/sh
-# Start uvicorn and supercronic, exit container if either dies
+# Start gunicorn and supercronic, exit container if either dies
 
 # Start supercronic in background
 supercronic /app/crontab &
 CRON_PID=$!
 
-# Start uvicorn in background
-uvicorn main:app --host 0.0.0.0 --port 8000 --workers 4 &
-UVICORN_PID=$!
+# Start gunicorn in background (workers, recycling and timeouts: gunicorn_conf.py)
+gunicorn -c gunicorn_conf.py main:app &
+WEB_PID=$!
+
+# On docker stop, let gunicorn drain its workers before the container exits
+shutdown() {
+    kill -TERM $WEB_PID $CRON_PID 2>/dev/null || true
+    wait $WEB_PID 2>/dev/null
+    exit 0
+}
+trap shutdown TERM INT
 
 # Wait for either process to exit (sh-compatible, no wait -n)
-while kill -0 $CRON_PID 2>/dev/null && kill -0 $UVICORN_PID 2>/dev/null; do
-    sleep 2
+while kill -0 $CRON_PID 2>/dev/null && kill -0 $WEB_PID 2>/dev/null; do
+    sleep 2 &
+    wait $!
 done
 
 # One of them died — kill the other and exit
-kill $CRON_PID $UVICORN_PID 2>/dev/null || true
+kill $CRON_PID $WEB_PID 2>/dev/null || true
 exit 1
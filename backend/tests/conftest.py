@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Settings are read at import time; tests never touch a real database or Redis
+os.environ.setdefault("DATABASE_URL", "sqlite:///./test.db")
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret-key-that-is-at-least-32-characters")
+os.environ.setdefault("ENVIRONMENT", "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
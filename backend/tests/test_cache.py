@@ -0,0 +1,119 @@
+"""
+Two-tier cache tests. Two Cache instances on one fakeredis server stand in for
+two API workers sharing Redis.
+"""
+import threading
+import time
+
+import fakeredis
+import pytest
+
+import cache as cache_module
+from cache import INVALIDATION_CHANNEL, KEY_PREFIX, Cache, cached_endpoint
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+def make_cache(server, **kwargs):
+    return Cache(redis_client=fakeredis.FakeRedis(server=server), **kwargs)
+
+
+def test_single_flight_across_workers(server):
+    workers = [make_cache(server), make_cache(server)]
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"total": 42}
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda c=workers[i % 2]: results.append(c.get_or_compute("k", compute)))
+        for i in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == [{"total": 42}] * 8
+
+
+def test_stale_value_served_while_refreshing(server):
+    c = make_cache(server, default_ttl=0.1, stale_ttl=10)
+    assert c.get_or_compute("k", lambda: 1) == 1
+    time.sleep(0.15)
+
+    release = threading.Event()
+
+    def slow_refresh():
+        release.wait(2)
+        return 2
+
+    start = time.monotonic()
+    assert c.get_or_compute("k", slow_refresh) == 1  # Stale, without waiting for the refresh
+    assert time.monotonic() - start < 0.1
+
+    release.set()
+    assert wait_until(lambda: c.get_or_compute("k", lambda: 3) == 2)
+
+
+def test_single_flight_locks_are_released(server):
+    c = make_cache(server)
+    for day in range(50):
+        assert c.get_or_compute(f"analytics:revenue:{day}", lambda: day) == day
+    assert c._key_locks == {}
+
+
+@pytest.mark.parametrize("raw", [b"not json", b'{"v": 1}', b"[1, 2]"])
+def test_unreadable_l2_value_is_a_miss(server, raw):
+    c = make_cache(server)
+    c.redis.set(KEY_PREFIX + "k", raw)
+
+    assert c.get_or_compute("k", lambda: 5) == 5
+    assert make_cache(server).get_or_compute("k", lambda: 6) == 5  # Overwritten with a valid entry
+
+
+def test_invalidate_clears_other_workers_l1(server):
+    a, b = make_cache(server), make_cache(server)
+    assert a.get_or_compute("analytics:revenue", lambda: 1) == 1
+    assert b.get_or_compute("analytics:revenue", lambda: 2) == 1  # Filled from L2
+    assert "analytics:revenue" in b._l1
+    assert wait_until(lambda: dict(b.redis.pubsub_numsub(INVALIDATION_CHANNEL)).get(INVALIDATION_CHANNEL.encode(), 0) >= 2)
+
+    a.invalidate("analytics:")
+
+    assert wait_until(lambda: "analytics:revenue" not in b._l1)
+    assert b.get_or_compute("analytics:revenue", lambda: 3) == 3
+
+
+def test_cached_endpoint_keys_on_query_params(server, monkeypatch):
+    c = make_cache(server)
+    monkeypatch.setattr(cache_module, "cache", c)
+    calls = []
+
+    @cached_endpoint("analytics:revenue")
+    def endpoint(days: int = 30, venue_id=None, db=None, current_user=None):
+        calls.append((days, venue_id))
+        return {"days": days, "venue_id": venue_id}
+
+    assert endpoint(days=7, venue_id="v1", db=object(), current_user=object()) == {"days": 7, "venue_id": "v1"}
+    assert endpoint(venue_id="v1", days=7, db=object(), current_user=object()) == {"days": 7, "venue_id": "v1"}
+    assert endpoint(days=30, venue_id="v1", db=object(), current_user=object()) == {"days": 30, "venue_id": "v1"}
+
+    assert calls == [(7, "v1"), (30, "v1")]
+    assert 'analytics:revenue:{"days": 7, "venue_id": "v1"}' in c._l1
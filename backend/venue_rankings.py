@@ -0,0 +1,104 @@
+"""
+Venue performance rankings.
+
+One query aggregates confirmed purchases, redemptions and active bottles per
+venue and ranks every venue by revenue and by bottles sold with RANK() OVER,
+so neither the comparison screen nor a single venue's analytics page has to
+rank in Python. Results go through the shared cache, keyed by the purchase
+date range (JSON round-trip: money comes back as decimal strings).
+"""
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from cache import cache
+from database import SessionLocal
+from models import Bottle, PaymentStatus, Purchase, Redemption, RedemptionStatus, Venue
+
+
+def _rankings_query(start: Optional[datetime], end: Optional[datetime]):
+    purchase_filters = [Purchase.payment_status == PaymentStatus.CONFIRMED]
+    redemption_filters = [Redemption.status == RedemptionStatus.REDEEMED]
+    if start:
+        purchase_filters.append(Purchase.purchased_at >= start)
+        redemption_filters.append(Redemption.redeemed_at >= start)
+    if end:
+        purchase_filters.append(Purchase.purchased_at <= end)
+        redemption_filters.append(Redemption.redeemed_at <= end)
+
+    purchases = select(
+        Purchase.venue_id,
+        func.sum(Purchase.purchase_price).label("revenue"),
+        func.count(Purchase.id).label("bottles_sold"),
+        func.count(func.distinct(Purchase.user_id)).label("customers"),
+    ).where(*purchase_filters).group_by(Purchase.venue_id).subquery()
+
+    redemptions = select(
+        Redemption.venue_id,
+        func.count(Redemption.id).label("redemptions"),
+    ).where(*redemption_filters).group_by(Redemption.venue_id).subquery()
+
+    bottles = select(
+        Bottle.venue_id,
+        func.count(Bottle.id).label("active_bottles"),
+    ).where(Bottle.is_available == True).group_by(Bottle.venue_id).subquery()
+
+    revenue = func.coalesce(purchases.c.revenue, 0)
+    bottles_sold = func.coalesce(purchases.c.bottles_sold, 0)
+    return select(
+        Venue.id.label("venue_id"),
+        Venue.name.label("venue_name"),
+        revenue.label("total_revenue"),
+        bottles_sold.label("total_bottles_sold"),
+        func.coalesce(redemptions.c.redemptions, 0).label("total_redemptions"),
+        func.coalesce(bottles.c.active_bottles, 0).label("active_bottles"),
+        func.coalesce(purchases.c.customers, 0).label("total_customers"),
+        func.rank().over(order_by=revenue.desc()).label("revenue_rank"),
+        func.rank().over(order_by=bottles_sold.desc()).label("sales_rank"),
+    ).select_from(Venue) \
+        .outerjoin(purchases, purchases.c.venue_id == Venue.id) \
+        .outerjoin(redemptions, redemptions.c.venue_id == Venue.id) \
+        .outerjoin(bottles, bottles.c.venue_id == Venue.id) \
+        .order_by(revenue.desc(), Venue.name)
+
+
+def _compute_rankings(db: Session, start: Optional[datetime], end: Optional[datetime]) -> List[dict]:
+    rankings = []
+    for row in db.execute(_rankings_query(start, end)):
+        metrics = dict(row._mapping)
+        sold = metrics["total_bottles_sold"]
+        metrics["average_order_value"] = metrics["total_revenue"] / sold if sold > 0 else 0
+        metrics["redemption_rate"] = (metrics["total_redemptions"] / sold * 100) if sold > 0 else 0.0
+        rankings.append(metrics)
+    return rankings
+
+
+def get_venue_rankings(db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[dict]:
+    """
+    Per-venue metrics and ranks, best revenue first.
+
+    start/end bound purchases and redemptions; None means all time.
+    """
+    def refresh():
+        own_db = SessionLocal()
+        try:
+            return _compute_rankings(own_db, start, end)
+        finally:
+            own_db.close()
+
+    return cache.get_or_compute(
+        f"analytics:venue_rankings:{start}:{end}",
+        lambda: _compute_rankings(db, start, end),
+        background_compute=refresh
+    )
+
+
+def get_venue_rank(db: Session, venue_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """(revenue_rank, sales_rank, total_venues) for one venue, from the shared rankings."""
+    rankings = get_venue_rankings(db, start, end)
+    row = next((r for r in rankings if r["venue_id"] == venue_id), None)
+    if row is None:
+        return len(rankings), len(rankings), len(rankings)
+    return row["revenue_rank"], row["sales_rank"], len(rankings)
@@ -0,0 +1,126 @@
+"""
+Full-text venue search.
+
+Venue name/location search goes through a full-text index instead of
+`ILIKE '%...%'`, which has to scan every venue: a FULLTEXT index on MySQL and
+an external-content FTS5 table kept in sync by triggers on SQLite (local
+development). Each word of the search must match the start of a word in the
+name or location, so "sky pun" finds "Skybar, Pune". Other databases fall back
+to ILIKE.
+
+The indexes are created by the column migrations in main.init_database, which
+also fills venues.city for venues created before the column existed.
+"""
+import re
+from typing import List
+
+from sqlalchemy import and_, or_, text
+from sqlalchemy.orm import Session
+
+from models import Venue
+from sanitization import city_from_location
+
+# InnoDB ignores words shorter than innodb_ft_min_token_size (default 3)
+MYSQL_MIN_TOKEN_SIZE = 3
+# ...and words on its default stopword list (INFORMATION_SCHEMA.INNODB_FT_DEFAULT_STOPWORD)
+MYSQL_STOPWORDS = frozenset((
+    "a", "about", "an", "are", "as", "at", "be", "by", "com", "de", "en", "for", "from", "how",
+    "i", "in", "is", "it", "la", "of", "on", "or", "that", "the", "this", "to", "was", "what",
+    "when", "where", "who", "will", "with", "und", "www",
+))
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+SQLITE_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS venues_fts USING fts5(
+        name, location, content='venues', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS venues_fts_ai AFTER INSERT ON venues BEGIN
+        INSERT INTO venues_fts(rowid, name, location) VALUES (new.rowid, new.name, new.location);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS venues_fts_ad AFTER DELETE ON venues BEGIN
+        INSERT INTO venues_fts(venues_fts, rowid, name, location) VALUES ('delete', old.rowid, old.name, old.location);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS venues_fts_au AFTER UPDATE OF name, location ON venues BEGIN
+        INSERT INTO venues_fts(venues_fts, rowid, name, location) VALUES ('delete', old.rowid, old.name, old.location);
+        INSERT INTO venues_fts(rowid, name, location) VALUES (new.rowid, new.name, new.location);
+    END""",
+    # Index venues that existed before the table did
+    "INSERT INTO venues_fts(venues_fts) VALUES ('rebuild')",
+]
+
+
+def search_index_ddl(dialect: str) -> List[str]:
+    """Statements creating the full-text index for this database dialect"""
+    if dialect == "mysql":
+        return ["CREATE FULLTEXT INDEX ft_venues_name_location ON venues (name, location)"]
+    if dialect == "sqlite":
+        return SQLITE_FTS_DDL
+    return []
+
+
+def backfill_venue_cities(db: Session, batch_size: int = 500) -> int:
+    """
+    Derive city from location for venues that have none, one committed batch
+    at a time, using the same normalization as the admin API.
+
+    Returns:
+        int: number of venues given a city
+    """
+    filled = 0
+    last_id = ""
+    while True:
+        # Keyset on id: venues whose location has no city stay NULL and are stepped over
+        rows = db.query(Venue.id, Venue.location).filter(
+            Venue.city.is_(None),
+            Venue.id > last_id
+        ).order_by(Venue.id).limit(batch_size).all()
+        if not rows:
+            break
+        for venue_id, location in rows:
+            city = city_from_location(location)
+            if city:
+                db.query(Venue).filter(Venue.id == venue_id, Venue.city.is_(None)).update(
+                    {"city": city}, synchronize_session=False
+                )
+                filled += 1
+        db.commit()
+        last_id = rows[-1][0]
+        if len(rows) < batch_size:
+            break
+    return filled
+
+
+def _ilike_condition(words: List[str]):
+    return and_(*[
+        or_(Venue.name.ilike(f"%{word}%"), Venue.location.ilike(f"%{word}%"))
+        for word in words
+    ])
+
+
+def search_condition(dialect: str, search: str):
+    """Filter matching venues whose name/location contain every word of `search` (None if it has no words)"""
+    words = WORD_RE.findall(search.lower())
+    if not words:
+        return None
+
+    if dialect == "mysql":
+        def is_indexed(word):
+            return len(word) >= MYSQL_MIN_TOKEN_SIZE and word not in MYSQL_STOPWORDS
+
+        indexed = [word for word in words if is_indexed(word)]
+        if not indexed:
+            return _ilike_condition(words)
+        condition = text(
+            "MATCH (venues.name, venues.location) AGAINST (:venue_search IN BOOLEAN MODE)"
+        ).bindparams(venue_search=" ".join(f"+{word}*" for word in indexed))
+        unindexed = [word for word in words if not is_indexed(word)]
+        # Short words and stopwords can't use the index, but only need checking on its matches
+        return and_(condition, _ilike_condition(unindexed)) if unindexed else condition
+
+    if dialect == "sqlite":
+        return text(
+            "venues.rowid IN (SELECT rowid FROM venues_fts WHERE venues_fts MATCH :venue_search)"
+        ).bindparams(venue_search=" ".join(f'"{word}"*' for word in words))
+
+    return _ilike_condition(words)